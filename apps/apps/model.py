@@ -1,8 +1,11 @@
 
 import stat
 import time
+import datetime
 
 from zoom import *
+from zoom import memberships
+from zoom.application import SETTINGS_ATTRIBUTES
 
 db = system.database
 
@@ -33,8 +36,15 @@ def last_modified(app):
     modified = tuple(time.localtime(file_stats[stat.ST_MTIME]))
     return how_long_ago(datetime.datetime(*modified[:7]))
 
+def app_values(app):
+    # settings attributes are looked up when asked for, not kept in __dict__
+    values = dict(app.__dict__)
+    for name in SETTINGS_ATTRIBUTES:
+        values[name] = getattr(app, name)
+    return values
+
 def get_app(name):
-    return App(manager.apps[name].__dict__)
+    return App(app_values(manager.apps[name]))
 
 def get_selectors(app):
     classes = []
@@ -64,6 +74,7 @@ class App(Entity):
 
         cmd = 'insert into dz_groups (type,name,descr) values (\'A\',%s,%s)'
         db(cmd, group_name, group_name + ' application group')
+        memberships.groups_changed(db)
 
         group_rec = db('select * from dz_groups where type="U" and name=%s', self.name)
         if group_rec:
@@ -75,10 +86,7 @@ class App(Entity):
         rec = db('select groupid from dz_groups where type="A" and name=%s', group_name)
         if rec:
             id = rec[0].GROUPID
-            db('delete from dz_groups where groupid=%s', id)
-            db('delete from dz_subgroups where subgroupid=%s', id)
-            db('delete from dz_members where groupid=%s', id)
-            db('delete from dz_groups where groupid=%s', id)
+            memberships.remove_group(db, id)
 
     def add_group(self, group):
         group_rec = db('select * from dz_groups where type="A" and name=%s', 'a_'+self.name)
@@ -87,7 +95,7 @@ class App(Entity):
             subgroup_rec = db('select groupid from dz_groups where type="U" and name=%s', group)
             if subgroup_rec:
                 subgroup_id = subgroup_rec[0].GROUPID
-                rec = db('insert into dz_subgroups (groupid,subgroupid) values (%s,%s)', group_id, subgroup_id)
+                memberships.add_subgroup(db, group_id, subgroup_id)
                 audit('grant', group, self.name)
             else:
                 error('unknown group %s' % group)
@@ -101,7 +109,7 @@ class App(Entity):
             subgroup_rec = db('select groupid from dz_groups where type="U" and name=%s', group)
             if subgroup_rec:
                 subgroup_id = subgroup_rec[0].GROUPID
-                rec = db('delete from dz_subgroups where groupid=%s and subgroupid=%s', group_id, subgroup_id)
+                memberships.remove_subgroup(db, group_id, subgroup_id)
                 audit('revoke', group, self.name)
             else:
                 error('unknown group %s' % group)
@@ -109,7 +117,7 @@ class App(Entity):
             error('unknown app %s' % self.name)
 
 
-apps = sorted([App(a.__dict__) for a in manager.apps.values()], key=lambda a: a.title)
+apps = sorted([App(app_values(a)) for a in manager.apps.values()], key=lambda a: a.title)
 installed_apps = [app for app in apps if app.installed]
 uninstalled_apps = [app for app in apps if not app.installed]
 user_apps = [app for app in apps if app.installed and 'a_'+app.name in user.groups]
@@ -121,7 +129,7 @@ def audit(action, subject1, subject2):
         action,
         subject1,
         subject2,
-        now)
+        datetime.datetime.now())
 
 def audit_log(group):
     d = db('select * from audit_log where subject2=%s order by timestamp desc limit 10',group)
@@ -5,6 +5,7 @@ import pickle
 
 from zoom import *
 from zoom.storage import Model
+from zoom.pagecache import invalidate
 
 class ContentPage(Model): pass
 
@@ -129,7 +130,7 @@ def load_page(page_name,create=0):
         return item.title,item.content,item.description,item.keywords
     else:
         if create:
-            doc = open('new.txt').read()
+            doc = open(os.path.join(os.path.split(__file__)[0], 'new.txt')).read()
         else:            
             doc = "<H1>Missing Page</H1>That page appears to be missing.<br>"
         return '<dz:site_name>',doc,'',''                                
@@ -141,12 +142,14 @@ def save_page(page_name,content,title,new_page_name,description,keywords):
     delete_page(new_name)
     item = ContentPage(page_name=new_name,title=title,content=content,description=description,keywords=keywords)
     item.put()
+    invalidate(app='content')
     return new_name    
 
 def delete_page(page_name):
     q = ContentPage.find(page_name=page_name)
     for item in q:
         item.delete()
+    invalidate(app='content')
     
 #===========================================================
 def list_images():
@@ -2,7 +2,7 @@
 from model import *
 from zoom.html import glyphicon
 
-INDEX_TEMPLATE = open('home.md').read()
+INDEX_TEMPLATE = open(os.path.join(os.path.split(__file__)[0], 'home.md')).read()
 INDEX_JS = """
     $(function(){
         $('#mymail').load('/flags/my_flags?icon=mail');
@@ -61,7 +61,7 @@ class MyView(View):
         return flag_list(icon, n)
 
     def show(self, name):
-        filename = '%s.md' % name
+        filename = os.path.join(os.path.split(__file__)[0], '%s.md' % name)
         if os.path.exists(filename):
             return page(markdown(open(filename).read()))
 
@@ -2,6 +2,7 @@
 from zoom import *
 import datetime
 from zoom.log import audit
+from zoom import memberships
 
 db = system.database
 
@@ -66,22 +67,12 @@ def audit_log(group):
 
 
 def get_group_apps(group):
-    def get_memberships(group, memberships, depth=0):
-        result = [group]
-        if depth < 100:
-            for g, s in memberships:
-                if group == s and g not in result:
-                    result += get_memberships(g, memberships, depth+1)
-        return result
-
-    sub_groups  = [(rec.GROUPID, rec.SUBGROUPID) for rec in db('SELECT subgroupid, groupid FROM dz_subgroups ORDER BY subgroupid')]
-    permissions = get_memberships(group, sub_groups)
+    graph = memberships.get_graph(db)
+    names = [graph.names[g] for g in graph.group_ids([group]) if g in graph.names]
 
     named_groups = []
-    for rec in db('SELECT groupid, name FROM dz_groups order by name'):
-        groupid = rec[0]
-        name    = rec[1].strip()
-        if groupid in permissions and name.startswith('a_'):
+    for name in sorted(names):
+        if name.startswith('a_'):
             if 'apps' in user.apps:
                 named_groups += ['<a href="/apps/%(a)s">%(a)s</a>' % dict(a=name[2:])]
             else:
@@ -93,16 +84,26 @@ def get_group_apps(group):
 class Group:
     def __init__(self,*a,**k):
         self.__dict__ = k
-        members = db("select * from dz_members")
-        subgroups = db("select * from dz_subgroups")
 
-        users = dict((i.userid,(i.userid,i.loginid)) for i in db('select userid,loginid from dz_users'))
-        groups = dict((i.groupid,(i.groupid,i.name)) for i in db('select groupid, name from dz_groups'))
-        apps = [i.groupid for i in db('select groupid, name from dz_groups') if i.name[:2]=='a_']
-        
-        self.members  = [users.get(i.userid,(i.userid,str(i.userid))) for i in members if i.groupid==self.id]
-        self.subgroups  = [groups.get(i.subgroupid,(i.subgroupid,'%s missing'%i.subgroupid)) for i in subgroups if i.groupid==self.id]
-        self.supergroups = [groups.get(i.groupid,(i.groupid,'%s missing'%i.groupid)) for i in subgroups if i.subgroupid==self.id and i.groupid not in apps]
+        members = db("""
+            select m.userid, u.loginid
+            from dz_members m left join dz_users u on u.userid=m.userid
+            where m.groupid=%s
+            """, self.id)
+        subgroups = db("""
+            select s.subgroupid, g.name
+            from dz_subgroups s left join dz_groups g on g.groupid=s.subgroupid
+            where s.groupid=%s
+            """, self.id)
+        supergroups = db("""
+            select s.groupid, g.name
+            from dz_subgroups s left join dz_groups g on g.groupid=s.groupid
+            where s.subgroupid=%s
+            """, self.id)
+
+        self.members  = [(i.userid, i.loginid or str(i.userid)) for i in members]
+        self.subgroups  = [(i.subgroupid, i.name or '%s missing'%i.subgroupid) for i in subgroups]
+        self.supergroups = [(i.groupid, i.name or '%s missing'%i.groupid) for i in supergroups if (i.name or '')[:2]!='a_']
         self.apps = get_group_apps(self.id)
 
     def __getitem__(self,name):
@@ -115,36 +116,36 @@ class Group:
         users = dict((i.loginid,i.userid) for i in db('select userid,loginid from dz_users'))
         if name in users:
             id = users[name]
-            db('insert into dz_members (userid,groupid) values (%s,%s)',id,self.id)
+            memberships.add_member(db, id, self.id)
             audit('add user',name,self.name)
         
     def remove_member(self,user_id):
         users = dict((i.userid,i.loginid) for i in db('select userid,loginid from dz_users'))
-        db('delete from dz_members where userid=%s and groupid=%s',user_id,self.id)
+        memberships.remove_member(db, user_id, self.id)
         audit('remove user',users[int(user_id)],self.name)
         
     def add_subgroup(self,name):
         groups = dict((i.name,i.groupid) for i in db('select name,groupid from dz_groups'))
         if name in groups:
             id = groups[name]
-            db('insert into dz_subgroups (groupid,subgroupid) values (%s,%s)',self.id,id)
+            memberships.add_subgroup(db, self.id, id)
             audit('add group',name,self.name)
         
     def remove_subgroup(self,subgroup_id):
         groups = dict((i.groupid,i.name) for i in db('select groupid, name from dz_groups'))
-        db('delete from dz_subgroups where groupid=%s and subgroupid=%s',self.id,subgroup_id)
+        memberships.remove_subgroup(db, self.id, subgroup_id)
         audit('remove group',groups[int(subgroup_id)],self.name)
         
     def add_supergroup(self,name):
         groups = dict((i.name,i.groupid) for i in db('select name,groupid from dz_groups'))
         if name in groups:
             id = groups[name]
-            db('insert into dz_subgroups (groupid,subgroupid) values (%s,%s)',id,self.id)
+            memberships.add_subgroup(db, id, self.id)
             audit('add membership',self.name,name)
         
     def remove_supergroup(self,supergroup_id):
         groups = dict((i.groupid,i.name) for i in db('select groupid, name from dz_groups'))
-        db('delete from dz_subgroups where groupid=%s and subgroupid=%s',supergroup_id,self.id)
+        memberships.remove_subgroup(db, supergroup_id, self.id)
         audit('remove membership',self.name,groups[int(supergroup_id)])
         
 class Groups:
@@ -185,10 +186,7 @@ class Groups:
     @classmethod
     def delete(self,id):
         name = db('select name from dz_groups where groupid=%s', id)[0]['NAME']
-        result = db('delete from dz_members where groupid=%s',id)
-        result = db('delete from dz_groups where groupid=%s',id)
-        result = db('delete from dz_subgroups where groupid=%s',id)
-        result = db('delete from dz_subgroups where subgroupid=%s',id)
+        memberships.remove_group(db, id)
         audit('delete group', name, '')
 
     @classmethod
@@ -197,6 +195,7 @@ class Groups:
         values['TYPE'] = 'U'
         table = db.table('dz_groups','GROUPID')
         table.update(values)
+        memberships.groups_changed(db)
     
     @classmethod
     def insert(cls,**keywords):
@@ -206,6 +205,7 @@ class Groups:
         values['NAME'] = values['NAME'].lower()
         table = db.table('dz_groups','GROUPID')
         id = table.insert(values)
+        memberships.groups_changed(db)
         audit('create group', values['NAME'], '')
         return id
     
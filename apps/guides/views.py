@@ -53,7 +53,7 @@ def guide(feature, side_panel, body):
     ))
 
 def load_document(name, args={}):
-    filename = 'docs/{}.md'.format(name)
+    filename = os.path.join(os.path.split(__file__)[0], 'docs', '{}.md'.format(name))
     feature, messages, body = '', '', ''
     if os.path.exists(filename):
         body = markdown(load(filename).format(**args))
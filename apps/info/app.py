@@ -9,6 +9,7 @@ system.app.menu = [
     ('top-users','Top Users','top-users'),
     ('addresses','Addresses','addresses'),
     ('database','Database','database'),
+    ('queries','Queries','queries'),
     ('environment','Environment','environment'),
     ('python','Python','python')]
     
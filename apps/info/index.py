@@ -1,5 +1,6 @@
 
 import os 
+import datetime
 from zoom import system, manager, page, markdown, data
 from zoom.helpers import *
 
@@ -14,8 +15,8 @@ def status_info():
         'roles............: %s' % user.roles,
         'apps.............: %s' % user.apps,
         'default..........: %s' % user.default_app,
-        'date.............: %s' % tools.today,
-        'now..............: %s' % tools.now,
+        'date.............: %s' % datetime.date.today(),
+        'now..............: %s' % datetime.datetime.now(),
         'route............: %s' % route,
         'data.............: %s' % data,
         'session..........: %s' % system.session,
@@ -0,0 +1,42 @@
+
+from zoom import *
+from zoom import sqlstats
+
+def ms(seconds):
+    return '%.1f' % (seconds * 1000)
+
+def view():
+
+    labels = ['Statement','Count','Total ms','Mean ms','P95 ms','Max ms']
+    items = [(
+        '<pre>%s</pre>' % websafe(i['fingerprint']),
+        i['count'],
+        ms(i['total']),
+        ms(i['mean']),
+        ms(i['p95']),
+        ms(i['max']),
+        ) for i in sqlstats.stats()[:100]]
+    statements = browse(items, labels=labels, title='Statements')
+
+    labels = ['When','Elapsed ms','Statement','Parameters']
+    items = [(
+        i['time'],
+        ms(i['elapsed']),
+        '<pre>%s</pre>' % websafe(i['statement']),
+        websafe(i['parameters']),
+        ) for i in reversed(sqlstats.slow_statements)]
+    slow = browse(items, labels=labels, title='Slow Statements')
+
+    labels = ['When','App','URI','Count','Total ms','Statement']
+    items = [(
+        i['time'],
+        i.get('app'),
+        websafe(i.get('uri')),
+        i['count'],
+        ms(i['total']),
+        '<pre>%s</pre>' % websafe(i['fingerprint']),
+        ) for i in reversed(sqlstats.flagged_requests)]
+    repeated = browse(items, labels=labels, title='Repeated Statements')
+
+    return page(statements + slow + repeated, title='Queries')
+
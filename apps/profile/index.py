@@ -47,7 +47,8 @@ class ProfileController(Controller):
 class ProfileView(View):
 
     def avatar(self):
-        photo = current_user().photo or open('no_photo.png','rb').read() 
+        pathname = os.path.join(os.path.split(__file__)[0], 'no_photo.png')
+        photo = current_user().photo or open(pathname,'rb').read()
         return PNGResponse(photo)
 
     def change_photo(self):
@@ -129,7 +129,8 @@ class profile3_Profile(storage.Model):
         return 'photo' in self.__dict__        
 
     def get_photo(self):
-        return open('no_photo.png','rb').read()
+        pathname = os.path.join(os.path.split(__file__)[0], 'no_photo.png')
+        return open(pathname,'rb').read()
             
 Profile = profile3_Profile
 
@@ -8,6 +8,7 @@ from zoom import *
 from zoom.user import User, add_user
 from zoom.fill import viewfill
 from zoom.auth import hash_password
+from zoom import memberships
 
 
 REGISTRATION_TIMEOUT = 3600 # one hour
@@ -182,6 +183,7 @@ def confirm_registration(token):
 
 
 def register_user(data):
+    now = datetime.datetime.now()
     user_rec = dict(
         FIRSTNAME=data.first_name,
         LASTNAME=data.last_name,
@@ -199,7 +201,7 @@ def register_user(data):
 
 
     # make sure new users don't accidentally get access
-    db('delete from dz_members where userid=%s', new_id)
+    memberships.remove_memberships(db, new_id)
 
     # add default group
     new_user = User(data.username)
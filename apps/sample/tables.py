@@ -1,5 +1,6 @@
 
 from faker import factory
+import os
 import json
 
 from zoom.browse import browse
@@ -13,7 +14,7 @@ class Model(object):
 
     name = 'Joe'
 
-    data = json.load(open('testdata.json'))
+    data = json.load(open(os.path.join(os.path.split(__file__)[0], 'testdata.json')))
 
     @property
     def as_json(self):
@@ -1,4 +1,6 @@
 
+import datetime
+
 from model import *
 
 class CollectionController(Controller):
@@ -148,14 +150,14 @@ class CollectionView(View):
             actions = delete_button + actions + password_button + edit_button + '<div style="clear:both"></div>'
             u = User(user['username'])
 
-            activity_data = db('select id, timestamp, route, status, address, elapsed, message from log where user=%s and timestamp>=%s order by timestamp desc limit 50', user.username, today-26*one_week)
+            activity_data = db('select id, timestamp, route, status, address, elapsed, message from log where user=%s and timestamp>=%s order by timestamp desc limit 50', user.username, datetime.date.today()-26*one_week)
             labels = 'id', 'When', 'Route', 'Status', 'Address', 'Elapsed', 'Message'
             activity = browse([(
                 link_to(a[0], abs_url_for('/info/system-log', a[0])),
                 '<span title="%s">%s</span>' % (a[1], how_long_ago(a[1])),
                 a[2],a[3],a[4],a[5],a[6][:40]) for a in activity_data], labels=labels)
 
-            auth_data = db('select * from audit_log where (subject1=%s or subject2=%s) and timestamp>=%s order by timestamp desc limit 20', user.username, user.username, today-26*one_week)
+            auth_data = db('select * from audit_log where (subject1=%s or subject2=%s) and timestamp>=%s order by timestamp desc limit 20', user.username, user.username, datetime.date.today()-26*one_week)
             labels = 'id', 'App', 'User', 'Activity', 'Subject1', 'Subject2', 'Timestamp'
             auth_activity = browse([(a[0],a[1],a[2],a[3],a[4],a[5],a[6]) for a in auth_data], labels=labels)
 
@@ -5,6 +5,7 @@ from zoom import *
 from zoom.user import activate_user, deactivate_user, add_user, get_username, User as ZoomUser
 from zoom.fill import viewfill
 from zoom.log import audit, logger
+from zoom import memberships
 
 db = system.database
 
@@ -110,7 +111,7 @@ class Users:
 
     @classmethod
     def delete(self,id):
-        result = db('delete from dz_members where userid=%s',id)
+        memberships.remove_memberships(db, id)
         result = db('delete from dz_users where userid=%s',id)
 
     @classmethod
@@ -143,7 +144,7 @@ class Users:
         users = db.table('dz_users','USERID')
         id = users.insert(values)
 
-        db('delete from dz_members where userid=%s', id) # make sure new users have no memberships
+        memberships.remove_memberships(db, id) # make sure new users have no memberships
         add_user(values['LOGINID'], 'users')
 
         new_user = ZoomUser(username)
@@ -0,0 +1,14 @@
+--
+-- Table structure for table `dz_effective_members`
+--
+-- The table is filled the first time it is used or by running
+--   zoom rebuild_memberships <instance> <site>
+--
+CREATE TABLE if not exists `dz_effective_members` (
+  `userid` int(11) NOT NULL,
+  `groupid` int(11) NOT NULL,
+  `via` int(11) NOT NULL,
+  PRIMARY KEY (`userid`,`groupid`,`via`),
+  KEY `effective_group` (`groupid`),
+  KEY `effective_via` (`via`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
@@ -0,0 +1,4 @@
+--
+-- Index used to delete expired sessions
+--
+alter table dz_sessions add key `expiry_key` (`expiry`);
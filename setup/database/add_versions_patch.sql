@@ -0,0 +1,8 @@
+--
+-- Table structure for table `dz_versions`
+--
+CREATE TABLE if not exists `dz_versions` (
+  `name` varchar(30) NOT NULL,
+  `version` int(11) NOT NULL default 0,
+  PRIMARY KEY (`name`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
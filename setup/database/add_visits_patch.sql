@@ -0,0 +1,12 @@
+--
+-- Table structure for table `dz_visits`
+--
+CREATE TABLE if not exists `dz_visits` (
+  `session` varchar(32) NOT NULL,
+  `subject` varchar(32) DEFAULT NULL,
+  `started` datetime NOT NULL,
+  `ended` datetime NOT NULL,
+  PRIMARY KEY (`session`),
+  KEY `visits_subject` (`subject`),
+  KEY `visits_started` (`started`)
+) ENGINE=MyISAM DEFAULT CHARSET=utf8;
@@ -136,10 +136,45 @@ CREATE TABLE if not exists `dz_sessions` (
   `expiry` int(11) NOT NULL default '0',
   `status` char(1) not null default 'D',
   `value` text NOT NULL,
-  PRIMARY KEY  (`sesskey`)
+  PRIMARY KEY  (`sesskey`),
+  KEY `expiry_key` (`expiry`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
 
 
+--
+-- Table structure for table `dz_visits`
+--
+CREATE TABLE if not exists `dz_visits` (
+  `session` varchar(32) NOT NULL,
+  `subject` varchar(32) DEFAULT NULL,
+  `started` datetime NOT NULL,
+  `ended` datetime NOT NULL,
+  PRIMARY KEY (`session`),
+  KEY `visits_subject` (`subject`),
+  KEY `visits_started` (`started`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for table `dz_versions`
+--
+CREATE TABLE if not exists `dz_versions` (
+  `name` varchar(30) NOT NULL,
+  `version` int(11) NOT NULL default 0,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+--
+-- Table structure for table `dz_effective_members`
+--
+CREATE TABLE if not exists `dz_effective_members` (
+  `userid` int(11) NOT NULL,
+  `groupid` int(11) NOT NULL,
+  `via` int(11) NOT NULL,
+  PRIMARY KEY (`userid`,`groupid`,`via`),
+  KEY `effective_group` (`groupid`),
+  KEY `effective_via` (`via`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
 --
 -- Table structure for table `dz_subgroups`
 --
@@ -9,10 +9,13 @@
 
 
 from os.path import join, split, abspath, exists
+import os
+import shutil
+import tempfile
 import unittest
 import logging
 
-from zoom.config import Config
+from zoom.config import Config, get_config
 
 
 class TestConfig(unittest.TestCase):
@@ -44,3 +47,46 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.site_path,
                          join(instance_root, 'web', 'sites', 'localhost'))
 
+
+
+class TestConfigCache(unittest.TestCase):
+    """test config caching"""
+
+    #pylint: disable=missing-docstring
+
+    def setUp(self):
+        self.instance = tempfile.mkdtemp()
+        os.makedirs(join(self.instance, 'sites', 'default'))
+        os.makedirs(join(self.instance, 'sites', 'localhost'))
+        self.write('dz.conf', '[sites]\npath=sites\n')
+        self.write('sites/default/site.ini', '[site]\nname=default\nowner=me\n')
+        self.write('sites/localhost/site.ini', '[site]\nname=local\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.instance)
+
+    def write(self, name, text):
+        pathname = join(self.instance, name)
+        with open(pathname, 'w') as f:
+            f.write(text)
+        # make sure the change is visible even on coarse grained filesystems
+        when = os.stat(pathname).st_mtime + 1
+        os.utime(pathname, (when, when))
+
+    def test_get(self):
+        config = get_config(self.instance, 'localhost')
+        self.assertEqual(config.get('site', 'name'), 'local')
+        self.assertEqual(config.get('site', 'owner'), 'me')
+        self.assertEqual(config.get('site', 'missing', 'x'), 'x')
+        self.assertRaises(Exception, config.get, 'site', 'missing')
+
+    def test_cached(self):
+        config = get_config(self.instance, 'localhost')
+        self.assertTrue(get_config(self.instance, 'localhost') is config)
+
+    def test_changed(self):
+        config = get_config(self.instance, 'localhost')
+        self.write('sites/localhost/site.ini', '[site]\nname=changed\n')
+        new_config = get_config(self.instance, 'localhost')
+        self.assertFalse(new_config is config)
+        self.assertEqual(new_config.get('site', 'name'), 'changed')
@@ -15,7 +15,7 @@
 import unittest
 import datetime
 
-from zoom.fill import fill as _fill, viewfill
+from zoom.fill import fill as _fill, viewfill, compiled
 
 today = datetime.datetime.today()
 
@@ -201,3 +201,38 @@ class TestFill(unittest.TestCase):
         t2 = tpl2 % filler('date')
         self.assertEqual(t1, t2)
 
+
+    def test_compiled_once(self):
+        tpl = 'foo <z:upper "x"> bar <Z:Date>'
+        compiled.clear()
+        t1 = _fill('<z:', '>', tpl, filler, 'foo.html')
+        self.assertEqual(len(compiled), 1)
+        t2 = _fill('<z:', '>', tpl, filler, 'foo.html')
+        self.assertEqual(len(compiled), 1)
+        self.assertEqual(t1, t2)
+        self.assertEqual(t1, 'foo X bar %s' % today)
+
+    def test_compiled_source_changed(self):
+        compiled.clear()
+        _fill('<z:', '>', 'foo <z:upper "x">', filler, 'foo.html')
+        t = _fill('<z:', '>', 'bar <z:upper "y">', filler, 'foo.html')
+        self.assertEqual(t, 'bar Y')
+        self.assertEqual(len(compiled), 1)
+
+    def test_not_compiled_without_source(self):
+        compiled.clear()
+        t = fill('foo <z:upper "x">', filler)
+        self.assertEqual(t, 'foo X')
+        self.assertEqual(len(compiled), 0)
+
+    def test_compiled_calls_callback(self):
+        counter = []
+        def count(tag):
+            counter.append(tag)
+            return len(counter)
+        self.assertEqual(viewfill('{{a}}-{{a}}', count), '1-2')
+        self.assertEqual(viewfill('{{a}}-{{a}}', count), '3-4')
+
+    def test_no_tags(self):
+        self.assertEqual(fill('foo bar', filler), u'foo bar')
+        self.assertEqual(fill('', filler), u'')
@@ -0,0 +1,105 @@
+"""
+    Test the log module
+
+    Copyright (c) 2005-2016 Dynamic Solutions Inc.
+    support@dynamic-solutions.com
+
+    This file is part of DataZoomer.
+
+"""
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# It's reasonable in this case.
+
+import unittest
+import datetime
+
+from zoom.log import LogWriter
+
+
+class TransactionalDatabase(object):
+    """a database connection that keeps only what is committed
+
+    Every statement fails if fail is set, or just the statements numbered
+    (from 1) in failures.
+    """
+
+    def __init__(self, fail=False, failures=()):
+        self.fail = fail
+        self.failures = failures
+        self.calls = 0
+        self.pending = []
+        self.committed = []
+        self.closes = 0
+
+    def __call__(self, command, *args):
+        self.calls += 1
+        if self.fail or self.calls in self.failures:
+            raise Exception('database unavailable')
+        self.pending.append((command, args))
+
+    def commit(self):
+        self.committed.extend(self.pending)
+        self.pending = []
+
+    def rollback(self):
+        self.pending = []
+
+    def close(self):
+        # uncommitted work is rolled back when the connection closes
+        self.pending = []
+        self.closes += 1
+
+
+def entry(n):
+    return ('app', 'route', 'C', 'user', '127.0.0.1', 'login', 'server',
+            datetime.datetime.now(), 0.1, 'message %s' % n)
+
+
+class TestLogWriter(unittest.TestCase):
+
+    def test_batches(self):
+        db = TransactionalDatabase()
+        writer = LogWriter(db, batch=2, interval=0.01)
+        for n in range(5):
+            self.assertTrue(writer.put(entry(n)))
+        writer.drain()
+        self.assertEqual([len(args) for _, args in db.committed], [20, 20, 10])
+        self.assertEqual(writer.stats()['written'], 5)
+        self.assertEqual(writer.stats()['batches'], 3)
+        self.assertEqual(writer.stats()['queued'], 0)
+        self.assertEqual(db.closes, 3)
+
+    def test_take_partial_batch(self):
+        writer = LogWriter(TransactionalDatabase(), batch=10, interval=0.01)
+        writer.put(entry(1))
+        writer.put(entry(2))
+        self.assertEqual(len(writer.take()), 2)
+        self.assertEqual(writer.take(), [])
+
+    def test_stop_writes_queued_entries(self):
+        db = TransactionalDatabase()
+        writer = LogWriter(db, batch=100, interval=0.01)
+        writer.start()
+        for n in range(3):
+            writer.put(entry(n))
+        writer.stop()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(sum(len(args) for _, args in db.committed), 30)
+        self.assertEqual(writer.stats()['written'], 3)
+
+    def test_overflow(self):
+        writer = LogWriter(TransactionalDatabase(), size=1)
+        self.assertTrue(writer.put(entry(1), timeout=0.01))
+        self.assertFalse(writer.put(entry(2), timeout=0.01))
+        self.assertEqual(writer.stats()['overflows'], 1)
+
+    def test_errors(self):
+        db = TransactionalDatabase(fail=True)
+        writer = LogWriter(db, batch=2)
+        writer.put(entry(1))
+        writer.drain()
+        self.assertEqual(writer.stats()['errors'], 1)
+        self.assertEqual(writer.stats()['written'], 0)
+        self.assertEqual(db.closes, 1)
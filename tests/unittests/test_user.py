@@ -17,6 +17,7 @@ from zoom.user import (
     authenticate,
     activate_user,
     deactivate_user,
+    add_user,
     User as OldUser, 
     UnauthorizedException,
 )
@@ -217,6 +218,13 @@ class TestOldUser(TestUser):
         user = OldUser('user1')
         self.assertEqual(user.groups, ['users', 'everyone'])
 
+    def test_user_groups_changed(self):
+        user = OldUser('user1')
+        self.assertEqual(user.groups, ['users', 'everyone'])
+        add_user('user1', 'managers')
+        user = OldUser('user1')
+        self.assertEqual(user.groups, ['users', 'everyone', 'managers'])
+
     def test_user_is_member(self):
         user = OldUser('admin')
         self.assertTrue(user.is_member('administrators'))
@@ -0,0 +1,86 @@
+"""
+    Test the visits module
+
+    Copyright (c) 2005-2016 Dynamic Solutions Inc.
+    support@dynamic-solutions.com
+
+    This file is part of DataZoomer.
+
+"""
+
+# pylint: disable=missing-docstring
+# pylint: disable=invalid-name
+# It's reasonable in this case.
+
+import unittest
+import datetime
+
+from zoom.visits import VisitTracker
+
+from test_log import TransactionalDatabase
+
+SUBJECT = '0123456789abcdef0123456789abcdef'
+
+
+def sid(n):
+    return '%032x' % n
+
+
+class TestVisitTracker(unittest.TestCase):
+
+    def test_visits_collected(self):
+        tracker = VisitTracker(TransactionalDatabase())
+        first = datetime.datetime(2016, 1, 1, 9)
+        later = datetime.datetime(2016, 1, 1, 10)
+        tracker.visited(SUBJECT, sid(1), first)
+        tracker.visited(SUBJECT, sid(1), later)
+        self.assertEqual(tracker.visits[sid(1)], [sid(1), SUBJECT, first, later])
+        self.assertEqual(tracker.stats()['pending'], 1)
+
+    def test_invalid_subject(self):
+        tracker = VisitTracker(TransactionalDatabase())
+        tracker.visited('x' * 40, sid(1))
+        tracker.visited('bad subject', sid(2))
+        self.assertEqual(tracker.visits[sid(1)][1], None)
+        self.assertEqual(tracker.visits[sid(2)][1], None)
+
+    def test_flush_batches(self):
+        db = TransactionalDatabase()
+        tracker = VisitTracker(db, batch=2)
+        for n in range(5):
+            tracker.visited(SUBJECT, sid(n))
+        tracker.flush()
+        self.assertEqual([len(args) for _, args in db.committed], [8, 8, 4])
+        self.assertEqual(tracker.stats(), dict(pending=0, written=5, errors=0))
+        self.assertEqual(db.closes, 1)
+
+    def test_stop_writes_visits(self):
+        db = TransactionalDatabase()
+        tracker = VisitTracker(db, interval=0.01)
+        tracker.start()
+        tracker.visited(SUBJECT, sid(1))
+        tracker.stop()
+        self.assertFalse(tracker.is_alive())
+        self.assertEqual(tracker.stats()['pending'], 0)
+        self.assertEqual(sum(len(args) for _, args in db.committed), 4)
+
+    def test_errors(self):
+        db = TransactionalDatabase(fail=True)
+        tracker = VisitTracker(db)
+        tracker.visited(SUBJECT, sid(1))
+        tracker.flush()
+        self.assertEqual(tracker.stats()['errors'], 1)
+        self.assertEqual(tracker.stats()['written'], 0)
+        self.assertEqual(tracker.stats()['pending'], 1)
+        self.assertEqual(db.closes, 1)
+
+    def test_failed_batch_put_back(self):
+        db = TransactionalDatabase(failures=[2])
+        tracker = VisitTracker(db, batch=2)
+        for n in range(6):
+            tracker.visited(SUBJECT, sid(n))
+        tracker.flush()
+        self.assertEqual([len(args) for _, args in db.committed], [8, 8])
+        self.assertEqual(tracker.stats(), dict(pending=2, written=4, errors=1))
+        tracker.flush()
+        self.assertEqual(tracker.stats(), dict(pending=0, written=6, errors=1))
@@ -0,0 +1,101 @@
+"""
+    fill_benchmark.py
+
+    compares the template filler, with templates compiled once (source) and
+    compiled every time, with the regular expression filler it replaced
+
+    usage:
+        python fill_benchmark.py [iterations]
+
+"""
+import re
+import sys
+import timeit
+
+from zoom.fill import dzfill, viewfill
+from zoom.tools import unisafe
+
+
+parts_re = r"""(\w+)\s*=\s*"([^"]*)"|(\w+)\s*=\s*'([^']*)'|(\w+)\s*=\s*([^\s]+)\s*|("")|"([^"]*)"|(\w+)"""
+tag_parts = re.compile(parts_re)
+pattern_tpl = '%s([a-z0-9_]+)\s*(.*?)%s'
+
+
+def regex_fill(tag_start, tag_end, text, callback):
+    """the regular expression filler, rescanning the text every time"""
+
+    def replace_tag(match):
+        name     = match.groups(1)[0].lower()
+        rest     = match.group(0)[len(name)+len(tag_start):-len(tag_end)]
+        parts    = tag_parts.findall(rest)
+        keywords = dict(a and (a,b) or c and (c,d) or e and (e,f) for (a,b,c,d,e,f,g,h,i) in parts if a or c or e)
+        args     = [h or i or "" for (a,b,c,d,e,f,g,h,i) in parts if h or i or g]
+        result = callback(name, *args, **keywords)
+        if result == None:
+            result = match.group(0)
+        return unisafe(result)
+
+    innerre = re.compile(pattern_tpl % (tag_start, tag_end), re.IGNORECASE)
+    result = []
+    lastindex = 0
+    for outermatch in re.finditer("<!--.*?-->", text):
+        text_between = text[lastindex:outermatch.start()]
+        result.append(innerre.sub(replace_tag, unisafe(text_between)))
+        lastindex = outermatch.end()
+        result.append(outermatch.group())
+    result.append(innerre.sub(replace_tag, unisafe(text[lastindex:])))
+    return u''.join(unisafe(x) for x in result)
+
+
+TEMPLATE = """<!DOCTYPE html>
+<html>
+<head>
+    <title><dz:site_name> - <dz:title></title>
+    <!-- styles -->
+    <dz:styles>
+    <dz:css>
+</head>
+<body>
+    <div id="header"><dz:site_name> <dz:slogan></div>
+    <div id="menu"><dz:system_menu> <dz:main_menu></div>
+    <div id="content">
+    <dz:content>
+    </div>
+    <div id="footer">
+        <dz:link_to "Home" "/" class="home"> <dz:owner_link> <dz:date>
+    </div>
+    <dz:libs>
+    <dz:js>
+</body>
+</html>
+""" * 4
+
+VIEW = '<p>{{name}}</p><p>{{phone}}</p><p>{{email}}</p>' * 20
+
+
+def helper(name, *args, **keywords):
+    """stand in for the page helpers"""
+    return '[%s %d %d]' % (name, len(args), len(keywords))
+
+
+def run(iterations):
+    """time both fillers"""
+    values = dict(name='Joe', phone='555-1234', email='joe@example.com').get
+    assert dzfill(TEMPLATE, helper) == regex_fill('<dz:', '>', TEMPLATE, helper)
+    assert viewfill(VIEW, values) == regex_fill('{{', '}}', VIEW, values)
+
+    tests = [
+        ('dzfill source', lambda: dzfill(TEMPLATE, helper, 'template.html')),
+        ('dzfill', lambda: dzfill(TEMPLATE, helper)),
+        ('regex dzfill', lambda: regex_fill('<dz:', '>', TEMPLATE, helper)),
+        ('viewfill source', lambda: viewfill(VIEW, values, 'view.html')),
+        ('viewfill', lambda: viewfill(VIEW, values)),
+        ('regex viewfill', lambda: regex_fill('{{', '}}', VIEW, values)),
+    ]
+    for name, test in tests:
+        elapsed = timeit.timeit(test, number=iterations)
+        print '%-20s %8.1f us' % (name, elapsed / iterations * 1000000)
+
+
+if __name__ == '__main__':
+    run(len(sys.argv) > 1 and int(sys.argv[1]) or 1000)
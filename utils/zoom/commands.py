@@ -17,6 +17,7 @@ __all__ = [
     'auto',
     'server',
     'publish',
+    'rebuild_memberships',
 ]
 
 
@@ -39,11 +40,22 @@ def run(cmd, returncode=False):
 
 def server(options, port=8000, instance='.'):
     """run an instance using Python's builtin HTTP server"""
-    from zoom.server import run as runweb
-    runweb(port, instance)
+    from zoom.server import run as runweb, RELOAD, PERSISTENT
+    modules = options.reload and RELOAD or PERSISTENT
+    runweb(port, instance, modules,
+           options.workers, options.threads, options.max_requests)
     print('\rstopped')
 
 
+def rebuild_memberships(options, instance='.', site='localhost'):
+    """rebuild the effective group memberships table of a site"""
+    from zoom.system import system
+    from zoom.memberships import rebuild
+    system.setup(os.path.abspath(instance), site)
+    print('{} effective memberships'.format(rebuild(system.database)))
+    system.release()
+
+
 def auto(options, command, name, *args):
     """run a command automatically whenever a file changes"""
     if not exists(name):
@@ -66,6 +66,19 @@ def main():
     parser.add_option("-q", "--quiet", dest="verbose",
                       action="store_false", default=True,
                       help="don't print status messages to stdout")
+    parser.add_option("--no-reload", dest="reload",
+                      action="store_false", default=True,
+                      help="keep modules loaded instead of reloading changes")
+    parser.add_option("-w", "--workers", dest="workers",
+                      type="int", default=1,
+                      help="number of server worker processes")
+    parser.add_option("-t", "--threads", dest="threads",
+                      type="int", default=1,
+                      help="number of request threads per worker")
+    parser.add_option("--max-requests", dest="max_requests",
+                      type="int", default=0,
+                      help="replace workers after they handle this many "
+                           "requests")
     (options, args) = parser.parse_args()
 
     try:
@@ -4,12 +4,12 @@
     datazoomer app
 """
 
-import imp
-from os.path import isfile
+from os.path import isfile, join
 
 from .system import system
 from .page import Page
 from .tools import load_content
+from .loader import load_source
 from .exceptions import PageMissingException
 
 # pylint: disable=no-self-use
@@ -48,7 +48,7 @@ class App(object):
         # pylint: disable=star-args
 
         def load_page(module, filler):
-            """load a view page from the current directory"""
+            """load a view page from the app directory"""
             content = load_content(module)
             if content:
                 return Page(content, filler)
@@ -61,16 +61,19 @@ class App(object):
         if self.menu:
             system.app.menu = self.menu
 
-        if len(route) > 1 and isfile('%s.py' % route[1]) and self.authorized():
+        path = system.app.dir
+
+        if len(route) > 1 and isfile(join(path, '%s.py' % route[1])) and \
+                self.authorized():
             module = route[1]
             rest_of_route = route[2:]
         else:
             module = 'index'
             rest_of_route = route[1:]
 
-        filename = '%s.py' % module
+        filename = join(path, '%s.py' % module)
         if isfile(filename):
-            source = imp.load_source(module, filename)
+            source = load_source(module, filename)
             app = if_callable(getattr(source, 'app', None))
             view = if_callable(getattr(source, 'view', None))
             controller = if_callable(getattr(source, 'controller', None))
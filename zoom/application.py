@@ -18,12 +18,12 @@
 """Application module"""
 
 import os
-import imp
 import ConfigParser
 
 from . import response
 from zoom.system import system
 from zoom.settings import NEGATIVE
+from zoom.loader import load_source, AppPath
 
 DEFAULT_SETTINGS = dict(
     title='',
@@ -40,6 +40,60 @@ DEFAULT_SETTINGS = dict(
 )
 
 
+SETTINGS_ATTRIBUTES = [
+    'theme', 'enabled', 'version', 'icon', 'title', 'visible', 'description',
+    'categories', 'tags', 'keywords', 'in_development',
+]
+
+
+def app_config(app_dir, default=None):
+    """read the settings config files of the app in a directory
+
+    Settings in the app's own config.ini override those in the default.ini
+    shared by the apps in the same directory which override those in the
+    system default.ini.
+    """
+
+    def as_dict(config):
+        """
+        Converts a ConfigParser object into a dictionary.
+        """
+        the_dict = {}
+        for section in config.sections():
+            for key, val in config.items(section):
+                the_dict[key] = val
+        return the_dict
+
+    config_parser = ConfigParser.ConfigParser()
+
+    def get_config(pathname):
+        config_parser.read(pathname)
+        return as_dict(config_parser)
+
+    local_file, shared_file, system_file = config_files(app_dir)
+    local_settings = get_config(local_file)
+    shared_settings = get_config(shared_file)
+    system_settings = get_config(system_file)
+
+    result = {}
+    result.update(default or {})
+    result.update(system_settings)
+    result.update(shared_settings)
+    result.update(local_settings)
+    return result
+
+
+def config_files(app_dir):
+    """the config files that provide settings for the app in a directory"""
+    join = os.path.join
+    split = os.path.split
+    return [
+        join(app_dir, 'config.ini'),
+        join(split(app_dir)[0], 'default.ini'),
+        join(split(app_dir)[0], '..', '..', 'default.ini'),
+    ]
+
+
 def list_it(iterable):
     """create list of stripped item from comma delimited string"""
     return [a.strip() for a in iterable.split(',') if a]
@@ -74,7 +128,7 @@ class Application(object):
     # It's reasonable in this case.
 
 
-    def __init__(self, name, path):
+    def __init__(self, name, path, config=None):
         self.name = name
         self.get = self.read_config # remove?
         self.path = path
@@ -82,24 +136,37 @@ class Application(object):
         self.url = '/' + name
         self.config_parser = ConfigParser.ConfigParser()
 
-        config = self.get_config(DEFAULT_SETTINGS)
-        self.settings = system.settings.app_settings(self, config)
-        get = self.settings.get
-
-        self.theme = get('theme')
-        self.enabled = get('enabled')
-        self.version = get('version')
-        self.icon = get('icon')
-        self.title = get('title') or name.capitalize()
-        self.visible = get('visible') not in NEGATIVE
-        self.description = get('description', '')
-        self.categories = list_it(get('categories', ''))
-        self.tags = list_it(get('tags', ''))
-        self.keywords = get('keywords', '')
-        self.in_development = get('in_development')
+        if config is None:
+            config = self.get_config(DEFAULT_SETTINGS)
+        self.config = config
 
         self.helpers = {}
 
+    def __getattr__(self, name):
+        # settings are only looked up for apps that are asked about
+        if name == 'settings':
+            self.settings = system.settings.app_settings(self, self.config)
+            return self.settings
+
+        elif name in SETTINGS_ATTRIBUTES:
+            # only the attribute asked for is set so values the app has set
+            # itself are left alone
+            get = self.settings.get
+            if name == 'title':
+                value = get('title') or self.name.capitalize()
+            elif name == 'visible':
+                value = get('visible') not in NEGATIVE
+            elif name in ('categories', 'tags'):
+                value = list_it(get(name, ''))
+            elif name in ('description', 'keywords'):
+                value = get(name, '')
+            else:
+                value = get(name)
+            setattr(self, name, value)
+            return value
+
+        raise AttributeError(name)
+
     def get_settings(self):
         """
         get settings specific to this application
@@ -129,39 +196,8 @@ class Application(object):
         return result
 
     def get_config(self, default=None):
-
-        def as_dict(config):
-            """
-            Converts a ConfigParser object into a dictionary.
-            """
-            the_dict = {}
-            for section in config.sections():
-                for key, val in config.items(section):
-                    #the_dict['.'.join([self.name, key])] = val
-                    the_dict[key] = val
-            return the_dict
-
-        def get_config(pathname):
-            self.config_parser.read(pathname)
-            return as_dict(self.config_parser)
-
-        join = os.path.join
-        split = os.path.split
-
-        local_settings_config_file = join(self.dir, 'config.ini')
-        shared_settings_config_file = join(split(self.dir)[0], 'default.ini')
-        system_settings_config_file = join(split(self.dir)[0], '..', '..', 'default.ini')
-
-        local_settings = get_config(local_settings_config_file)
-        shared_settings = get_config(shared_settings_config_file)
-        system_settings = get_config(system_settings_config_file)
-
-        result = {}
-        result.update(default or {})
-        result.update(system_settings)
-        result.update(shared_settings)
-        result.update(local_settings)
-        return result
+        """read the settings config files for this app"""
+        return app_config(self.dir, default)
 
     def read_config(self, section, key, default=None):
         """read config file information"""
@@ -196,24 +232,28 @@ class Application(object):
 
     def dispatch(self, request):
         """dispatch request to an app"""
-        os.chdir(os.path.split(self.path)[0])
-        app = getattr(imp.load_source('app', self.path), 'app')
-        if app:
-            try:
-                return app(request)
-            except TypeError as error:
-                if 'takes no arguments' in str(error):
-                    # legacy app
-                    return app()
-                raise
+        if not request.wsgi_multithread:
+            # legacy apps may open files relative to the app directory
+            os.chdir(self.dir)
+        with AppPath(self.dir):
+            app = getattr(load_source('app', self.path), 'app')
+            if app:
+                try:
+                    return app(request)
+                except TypeError as error:
+                    if 'takes no arguments' in str(error):
+                        # legacy app
+                        return app()
+                    raise
 
     def initialize(self, request):
         name = 'initialize.py'
-        pathname = os.path.join(os.path.split(self.path)[0], name)
+        pathname = os.path.join(self.dir, name)
         if os.path.exists(pathname):
-            app = getattr(imp.load_source('main', pathname), 'main')
-            if app:
-                app(request)
+            with AppPath(self.dir):
+                app = getattr(load_source('initialize', pathname), 'main')
+                if app:
+                    app(request)
 
     def __repr__(self):
         return repr('Application: %s' % self.__dict__)
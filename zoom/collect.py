@@ -3,6 +3,7 @@
 """
 
 import os
+import datetime
 from os import environ as env
 
 from . import json
@@ -12,7 +13,7 @@ from .browse import browse
 from .page import page
 from .user import user
 from .mvc import View, Controller
-from .tools import now, redirect_to, markdown
+from .tools import redirect_to, markdown
 from .utils import DefaultRecord, id_for
 from .fields import Form, ButtonField, Hidden, Button, MarkdownText
 from .helpers import link_to, error, url_for, url_for_page
@@ -210,8 +211,8 @@ class CollectionController(Controller):
             if key and locate(c, record.key) is not None:
                 error(duplicate_key_msg)
             else:
-                record.created = now
-                record.updated = now
+                record.created = datetime.datetime.now()
+                record.updated = record.created
                 record.owner = user.username
                 record.owner_id = user.user_id
                 record.created_by = user.username
@@ -240,7 +241,7 @@ class CollectionController(Controller):
                 if record.key <> key and locate(c, record.key):
                     error(duplicate_key_msg)
                 else:
-                    record.updated = now
+                    record.updated = datetime.datetime.now()
                     record.updated_by = user.username
                     record.key = record.key # property to attribute for storage
                     c.store.put(record)
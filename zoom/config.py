@@ -15,17 +15,28 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import ConfigParser, os.path
+import ConfigParser, os.path, threading
+
+
+def mtime(pathname):
+    """return the modification time of a file or None if it's missing"""
+    try:
+        return os.stat(pathname).st_mtime
+    except OSError:
+        return None
 
 
 class Config(object):
     def __init__(self, dz_conf_path, server_name):
 
+        self.mtimes = {}
+
         def p(path, *a):
             return os.path.abspath(os.path.join(path,*a))
 
         def get_config(*a):
             pathname = os.path.join(*a)
+            self.mtimes[pathname] = mtime(pathname)
             if os.path.exists(pathname):
                 config = ConfigParser.ConfigParser()
                 config.read(pathname)
@@ -33,6 +44,7 @@ class Config(object):
 
         # read the system config file - one per instance
         self.instance_path = p(dz_conf_path)
+        self.server_name = server_name
         self.system_config_pathname = os.path.join(self.instance_path, 'dz.conf')
         self.system_config = get_config(self.instance_path, 'dz.conf')
         if not self.system_config:
@@ -50,6 +62,7 @@ class Config(object):
             # legacy location
             self.config = get_config(self.sites_path, 'default.conf')
 
+        self.site_config = None
         if server_name:
             self.site_config = get_config(self.sites_path, server_name, 'site.ini')
             if not self.site_config:
@@ -59,6 +72,18 @@ class Config(object):
         # read the site config file - one per site
         self.site_path = os.path.join(self.sites_path, server_name)
 
+        # site values override default values
+        self.values = {}
+        for config in (self.config, self.site_config):
+            if config:
+                self.values.update(flatten(config))
+
+    def changed(self):
+        """return True if any of the config files have changed"""
+        for pathname, when in self.mtimes.items():
+            if mtime(pathname) != when:
+                return True
+        return False
 
     def get(self, section, option, default=None):
 
@@ -69,26 +94,56 @@ class Config(object):
                 os.path.join(self.sites_path, 'default.ini'),
                 os.path.join(self.site_path, 'site.ini')))
 
-        try:
-            return self.site_config.get(section, option)
-        except:            
+        value = self.values.get((section, option.lower()))
+        if value is not None:
+            return value
+        elif default != None:
+            return default
+        else:
+            missing_report(section, option)
+
+
+    def __str__(self):
+        return '<Config: %s>' % repr(sorted(self.mtimes))
+
+
+def flatten(config):
+    """return the values of a ConfigParser as a dict keyed by section and option"""
+    values = {}
+    sections = [ConfigParser.DEFAULTSECT] + config.sections()
+    for section in sections:
+        if section == ConfigParser.DEFAULTSECT:
+            options = config.defaults().keys()
+        else:
+            options = config.options(section)
+        for option in options:
             try:
-                return self.config.get(section, option)
+                values[(section, option)] = config.get(section, option)
+            except ConfigParser.Error:
+                # values that fail to interpolate read as missing
+                pass
+    return values
 
-            except:
-                if default != None:
-                    return default
-                else:
-                    missing_report(section, option)
 
+_configs = {}
+_configs_lock = threading.Lock()
 
-    def __str__(self):
-        return '<Config: %s>' % repr([self.default_config_pathname, self.site_config_pathname])
+
+def get_config(dz_conf_path, server_name):
+    """return the config for an instance and server
+
+    Configs are kept for the life of the process and only read again when
+    one of their files changes.
+    """
+    key = (os.path.abspath(dz_conf_path), server_name)
+    config = _configs.get(key)
+    if config is None or config.changed():
+        config = Config(dz_conf_path, server_name)
+        with _configs_lock:
+            _configs[key] = config
+    return config
 
 
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
-
-
-
@@ -0,0 +1,199 @@
+"""
+    zoom.context
+
+    request context
+
+    The system, user, request and manager objects are shared by nearly every
+    module in the platform.  So that one process can serve several requests
+    at the same time, each of them is a proxy for an object that belongs to
+    the thread handling the current request.
+
+    >>> class Thing(object):
+    ...     name = 'default'
+    >>> thing = ContextProxy(local('thing', Thing))
+    >>> thing.name
+    'default'
+    >>> other = Thing()
+    >>> other.name = 'other'
+    >>> bind(thing=other)
+    >>> thing.name
+    'other'
+    >>> isinstance(thing, Thing)
+    True
+"""
+
+import sys
+import threading
+import StringIO
+
+# pylint: disable=invalid-name
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def local(name, factory):
+    """return a function that provides the current context's named object
+
+    If nothing has been bound to the name in the current context the
+    factory is called to provide a default.
+    """
+    def lookup():
+        """return the object bound to the name"""
+        try:
+            return getattr(_local, name)
+        except AttributeError:
+            value = factory()
+            setattr(_local, name, value)
+            return value
+    return lookup
+
+
+def bind(**objects):
+    """bind objects to names in the current context"""
+    for name, value in objects.items():
+        setattr(_local, name, value)
+
+
+def current(name, default=None):
+    """return the object bound to a name in the current context"""
+    return getattr(_local, name, default)
+
+
+class ContextProxy(object):
+    """stands in for an object that belongs to the current context"""
+
+    __slots__ = ('_lookup',)
+
+    def __init__(self, lookup):
+        object.__setattr__(self, '_lookup', lookup)
+
+    def _get_current_object(self):
+        """return the object this proxy currently stands in for"""
+        return object.__getattribute__(self, '_lookup')()
+
+    @property
+    def __class__(self):
+        return self._get_current_object().__class__
+
+    @property
+    def __dict__(self):
+        return self._get_current_object().__dict__
+
+    def __getattr__(self, name):
+        return getattr(self._get_current_object(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_current_object(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self._get_current_object(), name)
+
+    def __call__(self, *args, **kwargs):
+        return self._get_current_object()(*args, **kwargs)
+
+    def __getitem__(self, key):
+        return self._get_current_object()[key]
+
+    def __setitem__(self, key, value):
+        self._get_current_object()[key] = value
+
+    def __delitem__(self, key):
+        del self._get_current_object()[key]
+
+    def __getslice__(self, i, j):
+        return self._get_current_object()[i:j]
+
+    def __setslice__(self, i, j, sequence):
+        self._get_current_object()[i:j] = sequence
+
+    def __delslice__(self, i, j):
+        del self._get_current_object()[i:j]
+
+    def __iter__(self):
+        return iter(self._get_current_object())
+
+    def __len__(self):
+        return len(self._get_current_object())
+
+    def __contains__(self, item):
+        return item in self._get_current_object()
+
+    def __nonzero__(self):
+        return bool(self._get_current_object())
+
+    def __add__(self, other):
+        return self._get_current_object() + other
+
+    def __radd__(self, other):
+        return other + self._get_current_object()
+
+    def __eq__(self, other):
+        return self._get_current_object() == other
+
+    def __ne__(self, other):
+        return self._get_current_object() != other
+
+    def __hash__(self):
+        return hash(self._get_current_object())
+
+    def __str__(self):
+        return str(self._get_current_object())
+
+    def __unicode__(self):
+        return unicode(self._get_current_object())
+
+    def __repr__(self):
+        return repr(self._get_current_object())
+
+
+class OutputCapture(object):
+    """sends printed output to the current context's capture buffer
+
+    Installed in place of sys.stdout so that output printed while handling
+    one request doesn't end up in the page of another.  Output printed when
+    nothing is being captured goes to the original stream.
+    """
+
+    def __init__(self, stream):
+        self.__dict__['stream'] = stream
+
+    def _target(self):
+        """the stream output should currently go to"""
+        buffers = getattr(_local, 'buffers', None)
+        return buffers and buffers[-1] or self.stream
+
+    def write(self, text):
+        """write text to the current stream"""
+        self._target().write(text)
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    def __setattr__(self, name, value):
+        # print sets softspace on the stream it is printing to
+        setattr(self._target(), name, value)
+
+
+def capture_output():
+    """start capturing printed output for the current context
+
+    Captures can be nested, each call to captured_output ending the most
+    recently started one.
+    """
+    with _lock:
+        if not isinstance(sys.stdout, OutputCapture):
+            sys.stdout = OutputCapture(sys.stdout)
+    if getattr(_local, 'buffers', None) is None:
+        _local.buffers = []
+    _local.buffers.append(StringIO.StringIO())
+
+
+def captured_output():
+    """stop capturing printed output and return what was captured"""
+    buffers = getattr(_local, 'buffers', None)
+    if not buffers:
+        return ''
+    buffer = buffers.pop()
+    value = buffer.getvalue()
+    buffer.close()
+    return value
@@ -19,6 +19,9 @@ import datetime
 import warnings
 import timeit
 
+from zoom import sqlstats
+from zoom.db import database_name
+
 warnings.filterwarnings('ignore','Unknown table.*')
 norm = string.maketrans('','')
 nonprintable = string.translate(norm,norm,string.letters+string.punctuation+string.digits+' ')
@@ -130,6 +133,7 @@ class Database(object):
         self.__factory = factory
         self.__args = args
         self.__keywords = keywords
+        self.name = database_name(args, keywords)
         self.__ptype = {
                 0:'NUMERIC',
                 2:'NUMERIC',
@@ -185,12 +189,7 @@ class Database(object):
         try:
             result = cursor.execute(sql, args)
         finally:
-            if self.debug:
-                self.log.append('  SQL ({:5.1f} ms): {!r} - {!r}'.format(
-                    (timeit.default_timer() - start) * 1000,
-                    sql,
-                    args,
-                ))
+            sqlstats.measure(self, sql, args, start)
 
         if cursor.description:
             return RecordSet(self, cursor)
@@ -207,12 +206,7 @@ class Database(object):
         try:
             result = cursor.execute(sql,params)
         finally:
-            if self.debug:
-                self.log.append('  SQL ({:5.1f} ms): {!r} - {!r}'.format(
-                    (timeit.default_timer() - start) * 1000,
-                    sql,
-                    params,
-                ))
+            sqlstats.measure(self, sql, params, start)
 
         self.lastrowid = cursor.lastrowid # In case it was an insert
         return result
@@ -632,14 +626,32 @@ class Record(object):
     def __nonzero__(self):
         return 1
 
-def database(engine='mysql', host='localhost', name='zoomdata', user='root', password=''):
-    """Create and return a connected database"""
+def database(engine='mysql', host='localhost', name='zoomdata', user='root', password='', pool=None):
+    """Create and return a connected database
+
+    Pass pool=dict(<pool options>) to lease connections from a connection
+    pool (see zoom.pool) rather than making a new one.
+    """
     if engine == 'mysql':
         import MySQLdb
-        db = Database(MySQLdb.Connect, host=host, user=user, passwd=password, db=name)
+        connect = MySQLdb.Connect
+        if pool is not None:
+            from zoom.pool import pooled
+            connect = pooled(connect, autocommit=True, **pool)
+        db = Database(connect, host=host, user=user, passwd=password, db=name)
         db.autocommit(1)
         return db
 
+def adapter(db):
+    """Return a legacy database that runs over a zoom.db database
+
+    The legacy database uses the connection of the zoom.db database it
+    adapts so the two share one connection and one transaction.
+    """
+    legacy = Database(lambda: db)
+    legacy.name = getattr(db, 'name', None)
+    return legacy
+
 def test_database():
     """Create and return a connected testing database"""
     return database(name='test', user='testuser', password='password')
@@ -5,6 +5,7 @@
 import timeit
 
 from zoom.exceptions import DatabaseException
+from zoom import sqlstats
 from zoom.utils import ItemList
 
 
@@ -53,6 +54,21 @@ class Result(object):
             return i
 
 
+def database_name(args, keywords):
+    """return the name that tells a database apart from others
+
+    Processes keep data, like the settings and the group graph, for each
+    database they use under its name.
+
+    >>> database_name((), dict(host='database', db='test'))
+    'database/test'
+    >>> database_name(('data.sqlite',), {})
+    '/data.sqlite'
+    """
+    name = keywords.get('db') or keywords.get('database') or args and args[0]
+    return '{}/{}'.format(keywords.get('host', ''), name or '')
+
+
 class Database(object):
     # pylint: disable=trailing-whitespace
     """
@@ -169,6 +185,7 @@ class Database(object):
         self.__factory = factory
         self.__args = args
         self.__keywords = keywords
+        self.name = database_name(args, keywords)
         self.debug = False
         self.log = []
         self.rowcount = None
@@ -179,6 +196,12 @@ class Database(object):
             self.__connection = self.__factory(*self.__args, **self.__keywords)
         return getattr(self.__connection, name)
 
+    def close(self):
+        """close the connection"""
+        if self.__connection:
+            self.__connection.close()
+            self.__connection = None
+
     def _execute(self, cursor, method, command, *args):
         """execute the SQL command"""
         start = timeit.default_timer()
@@ -193,12 +216,7 @@ class Database(object):
         else:
             self.rowcount = cursor.rowcount
         finally:
-            if self.debug:
-                self.log.append('  SQL ({:5.1f} ms): {!r} - {!r}'.format(
-                    (timeit.default_timer() - start) * 1000,
-                    command,
-                    args,
-                ))
+            sqlstats.measure(self, command, args, start)
 
         if cursor.description:
             return Result(cursor)
@@ -221,11 +239,16 @@ class Database(object):
         return self.execute(command, *args)
 
     def use(self, name):
-        """use another database on the same instance"""
+        """use another database on the same instance
+
+        If connections are pooled the new database takes them from the
+        background pool rather than the one requests use (see zoom.pool).
+        """
         # pylint: disable=star-args
         args = list(self.__args)
         keywords = dict(self.__keywords, db=name)
-        return Database(self.__factory, *args, **keywords)
+        factory = getattr(self.__factory, 'background', self.__factory)
+        return Database(factory, *args, **keywords)
 
     def report(self):
         """produce a SQL log report"""
@@ -242,12 +265,22 @@ def database(
     *a,
     **k
 ):
-    """create a database object"""
+    """create a database object
+
+    Pass pool=dict(<pool options>) to lease connections from a connection
+    pool (see zoom.pool) rather than making a new one.
+    """
     # pylint: disable=invalid-name
 
+    pool = k.pop('pool', None)
+
     if engine == 'mysql':
         import MySQLdb
-        db = Database(MySQLdb.connect, host=host, db=db, user=user, *a, **k)
+        connect = MySQLdb.connect
+        if pool is not None:
+            from zoom.pool import pooled
+            connect = pooled(connect, autocommit=True, **pool)
+        db = Database(connect, host=host, db=db, user=user, *a, **k)
         db.autocommit(1)
         return db
 
@@ -1,53 +1,179 @@
 """
     fills templates
+
+    Templates are compiled into a list of literal text chunks and tag
+    calls, so filling is a walk through the list, calling the callback for
+    each tag.  Text filled with the name of the template file it came from
+    (source) keeps its compiled form, for as long as the text stays the
+    same, so theme templates are only compiled once.  Other text, like page
+    content and helper output, is compiled each time it's filled.  The
+    compiled forms of the COMPILED_LIMIT templates used most recently are
+    kept.
+
+    >>> compile_template('<dz:', '>', 'Hi <dz:name first "x" size=2>!')
+    [u'Hi ', (u'name', (u'first', u'x'), {u'size': u'2'}, u'<dz:name first "x" size=2>'), u'!']
+    >>> dzfill('Hi <dz:name>!', lambda tag: 'Joe')
+    u'Hi Joe!'
+    >>> dzfill('Hi <DZ:name>!', lambda tag: 'Joe', source='hi.html')
+    u'Hi Joe!'
 """
 
+from collections import OrderedDict
 from tools import unisafe
 import re
+import threading
+import tracing
 
 parts_re = r"""(\w+)\s*=\s*"([^"]*)"|(\w+)\s*=\s*'([^']*)'|(\w+)\s*=\s*([^\s]+)\s*|("")|"([^"]*)"|(\w+)"""
 tag_parts = re.compile(parts_re)
 
+comments = re.compile("<!--.*?-->")
+
 pattern_tpl = '%s([a-z0-9_]+)\s*(.*?)%s'
 patterns = {}
+starts = {}
 
-def fill(tag_start, tag_end, text, callback):
+COMPILED_LIMIT = 100
+compiled = OrderedDict()
+compiled_lock = threading.Lock()
 
-    def replace_tag(match):
 
-        name     = match.groups(1)[0].lower()
-        rest     = match.group(0)[len(name)+len(tag_start):-len(tag_end)]
-        parts    = tag_parts.findall(rest)
-        keywords = dict(a and (a,b) or c and (c,d) or e and (e,f) for (a,b,c,d,e,f,g,h,i) in parts if a or c or e)
-        args     = [h or i or "" for (a,b,c,d,e,f,g,h,i) in parts if h or i or g]
-
-        result = callback(name, *args, **keywords)
-        if result == None: 
-            result = match.group(0)
-        return unisafe(result)
-    
+def tag_pattern(tag_start, tag_end):
+    """return the regular expression that finds tags"""
     tags = (tag_start, tag_end)
     if not tags in patterns:
         patterns[tags] = re.compile(pattern_tpl % (tag_start, tag_end), re.IGNORECASE)
-    innerre = patterns[tags]
-    
+    return patterns[tags]
+
+
+def parse_tag(tag_start, tag_end, match):
+    """return the name, args and keywords of a tag"""
+    name     = match.groups(1)[0].lower()
+    rest     = match.group(0)[len(name)+len(tag_start):-len(tag_end)]
+    parts    = tag_parts.findall(rest)
+    keywords = dict(a and (a,b) or c and (c,d) or e and (e,f) for (a,b,c,d,e,f,g,h,i) in parts if a or c or e)
+    args     = tuple(h or i or "" for (a,b,c,d,e,f,g,h,i) in parts if h or i or g)
+    return name, args, keywords
+
+
+def compile_template(tag_start, tag_end, text):
+    """compile a template into literal text and tag calls
+
+    Tag calls are tuples of the tag name, args, keywords and the original
+    text of the tag.  Text inside HTML comments is left as is.
+    """
+
+    innerre = tag_pattern(tag_start, tag_end)
+
+    program = []
+
+    def add_literal(text):
+        if text:
+            if program and not isinstance(program[-1], tuple):
+                program[-1] += text
+            else:
+                program.append(text)
+
+    def add_tags(text):
+        lastindex = 0
+        for match in innerre.finditer(text):
+            add_literal(text[lastindex:match.start()])
+            program.append(parse_tag(tag_start, tag_end, match) + (match.group(0),))
+            lastindex = match.end()
+        add_literal(text[lastindex:])
+
+    lastindex = 0
+    for outermatch in comments.finditer(text):
+        add_tags(unisafe(text[lastindex:outermatch.start()]))
+        add_literal(unisafe(outermatch.group()))
+        lastindex = outermatch.end()
+    add_tags(unisafe(text[lastindex:]))
+
+    return program
+
+
+def fill_text(tag_start, tag_end, text, callback):
+    """fill text that isn't kept compiled, calling the callback as tags are found"""
+
+    innerre = tag_pattern(tag_start, tag_end)
+
+    def replace_tag(match):
+        name, args, keywords = parse_tag(tag_start, tag_end, match)
+        value = callback(name, *args, **keywords)
+        if value is None:
+            return match.group(0)
+        return unisafe(value)
+
     result = []
     lastindex = 0
-    
-    for outermatch in re.finditer("<!--.*?-->",text):
-        text_between = text[lastindex:outermatch.start()]
-        new_text = innerre.sub(replace_tag, unisafe(text_between))
-        result.append(new_text)
+    for outermatch in comments.finditer(text):
+        result.append(innerre.sub(replace_tag, unisafe(text[lastindex:outermatch.start()])))
+        result.append(unisafe(outermatch.group()))
         lastindex = outermatch.end()
-        result.append(outermatch.group())
-    text_after = text[lastindex:]
-    result.append(innerre.sub(replace_tag, unisafe(text_after)))
-    
-    return u''.join(unisafe(x) for x in result)
+    result.append(innerre.sub(replace_tag, unisafe(text[lastindex:])))
+    return u''.join(result)
+
+
+def fill(tag_start, tag_end, text, callback, source=None):
+    trace = tracing.active()
+    if trace is None:
+        return _fill(tag_start, tag_end, text, callback, source)
+    with trace.span('fill', tags=tag_start + tag_end):
+        return _fill(tag_start, tag_end, text, callback, source)
+
+
+def has_tags(tag_start, text):
+    """return True if text might contain a tag"""
+    start = starts.get(tag_start)
+    if start is None:
+        start = starts[tag_start] = re.compile(re.escape(tag_start), re.IGNORECASE)
+    return start.search(text) is not None
+
+
+def compiled_template(tag_start, tag_end, text, source):
+    """return the compiled form of a template, compiling it if need be"""
+    key = (tag_start, tag_end, source)
+    with compiled_lock:
+        cached = compiled.pop(key, None)
+        if cached is not None and (cached[0] is text or cached[0] == text):
+            compiled[key] = cached
+            return cached[1]
+    program = compile_template(tag_start, tag_end, text)
+    with compiled_lock:
+        compiled[key] = (text, program)
+        while len(compiled) > COMPILED_LIMIT:
+            compiled.popitem(last=False)
+    return program
+
+
+def _fill(tag_start, tag_end, text, callback, source=None):
+
+    if not isinstance(text, basestring):
+        text = unisafe(text)
+    if not text or not has_tags(tag_start, text):
+        return unisafe(text)
+    if source is None:
+        return fill_text(tag_start, tag_end, text, callback)
+    program = compiled_template(tag_start, tag_end, text, source)
+
+    result = []
+    append = result.append
+    for item in program:
+        if item.__class__ is tuple:
+            value = callback(item[0], *item[1], **item[2])
+            if value is None:
+                append(item[3])
+            elif value.__class__ is unicode:
+                append(value)
+            else:
+                append(unisafe(value))
+        else:
+            append(item)
 
-def dzfill(text,callback):
-    return fill('<dz:', '>', text, callback)
+    return u''.join(result)
 
-def viewfill(text,callback):
-    return fill('{{', '}}', text, callback)
+def dzfill(text,callback,source=None):
+    return fill('<dz:', '>', text, callback, source)
 
+def viewfill(text,callback,source=None):
+    return fill('{{', '}}', text, callback, source)
@@ -1,5 +1,6 @@
 """DataZoomer Helpers"""
 import os
+import datetime
 from system import system
 from manager import manager
 import tools
@@ -9,6 +10,8 @@ import html
 from zoom.utils import *
 import flags
 from snippets import snippet
+from pagecache import no_cache
+import pagecache
 import goals
 from urllib import quote
 from string import ascii_letters, digits
@@ -23,6 +26,7 @@ def warning(*text):
         system.session.system_warnings = []
     for item in text:
         system.session.system_warnings.append(item)
+    pagecache.cache.drop_guest(system.session.sid)
 
 def error(*text):
     """Adds one or more errors to list of errors to be displayed on next generated page."""
@@ -30,6 +34,7 @@ def error(*text):
         system.session.system_errors = []
     for item in text:
         system.session.system_errors.append(item)
+    pagecache.cache.drop_guest(system.session.sid)
 
 def message(*text):
     """Adds one or more messages to list of messages to be displayed on next generated page."""
@@ -37,23 +42,30 @@ def message(*text):
         system.session.system_messages = []
     for item in text:
         system.session.system_messages.append(item)
+    pagecache.cache.drop_guest(system.session.sid)
 
 def warnings():
     """Returns an unordered list of warnings in HTML and clears the warning list."""
     result = system.session.system_warnings and html.ul(system.session.system_warnings) or ''
     system.session.system_warnings = []
+    if result:
+        no_cache()
     return result
 
 def errors():
     """Returns an unordered list of errors in HTML and clears the errors list."""
     result = system.session.system_errors and html.ul(system.session.system_errors) or ''
     system.session.system_errors = []
+    if result:
+        no_cache()
     return result
 
 def messages():
     """Returns an unordered list of messages in HTML and clears the messages list."""
     result = system.session.system_messages and html.ul(system.session.system_messages) or ''
     system.session.system_messages = []
+    if result:
+        no_cache()
     return result
 
 def alerts():
@@ -94,6 +106,7 @@ def theme():
     """Returns the system theme name."""
     return system.theme
 
+@tools.cacheable
 def protocol():
     return request.protocol
 
@@ -118,20 +131,15 @@ def system_menu():
 def main_menu_items():
     """Returns the main menu."""
 
-    def assign_defaults(name,title,url,group=[]):
-        return (name,title,url,group)
-
     links = []
     visible_items = []
-    static_links = [assign_defaults(*item) for item in tools.get_menu()]
 
-    for (name,title,url,group) in static_links:
-        if group==[] or [item for item in group if item in user.groups]:
-            if manager.get_app(name) and not manager.get_app(name).visible: continue
-            selector = (len(route)>1 and route[0]=='content' and route[1]==name or len(route) and route[0]==name) and ' id="current"' or ''
-            bootstrap_selector = (len(route)>1 and route[0]=='content' and route[1]==name or len(route) and route[0]==name) and ' class="active"' or ''
-            links.append('<li%s><a href="%s"%s>%s</a></li>' % (bootstrap_selector,url_for(url), selector, title))
-            visible_items.append(name)
+    for (name,title,url,group) in tools.get_visible_menu('main', user.groups):
+        if manager.get_app(name) and not manager.get_app(name).visible: continue
+        selector = (len(route)>1 and route[0]=='content' and route[1]==name or len(route) and route[0]==name) and ' id="current"' or ''
+        bootstrap_selector = (len(route)>1 and route[0]=='content' and route[1]==name or len(route) and route[0]==name) and ' class="active"' or ''
+        links.append('<li%s><a href="%s"%s>%s</a></li>' % (bootstrap_selector,url_for(url), selector, title))
+        visible_items.append(name)
 
     visible_items.extend(['content','login'])
 
@@ -444,15 +452,15 @@ def achieved(name):
 
 def current_date():
     """Returns the current date in text form."""
-    return '%s' % tools.today
+    return '%s' % datetime.date.today()
 
 def date():
     """Returns the current date in text form."""
-    return '%s' % tools.today
+    return '%s' % datetime.date.today()
 
 def year():
     """Returns the current year in text form."""
-    return tools.today.strftime('%Y')
+    return datetime.date.today().strftime('%Y')
 
 def session_id():
     """Returns the session ID."""
@@ -502,22 +510,27 @@ def profile_link(classed="welcome"):
 def upper(text):
     """Returns the given text in upper case."""
     return text.upper()
+@tools.cacheable
 def site_name():
     """Returns the site name."""
     return system.settings.get('site_name')
 
+@tools.cacheable
 def site(option,default=''):
     """Returns the site name."""
     return site_name() or default
 
+@tools.cacheable
 def owner_name():
     """Returns the name of the site owner."""
     return system.settings.get('owner_name')
 
+@tools.cacheable
 def owner_url():
     """Returns the URL of the site owner."""
     return system.settings.get('owner_url')
 
+@tools.cacheable
 def owner_link():
     """Returns a link for the site owner."""
     name = owner_name()
@@ -533,13 +546,16 @@ def mailto(email, name=None):
     name = name or email
     return email and tag_for('a', name, href='mailto:{}'.format(email)) or ''
 
+@tools.cacheable
 def owner_email():
     return system.settings.get('owner_email')
 
+@tools.cacheable
 def admin_email():
     """Returns the email address of the site owner as defined in the site.conf file."""
     return system.settings.get('admin_email')
 
+@tools.cacheable
 def uri():
     """Returns the site URI."""
     return system.uri
@@ -578,6 +594,7 @@ def load_menu(name=None):
                 links.append('<a href="%s">%s</a>' % (url_for(url), title))
         return html.ul(links)
 
+@tools.cacheable
 def theme_uri():
     """Returns the theme URI."""
     return system.uri+'/themes/'+theme()
@@ -586,10 +603,12 @@ def remote_addr():
     """Returns the user ip address."""
     return request.ip
 
+@tools.cacheable
 def domain():
     """Returns the host name."""
     return request.domain
 
+@tools.cacheable
 def host():
     """Returns the host name."""
     return request.host
@@ -735,6 +754,8 @@ def select_field(label='',*args,**keywords):
     return format_field(label,select_input(*args,**keywords))
 
 def csrf_token():
+    # pages with a token belong to one session so they can't be cached
+    no_cache()
     if not system.session.csrf_token:
         from uuid import uuid4
         system.session.csrf_token = uuid4().hex
@@ -0,0 +1,190 @@
+"""
+    zoom.loader
+
+    loads app modules
+
+    Apps commonly import modules that live alongside them in the app
+    directory (e.g. "from model import *").  Many apps have modules with the
+    same names so these can't be left in sys.modules where the next app to
+    run would find them.  Nor can we rely on the current directory to find
+    them when several requests are being served at once.
+
+    Instead, modules are loaded from the directory of the app that is
+    running in the current context and kept in a per-context dictionary
+    rather than sys.modules.  They never go into sys.modules, not even while
+    they run, so running them doesn't take the import lock and the app
+    modules of different requests run side by side.  A module is in the
+    per-context dictionary while it runs so modules it imports can import it
+    in turn.
+
+    App modules, including the initialize.py hooks, commonly set things up
+    for the current request when they are run (e.g. "system.app.menu = ...")
+    so they are run for each request that uses them.  Dispatching a request
+    still runs app.py and the modules it imports; what is saved is reading
+    and compiling them, since their compiled code is kept for the life of
+    the process and only compiled again when their source files change.
+
+    Hook modules, such as the site's menus, are run once and kept until
+    their source files change, so they should only define things at module
+    level and not use the request, system or user when they are run.
+"""
+
+import os
+import sys
+import imp
+import threading
+
+from zoom.context import current, bind
+
+
+# pylint: disable=invalid-name
+_code = {}
+_hooks = {}
+_lock = threading.Lock()
+
+
+def app_path():
+    """the directory of the app running in the current context"""
+    return current('app_path')
+
+
+def app_modules():
+    """the app modules loaded in the current context"""
+    modules = current('app_modules')
+    if modules is None:
+        modules = {}
+        bind(app_modules=modules)
+    return modules
+
+
+def reset():
+    """forget the app modules loaded in the current context"""
+    bind(app_modules={})
+
+
+class AppPath(object):
+    """sets the app directory for the current context
+
+    Used as a context manager around code that runs app modules so that
+    the modules they import are found in the app directory.
+    """
+
+    def __init__(self, path):
+        self.path = path and os.path.abspath(path)
+        self.previous = None
+
+    def __enter__(self):
+        self.previous = app_path()
+        bind(app_path=self.path)
+        return self
+
+    def __exit__(self, *exc_info):
+        bind(app_path=self.previous)
+
+
+def mtime(pathname):
+    """return the modification time of a file"""
+    return os.stat(pathname).st_mtime
+
+
+def compiled(pathname):
+    """return the compiled code of a source file
+
+    The code is kept until the source file changes.
+    """
+    when = mtime(pathname)
+    cached = _code.get(pathname)
+    if cached is None or cached[0] != when:
+        with open(pathname, 'U') as source:
+            code = compile(source.read(), pathname, 'exec')
+        cached = _code[pathname] = (when, code)
+    return cached[1]
+
+
+def new_module(name, pathname):
+    """return a new, empty module for a source file"""
+    module = imp.new_module(name)
+    module.__file__ = pathname
+    return module
+
+
+def run_module(module):
+    """run the source file of a module in the module"""
+    code = compiled(module.__file__)
+    exec code in module.__dict__  # pylint: disable=exec-used
+    return module
+
+
+def load_module(name, pathname):
+    """run a source file as a module without putting it in sys.modules"""
+    return run_module(new_module(name, pathname))
+
+
+def load_source(name, pathname):
+    """load an app source module
+
+    The module is run with its directory as the app directory for the
+    current context so the modules it imports are found next to it.
+    """
+    pathname = os.path.abspath(pathname)
+    path = os.path.dirname(pathname)
+    key = (path, name)
+    modules = app_modules()
+    if key not in modules:
+        module = modules[key] = new_module(name, pathname)
+        try:
+            with AppPath(path):
+                run_module(module)
+        except:
+            modules.pop(key, None)
+            raise
+    return modules[key]
+
+
+def load_hook(name, pathname):
+    """load a hook module
+
+    Hook modules are kept for the life of the process and only loaded again
+    when their source files change.  Anything they work out when they are
+    run is shared by every request.
+    """
+    pathname = os.path.abspath(pathname)
+    when = mtime(pathname)
+    cached = _hooks.get(pathname)
+    if cached is None or cached[0] != when:
+        with _lock:
+            cached = _hooks.get(pathname)
+            if cached is None or cached[0] != when:
+                with AppPath(os.path.dirname(pathname)):
+                    module = load_module(name, pathname)
+                cached = _hooks[pathname] = (when, module)
+    return cached[1]
+
+
+class AppImporter(object):
+    """finds top level modules in the current app directory
+
+    Installed in sys.meta_path so it gets a chance to find a module before
+    sys.path is searched.
+    """
+
+    def find_module(self, fullname, path=None):
+        """find a module in the app directory"""
+        directory = app_path()
+        if path is None and directory and '.' not in fullname:
+            if os.path.isfile(os.path.join(directory, fullname + '.py')):
+                return self
+
+    def load_module(self, fullname):
+        """load a module from the app directory"""
+        # pylint: disable=no-self-use
+        return load_source(fullname, os.path.join(app_path(), fullname + '.py'))
+
+
+def install():
+    """install the app module importer"""
+    if not [i for i in sys.meta_path if isinstance(i, AppImporter)]:
+        sys.meta_path.insert(0, AppImporter())
+
+
+install()
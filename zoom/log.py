@@ -2,13 +2,192 @@
     zoom.log
 
     system logger
+
+    Log entries are normally queued and written to the log table by a
+    LogWriter thread, several rows per insert, so requests don't wait on
+    them.  The writer flushes when it has [log] batch entries (100) or
+    once its oldest entry is [log] interval seconds old (1).  When the
+    queue holds [log] queue entries (10000) callers wait up to a second
+    for room and then write their entry themselves.  Entries still queued
+    when the process exits are written on the way out.
+
+    Set [log] buffered=0 to write each entry as it is logged.  Set [log]
+    sample_complete to a fraction (e.g. 0.1) to only log that share of
+    request completion ('C') entries.
 """
 
 import os
+import atexit
+import random
+import logging
 import datetime
+import threading
+import Queue
+from timeit import default_timer as timer
 
 from zoom.system import system
 from zoom.user import user
+from zoom.settings import NEGATIVE
+
+
+INSERT_LOG = (
+    'insert into log '
+    '(app, route, status, user, address, '
+    'login, server, timestamp, elapsed, message)'
+    'values '
+)
+ROW = '(%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
+
+
+class LogWriter(threading.Thread):
+    """writes queued log entries in batches
+
+    The db is a database connection used only by the writer.  Each batch
+    is committed, since the connection isn't set to autocommit like those
+    of requests are, and the connection is closed.
+    """
+
+    def __init__(self, db, batch=100, interval=1, size=10000):
+        threading.Thread.__init__(self, name='log-writer')
+        self.daemon = True
+        self.db = db
+        self.batch = batch
+        self.interval = interval
+        self.queue = Queue.Queue(size)
+        self.pid = os.getpid()
+        self.stopping = False
+        self.written = 0
+        self.batches = 0
+        self.overflows = 0
+        self.errors = 0
+
+    def put(self, values, timeout=1):
+        """queue a log entry returning False if there's no room"""
+        try:
+            self.queue.put(values, True, timeout)
+            return True
+        except Queue.Full:
+            self.overflows += 1
+            return False
+
+    def take(self):
+        """take the next batch of entries from the queue"""
+        entries = []
+        deadline = None
+        while len(entries) < self.batch:
+            if deadline is None:
+                timeout = self.interval
+            else:
+                timeout = deadline - timer()
+                if timeout <= 0:
+                    break
+            try:
+                entries.append(self.queue.get(True, timeout))
+            except Queue.Empty:
+                break
+            if deadline is None:
+                deadline = timer() + self.interval
+        return entries
+
+    def write(self, entries):
+        """write a batch of entries"""
+        if not entries:
+            return
+        values = []
+        for entry in entries:
+            values.extend(entry)
+        try:
+            self.db(INSERT_LOG + ','.join([ROW] * len(entries)), *values)
+            self.db.commit()
+            self.written += len(entries)
+            self.batches += 1
+        except Exception:  # pylint: disable=broad-except
+            self.errors += 1
+            logging.getLogger(__name__).exception('unable to write log')
+        finally:
+            self.db.close()
+
+    def run(self):
+        while not self.stopping:
+            self.write(self.take())
+
+    def drain(self):
+        """write everything that has been queued"""
+        entries = []
+        while True:
+            try:
+                entries.append(self.queue.get(False))
+            except Queue.Empty:
+                break
+            if len(entries) == self.batch:
+                self.write(entries)
+                entries = []
+        self.write(entries)
+
+    def stop(self):
+        """stop the writer, writing everything that has been queued"""
+        self.stopping = True
+        if self.is_alive():
+            self.join(self.interval * 2 + 1)
+        self.drain()
+
+    def stats(self):
+        """return the writer counters"""
+        return dict(
+            queued=self.queue.qsize(),
+            written=self.written,
+            batches=self.batches,
+            overflows=self.overflows,
+            errors=self.errors,
+        )
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(asystem):
+    """return the log writer for the site, starting it if need be
+
+    Each site gets its own writer in each process.  Returns None if
+    buffering is turned off.
+    """
+    config = asystem.config
+    key = (config.instance_path, config.server_name)
+    writer = _writers.get(key)
+    if writer is not None and writer.pid == os.getpid():
+        return writer
+    if config.get('log', 'buffered', '1') in NEGATIVE:
+        return None
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None or writer.pid != os.getpid():
+            writer = LogWriter(
+                asystem.db.use(config.get('database', 'dbname', 'zoomdev')),
+                int(config.get('log', 'batch', 100)),
+                float(config.get('log', 'interval', 1)),
+                int(config.get('log', 'queue', 10000)),
+            )
+            writer.start()
+            _writers[key] = writer
+    return writer
+
+
+def writer_stats():
+    """return the counters of this process's log writers, by site"""
+    return dict(
+        (server_name, writer.stats())
+        for (_, server_name), writer in _writers.items()
+        if writer.pid == os.getpid()
+    )
+
+
+@atexit.register
+def stop_writers():
+    """write the queued log entries of this process's writers"""
+    for writer in _writers.values():
+        if writer.pid == os.getpid():
+            writer.stop()
 
 
 class Logger(object):
@@ -56,14 +235,13 @@ class Logger(object):
         if not (self.system.is_setup and self.system.logging):
             return False
 
+        if status == 'C':
+            rate = float(self.system.config.get('log', 'sample_complete', 1))
+            if rate < 1 and random.random() >= rate:
+                return True
+
         elapsed = self.system.elapsed_time * 1000
 
-        cmd = (
-            'insert into log '
-            '(app, route, status, user, address, '
-            'login, server, timestamp, elapsed, message)'
-            'values (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
-        )
         values = [
             self.system.app.name,
             (feed or '/'.join(system.request.route))[:80],
@@ -76,7 +254,12 @@ class Logger(object):
             elapsed,
             message
             ]
-        result = self.system.database(cmd, *values)
+
+        writer = get_writer(self.system)
+        if writer and writer.put(values):
+            return True
+
+        result = self.system.database(INSERT_LOG + ROW, *values)
 
         return result
 
@@ -15,48 +15,168 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from os import listdir
-from os.path import isdir, join, exists, abspath
-from application import Application
+import threading
+import time
+from os import listdir, stat
+from os.path import isdir, join, exists, abspath, dirname
+from application import Application, DEFAULT_SETTINGS, app_config, config_files
 from system import system
 from user import user
 from request import route, data
 import tools
+from context import ContextProxy, local
 
 DEFAULT_SYSTEM_APPS = ['register','profile','login','logout']
 DEFAULT_MAIN_APPS   = ['home','apps','users','groups','info']
 
 
-def get_apps(app_paths):
+def find_apps(app_paths):
+    """return the app.py pathnames of the apps in the app paths, by app name
+
+    Also returns the directories that were searched.
+    """
 
     def get_app_names(path):
         return [name.lower() for name in listdir(path) if name[0]!='.' and isdir(join(path, name))]
 
     apps = {}
+    searched = list(app_paths)
     for path in app_paths:
         for name in get_app_names(path):
+            searched.append(join(path, name))
             pathname = join(path, name, 'app.py')
             if exists(pathname) and not name in apps:
-                apps[name] = Application(name, pathname)
+                apps[name] = pathname
 
             elif isdir(join(path, name, 'apps')):
                 system_apps_path = join(path, name, 'apps')
+                searched.append(system_apps_path)
                 for system_app_name in get_app_names(system_apps_path):
+                    searched.append(join(system_apps_path, system_app_name))
                     system_app_pathname = join(system_apps_path, system_app_name, 'app.py')
                     if exists(system_app_pathname) and not system_app_name in apps:
-                        apps[system_app_name] = Application(system_app_name, system_app_pathname)
-    return apps
+                        apps[system_app_name] = system_app_pathname
+    return apps, searched
+
+
+def get_apps(app_paths):
+    return dict(
+        (name, Application(name, pathname))
+        for name, pathname in find_apps(app_paths)[0].items()
+    )
+
+
+def mtime(pathname):
+    """return the modification time of a file or None if it's missing"""
+    try:
+        return stat(pathname).st_mtime
+    except OSError:
+        return None
+
+
+class AppRegistry(object):
+    """the apps found in a set of app paths
+
+    The app directories are searched and the app config files read once
+    and then only again when the directories or files change.  Changes are
+    checked for at most once every interval seconds.
+    """
+
+    def __init__(self, app_paths, interval=1):
+        self.app_paths = app_paths
+        self.interval = interval
+        self.checked = None
+        self.directories = {}
+        self.configs = {}
+        self.initializers = []
+        self.lock = threading.Lock()
+
+    def read_configs(self, pathnames):
+        """return the app configs, reading only those that have changed"""
+        configs = {}
+        for name, pathname in pathnames.items():
+            app_dir = dirname(pathname)
+            mtimes = [mtime(filename) for filename in config_files(app_dir)]
+            cached = self.configs.get(name)
+            if cached is None or cached[:2] != (pathname, mtimes):
+                cached = (pathname, mtimes, app_config(app_dir, DEFAULT_SETTINGS))
+            configs[name] = cached
+        return configs
+
+    def refresh(self):
+        """bring the registry up to date"""
+        if self.checked is not None and time.time() - self.checked < self.interval:
+            return
+        with self.lock:
+            # another thread may have refreshed it while we waited
+            now = time.time()
+            if self.checked is not None and now - self.checked < self.interval:
+                return
+            changed = not self.directories or [
+                directory for directory, when in self.directories.items()
+                if mtime(directory) != when
+            ]
+            if changed:
+                pathnames, searched = find_apps(self.app_paths)
+                self.directories = dict((name, mtime(name)) for name in searched)
+                self.initializers = sorted(
+                    name for name, pathname in pathnames.items()
+                    if exists(join(dirname(pathname), 'initialize.py'))
+                )
+            else:
+                pathnames = dict(
+                    (name, pathname)
+                    for name, (pathname, _, _) in self.configs.items()
+                )
+            self.configs = self.read_configs(pathnames)
+            self.checked = now
+
+    def apps(self):
+        """return a new Application for each app, by name
+
+        Call refresh first to bring the registry up to date.
+        """
+        return dict(
+            (name, Application(name, pathname, dict(config)))
+            for name, (pathname, _, config) in self.configs.items()
+        )
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(app_paths):
+    """return the registry of apps for a set of app paths"""
+    key = tuple(app_paths)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            registry = _registries[key] = AppRegistry(app_paths)
+    return registry
 
 
 class Manager(object):
 
     def __init__(self):
         self.apps = []
+        self.initializers = []
 
     def setup(self):
         self.app_path  = system.config.get('apps','path')
-        self.app_paths = [abspath(path) for path in self.app_path.split(';') if isdir(path)]
-        self.apps = get_apps(self.app_paths)
+        sites_path = system.config.sites_path
+        self.app_paths = [
+            abspath(join(sites_path, path))
+            for path in self.app_path.split(';')
+            if isdir(join(sites_path, path))
+        ]
+        registry = get_registry(self.app_paths)
+        registry.refresh()
+        self.apps = registry.apps()
+        self.initializers = [
+            self.apps[name] for name in registry.initializers
+            if name in self.apps
+        ]
         if not self.apps:
             raise Exception('Applications Missing')
 
@@ -107,7 +227,7 @@ class Manager(object):
 
 
 if __name__ != '__main__':
-    manager = Manager()
+    manager = ContextProxy(local('manager', Manager))
 else:
     #system.config.setup()
     manager = Manager()
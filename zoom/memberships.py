@@ -0,0 +1,289 @@
+"""
+    zoom.memberships
+
+    group memberships
+
+    Users are members of the groups they are added to (dz_members) and of
+    the groups those groups belong to (dz_subgroups), and so on.  The group
+    graph is small and rarely changes so each process loads it once for
+    each database with the groups each group is part of worked out in
+    advance, and the groups of each user are kept once they have been
+    looked up.  Databases are told apart by name, as they are for the
+    settings.
+
+    Everything that changes dz_groups, dz_subgroups or dz_members goes
+    through the functions here, which bump the groups version in the
+    dz_versions table.  Processes check the version every VERSION_CHECK
+    seconds and load the graph again when it has changed.
+
+    The same functions maintain the dz_effective_members table, which has
+    a row for each group a user is a member of, directly or through other
+    groups, along with the group the user was added to that makes them a
+    member (via).  It answers who is in a group and what groups a user is
+    in with one indexed query each.  rebuild fills it from scratch.
+
+    >>> graph = GroupGraph(
+    ...     [(1, 'administrators'), (2, 'users'), (3, 'guests'),
+    ...      (4, 'everyone'), (5, 'managers')],
+    ...     [(2, 1), (4, 2), (4, 3), (5, 1)],
+    ... )
+    >>> graph.group_names([1])
+    ['administrators', 'users', 'everyone', 'managers']
+    >>> graph.group_names([2])
+    ['users', 'everyone']
+    >>> graph.group_names([3, 9])
+    ['guests', 'everyone']
+"""
+
+import threading
+import time
+
+from zoom import versions
+
+
+GROUPS = 'groups'
+VERSION_CHECK = 2  # seconds
+USERS_CACHED = 10000
+
+# pylint: disable=invalid-name
+_graphs = {}  # (graph, time checked) by database
+_effective = {}
+_lock = threading.Lock()
+
+
+class GroupGraph(object):
+    """the groups and the groups each of them is part of"""
+
+    def __init__(self, groups, subgroups, version=None):
+        self.version = version
+        self.names = {}
+        self.order = {}
+        for position, (groupid, name) in enumerate(groups):
+            self.names[groupid] = name.strip()
+            self.order[groupid] = position
+
+        parents = {}
+        for groupid, subgroupid in subgroups:
+            parents.setdefault(subgroupid, set()).add(groupid)
+
+        self.closure = {}
+        for groupid in set(self.names) | set(parents):
+            reached = set([groupid])
+            pending = [groupid]
+            while pending:
+                for parent in parents.get(pending.pop(), ()):
+                    if parent not in reached:
+                        reached.add(parent)
+                        pending.append(parent)
+            self.closure[groupid] = frozenset(reached)
+
+        self.users = {}
+
+    def group_ids(self, group_ids):
+        """return the groups and every group they are part of"""
+        result = set()
+        for groupid in group_ids:
+            result |= self.closure.get(groupid, frozenset([groupid]))
+        return result
+
+    def group_names(self, group_ids):
+        """return the names of the groups and every group they are part of
+
+        Names are returned in the order the groups were listed.
+        """
+        found = [g for g in self.group_ids(group_ids) if g in self.names]
+        return [self.names[g] for g in sorted(found, key=self.order.get)]
+
+
+def load_graph(db, version=None):
+    """load the group graph from the database"""
+    groups = [
+        (row[0], row[1] or '')
+        for row in db('select groupid, name from dz_groups')
+    ]
+    subgroups = [
+        (row[0], row[1])
+        for row in db('select groupid, subgroupid from dz_subgroups')
+    ]
+    return GroupGraph(groups, subgroups, version)
+
+
+def get_graph(db):
+    """return the current group graph
+
+    Without a dz_versions table the version can't be known so the graph is
+    loaded again every time it is checked.
+    """
+    key = getattr(db, 'name', None)
+    graph, checked = _graphs.get(key, (None, 0))
+    now = time.time()
+    if graph is None or now - checked > VERSION_CHECK:
+        version = versions.read(db, GROUPS)
+        if graph is None or version is None or version != graph.version:
+            graph = load_graph(db, version)
+        with _lock:
+            _graphs[key] = (graph, now)
+    return graph
+
+
+def user_groups(db, user_id):
+    """return the names of the groups a user is a member of"""
+    graph = get_graph(db)
+    names = graph.users.get(user_id)
+    if names is None:
+        group_ids = [
+            row[0] for row in
+            db('select groupid from dz_members where userid=%s', user_id)
+        ]
+        names = graph.group_names(group_ids)
+        if len(graph.users) >= USERS_CACHED:
+            graph.users.clear()
+        graph.users[user_id] = names
+    return list(names)
+
+
+def groups_changed(db):
+    """note that groups or memberships have changed"""
+    versions.bump(db, GROUPS)
+    with _lock:
+        _graphs.pop(getattr(db, 'name', None), None)
+
+
+def effective_table(db):
+    """return True if the database has a dz_effective_members table
+
+    A new, empty table is filled the first time it is found.
+    """
+    key = getattr(db, 'name', None)
+    found = _effective.get(key)
+    if found is None:
+        try:
+            rows = db('select userid from dz_effective_members limit 1')
+        except Exception:  # pylint: disable=broad-except
+            found = False
+        else:
+            if not len(rows) and len(db('select userid from dz_members limit 1')):
+                rebuild(db)
+            found = True
+        _effective[key] = found
+    return found
+
+
+def descendants(graph, group_id):
+    """return the groups that are part of a group, including the group"""
+    return [
+        groupid for groupid, reached in graph.closure.items()
+        if group_id in reached
+    ] or [group_id]
+
+
+def update_effective(db, vias, user_id=None, graph=None):
+    """update the effective memberships that come from direct memberships
+
+    The rows for memberships in the groups listed in vias, for one user or
+    for all of them, are replaced by rows for the groups those memberships
+    now make them members of.
+    """
+    if not effective_table(db):
+        return
+    graph = graph or load_graph(db)
+    for via in vias:
+        if user_id is None:
+            db('delete from dz_effective_members where via=%s', via)
+            users, params = '', ()
+        else:
+            db('delete from dz_effective_members where via=%s and userid=%s',
+               via, user_id)
+            users, params = ' and userid=%s', (user_id,)
+        for groupid in graph.closure.get(via, [via]):
+            db(
+                'insert into dz_effective_members (userid, groupid, via) '
+                'select userid, %s, groupid from dz_members '
+                'where groupid=%s' + users,
+                groupid, via, *params
+            )
+
+
+def rebuild(db):
+    """rebuild the dz_effective_members table
+
+    Returns the number of effective memberships.
+    """
+    db('delete from dz_effective_members')
+    _effective[getattr(db, 'name', None)] = True
+    vias = [row[0] for row in db('select distinct groupid from dz_members')]
+    update_effective(db, vias)
+    groups_changed(db)
+    for row in db('select count(*) from dz_effective_members'):
+        return row[0]
+
+
+def group_members(db, group_id):
+    """return the ids of the users that are members of a group
+
+    Includes the users that are members through other groups.
+    """
+    cmd = 'select distinct userid from dz_effective_members where groupid=%s'
+    return [row[0] for row in db(cmd, group_id)]
+
+
+def member_groups(db, user_id):
+    """return the ids of the groups a user is a member of
+
+    Includes the groups the user is a member of through other groups.
+    """
+    cmd = 'select distinct groupid from dz_effective_members where userid=%s'
+    return [row[0] for row in db(cmd, user_id)]
+
+
+def add_member(db, user_id, group_id):
+    """add a user to a group"""
+    db('insert into dz_members (userid, groupid) values (%s,%s)',
+       user_id, group_id)
+    update_effective(db, [group_id], user_id)
+    groups_changed(db)
+
+
+def remove_member(db, user_id, group_id):
+    """remove a user from a group"""
+    db('delete from dz_members where userid=%s and groupid=%s',
+       user_id, group_id)
+    update_effective(db, [group_id], user_id)
+    groups_changed(db)
+
+
+def remove_memberships(db, user_id):
+    """remove a user from every group"""
+    db('delete from dz_members where userid=%s', user_id)
+    if effective_table(db):
+        db('delete from dz_effective_members where userid=%s', user_id)
+    groups_changed(db)
+
+
+def add_subgroup(db, group_id, subgroup_id):
+    """make the members of a subgroup members of a group"""
+    db('insert into dz_subgroups (groupid, subgroupid) values (%s,%s)',
+       group_id, subgroup_id)
+    graph = load_graph(db)
+    update_effective(db, descendants(graph, subgroup_id), graph=graph)
+    groups_changed(db)
+
+
+def remove_subgroup(db, group_id, subgroup_id):
+    """stop a subgroup being part of a group"""
+    db('delete from dz_subgroups where groupid=%s and subgroupid=%s',
+       group_id, subgroup_id)
+    graph = load_graph(db)
+    update_effective(db, descendants(graph, subgroup_id), graph=graph)
+    groups_changed(db)
+
+
+def remove_group(db, group_id):
+    """delete a group along with its memberships"""
+    affected = descendants(load_graph(db), group_id)
+    db('delete from dz_members where groupid=%s', group_id)
+    db('delete from dz_subgroups where groupid=%s', group_id)
+    db('delete from dz_subgroups where subgroupid=%s', group_id)
+    db('delete from dz_groups where groupid=%s', group_id)
+    update_effective(db, affected)
+    groups_changed(db)
@@ -13,15 +13,31 @@
 
 import os
 import sys
+import zlib
 import traceback
 import json
-from StringIO import StringIO
 
+from .context import bind, current, capture_output, captured_output
+from . import static
+from . import pagecache
+from .cookies import SESSION_COOKIE_NAME, SUBJECT_COOKIE_NAME
 from .response import (
     PNGResponse, JPGResponse, CSSResponse, JavascriptResponse
 )
 
 
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 1024
+COMPRESSIBLE_TYPES = [
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/xhtml+xml',
+    'image/svg+xml',
+]
+
 SAMPLE_FORM = """<br><br>
 <form action="" id="dz_form" name="dz_form" method="POST" enctype="multipart/form-data">
     first name<input name="first_name" value="" type="text">
@@ -98,14 +114,11 @@ def app(request):
 
 def capture_stdout(request, handler, *rest):
     """Capture printed output for debugging purposes"""
-    real_stdout = sys.stdout
-    sys.stdout = StringIO()
+    capture_output()
     try:
         status, headers, content = handler(request, *rest)
     finally:
-        printed_output = sys.stdout.getvalue()
-        sys.stdout.close()
-        sys.stdout = real_stdout
+        printed_output = captured_output()
         content = content.replace('{printed_output}', printed_output)
     return status, headers, content
 
@@ -135,9 +148,8 @@ def serve_response(filename):
 def serve_static(request, handler, *rest):
     """Serve a static file"""
     if request.path.startswith('/static/'):
-        root_dir = request.instance
-        filename = os.path.join(root_dir, 'www', request.path[1:])
-        return serve_response(filename)
+        directory = os.path.join(request.instance, 'www', 'static')
+        return static.serve(request, directory, request.path[8:])
     else:
         return handler(request, *rest)
 
@@ -145,9 +157,8 @@ def serve_static(request, handler, *rest):
 def serve_themes(request, handler, *rest):
     """Serve a theme file"""
     if request.path.startswith('/themes/'):
-        root_dir = request.instance
-        filename = os.path.join(root_dir, request.path[1:])
-        return serve_response(filename)
+        directory = os.path.join(request.instance, 'themes')
+        return static.serve(request, directory, request.path[8:])
     else:
         return handler(request, *rest)
 
@@ -155,8 +166,8 @@ def serve_themes(request, handler, *rest):
 def serve_images(request, handler, *rest):
     """Serve an image file"""
     if request.path.startswith('/images/'):
-        filename = os.path.join(request.root, 'content', request.path[1:])
-        return serve_response(filename)
+        directory = os.path.join(request.root, 'content', 'images')
+        return static.serve(request, directory, request.path[8:])
     else:
         return handler(request, *rest)
 
@@ -164,9 +175,8 @@ def serve_images(request, handler, *rest):
 def serve_favicon(request, handler, *rest):
     """Serve a favicon file"""
     if request.path == '/favicon.ico':
-        root_dir = request.root
-        filename = os.path.join(root_dir, 'static', 'images', request.path[1:])
-        return serve_response(filename)
+        directory = os.path.join(request.root, 'static', 'images')
+        return static.serve(request, directory, 'favicon.ico')
     else:
         return handler(request, *rest)
 
@@ -181,6 +191,189 @@ def serve_html(request, handler, *rest):
         return handler(request, *rest)
 
 
+def accepted_encoding(accept_encoding):
+    """choose gzip or deflate based on an Accept-Encoding header
+
+    The encoding with the highest weight is chosen, gzip if they tie.
+
+    >>> accepted_encoding('gzip, deflate')
+    'gzip'
+    >>> accepted_encoding('deflate, gzip;q=0')
+    'deflate'
+    >>> accepted_encoding('gzip;q=0.1, deflate;q=1')
+    'deflate'
+    >>> accepted_encoding('identity') is None
+    True
+    """
+    weights = {}
+    for item in (accept_encoding or '').split(','):
+        parts = item.strip().split(';')
+        name = parts[0].strip().lower()
+        weight = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0
+        weights[name] = weight
+    chosen, chosen_weight = None, 0
+    for name in ('gzip', 'deflate'):
+        weight = weights.get(name, weights.get('*', 0))
+        if weight > chosen_weight:
+            chosen, chosen_weight = name, weight
+    return chosen
+
+
+def compression_settings(level, min_size):
+    """return the compression level and minimum size to use
+
+    Values not given come from the [compression] section of site.ini.
+    """
+    system = current('system')
+    if system is not None and system.is_setup:
+        get = system.config.get
+    else:
+        get = lambda section, option, default: default
+    if level is None:
+        level = get('compression', 'level', COMPRESS_LEVEL)
+    if min_size is None:
+        min_size = get('compression', 'min_size', COMPRESS_MIN_SIZE)
+    try:
+        return int(level), int(min_size)
+    except ValueError:
+        return COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+
+def compressor(level=None, min_size=None):
+    """return a handler that compresses responses
+
+    Responses are compressed with gzip or deflate, whichever the browser
+    prefers, if they are of a compressible type, at least min_size bytes
+    long and not already encoded.  The level and min_size not given come
+    from the [compression] settings of the site, and a level of 0 turns
+    compression off.
+    """
+
+    def compress(request, handler, *rest):
+        """Compress the response"""
+        status, headers, content = handler(request, *rest)
+        compress_level, compress_min_size = compression_settings(level, min_size)
+
+        names = dict((k.lower(), k) for k, _ in headers)
+        values = dict((k.lower(), v) for k, v in headers)
+
+        kind = values.get('content-type', '')
+        compressible = [t for t in COMPRESSIBLE_TYPES if kind.startswith(t)]
+        if not compressible or not status.startswith('200'):
+            return status, headers, content
+
+        vary = values.get('vary')
+        if vary and 'accept-encoding' not in vary.lower():
+            vary += ', Accept-Encoding'
+        vary = vary or 'Accept-Encoding'
+
+        encoding = accepted_encoding(request.env.get('HTTP_ACCEPT_ENCODING'))
+        if (not encoding or not compress_level or 'content-encoding' in values or
+                not isinstance(content, str) or len(content) < compress_min_size):
+            headers = [h for h in headers if h[0].lower() != 'vary']
+            return status, headers + [('Vary', vary)], content
+
+        if encoding == 'gzip':
+            engine = zlib.compressobj(
+                compress_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS
+            )
+        else:
+            engine = zlib.compressobj(compress_level)
+        content = engine.compress(content) + engine.flush()
+
+        replaced = ['content-length', 'vary', 'etag']
+        result = [h for h in headers if h[0].lower() not in replaced]
+        result.extend([
+            ('Content-Encoding', encoding),
+            ('Content-Length', str(len(content))),
+            ('Vary', vary),
+        ])
+        etag = values.get('etag')
+        if etag:
+            result.append((names['etag'], etag.rstrip('"') + '-' + encoding +
+                           (etag.endswith('"') and '"' or '')))
+        return status, result, content
+
+    return compress
+
+
+compress = compressor()
+
+
+def cache_pages(request, handler, *rest):
+    """Serve anonymous GET requests from the page cache
+
+    Only requests without a session or with a session known to be
+    anonymous are looked up.  A session with warnings, errors or messages
+    waiting to be shown isn't known to be anonymous until it has seen them.  Pages are only kept if they were rendered for
+    an anonymous user with a 200 status, don't set cookies other than the
+    session cookies (which are left out of the cached copy) and haven't
+    asked not to be cached, which includes any page with a CSRF token or
+    showing session messages, warnings or errors.
+    """
+    # pylint: disable=too-many-locals
+    cache = pagecache.cache
+    env = request.env
+    sid = request.session_token
+    if (request.method != 'GET' or not cache.is_guest(sid) or
+            env.get('HTTP_AUTHORIZATION') or env.get('REMOTE_USER')):
+        cache.bypasses += 1
+        return handler(request, *rest)
+
+    key = (
+        request.host,
+        request.path,
+        env.get('QUERY_STRING', ''),
+        cache.themes.get(request.host),
+        accepted_encoding(env.get('HTTP_ACCEPT_ENCODING')),
+    )
+    cached = cache.get(key)
+    if cached:
+        return cached
+
+    bind(page_ttl=None)
+    status, headers, content = handler(request, *rest)
+
+    system, user = current('system'), current('user')
+    if system is None or not system.is_setup or user is None:
+        return status, headers, content
+
+    cache.themes[request.host] = system.theme
+    if not getattr(user, 'is_anonymous', False):
+        cache.drop_guest(sid)
+        cache.drop_guest(system.session.sid)
+        return status, headers, content
+    session = system.session
+    if not (session.system_warnings or session.system_errors or
+            session.system_messages):
+        cache.add_guest(session.sid)
+
+    values = dict((k.lower(), v) for k, v in headers)
+    cookies = pagecache.cookie_names(values.get('set-cookie', ''))
+    session_cookies = [SESSION_COOKIE_NAME, SUBJECT_COOKIE_NAME]
+    cache_control = values.get('cache-control', '')
+    ttl = pagecache.page_ttl(system)
+    if (ttl > 0 and status.startswith('200') and isinstance(content, str) and
+            not [c for c in cookies if c not in session_cookies] and
+            'private' not in cache_control and
+            'no-store' not in cache_control):
+        kept = [h for h in headers if h[0].lower() != 'set-cookie']
+        cache.size = int(system.config.get(
+            'pagecache', 'size', pagecache.DEFAULT_SIZE
+        ))
+        key = key[:3] + (system.theme,) + key[4:]
+        cache.put(key, system.app.name, ttl, status, kept, content)
+
+    return status, headers, content
+
+
 def trap_errors(request, handler, *rest):
     """Trap exceptions and raise a server error"""
     try:
@@ -207,6 +400,8 @@ def handle(request, handlers=None):
         serve_themes,
         serve_images,
         serve_html,
+        cache_pages,
+        compress,
         #capture_stdout,
         #trap_errors,
         app,
@@ -8,7 +8,7 @@ from utils import id_for, OrderedSet
 from helpers import form_for, link_to, url_for
 from tools import as_actions, unisafe, websafe
 from html import ul
-import helpers, tools
+import helpers, tools, templates, tracing
 from system import system
 from user import user
 import log
@@ -75,12 +75,26 @@ class Page(object):
                 actions=as_actions(self.actions)))
 
 
+    @tracing.traced('render')
     def render(self):
 
+        # helpers in order of increasing precedence: the helpers module,
+        # system helpers and then app helpers
+        dispatch = dict(
+            (name, value) for name, value in helpers.__dict__.items()
+            if callable(value)
+        )
+        dispatch.update(system.helpers)
+        dispatch.update(getattr(system.app, 'helpers', {}))
+        page_names = set(dir(self.__class__))
+        results = system.helper_results
+        if results is None:
+            results = {}
+
         def handle(tag, *args, **keywords):
 
             # first try filling tag with page attributes
-            if hasattr(self, tag):
+            if tag in self.__dict__ or tag in page_names:
                 attr = getattr(self, tag)
                 if callable(attr):
                     repl = attr(self, *args, **keywords)
@@ -88,32 +102,20 @@ class Page(object):
                     repl = attr
                 return fill('<dz:','>', repl, handle)
 
-            # if that doesn't work look for an app helper
-            elif tag in system.app.helpers:
-                helper = system.app.helpers[tag]
-
-            # if that doesn't work look for a system helper
-            elif tag in system.helpers:
-                helper = system.helpers[tag]
-
-            # if that doesn't work look in the helpers module
-            elif tag in helpers.__dict__ and callable(helpers.__dict__[tag]):
-                """call functions in a module or module-like object"""
-                helper = helpers.__dict__[tag]
-
-            else:
-                helper = None
-
+            helper = dispatch.get(tag)
             if helper:
-                if callable(helper):
+                if getattr(helper, 'cacheable', False):
+                    key = (tag, args, tuple(sorted(keywords.items())))
+                    if key not in results:
+                        results[key] = helper(*args, **keywords)
+                    repl = results[key]
+                elif callable(helper):
                     repl = helper(*args, **keywords)
                 else:
                     repl = helper
 
                 return fill('<dz:','>', repl, handle)
 
-                
-
         def set_setting(thing, name):
             if thing=='template':
                 self.template = name
@@ -161,18 +163,22 @@ class Page(object):
         template_pathname = system.theme_path
         if template_pathname:
             template_filename = os.path.join(template_pathname, self.template+'.html')
-            if not os.path.exists(template_filename):
+            if templates.read(template_filename) is None:
                 if not self.template in ['index','content']:
                     log.logger.warning('template missing (%s)' % (template_filename))
                 template_filename = os.path.join(template_pathname, 'default.html')
-        self.tpl = template_pathname and tools.load(template_filename) or tools.load(DEFAULT_TEMPLATE)
+        template_source = template_pathname and template_filename
+        self.tpl = template_source and templates.read(template_source)
+        if not self.tpl:
+            template_source = DEFAULT_TEMPLATE
+            self.tpl = templates.read(DEFAULT_TEMPLATE) or ''
 
         page_header = self.render_header()
         save_content = self.content
         self.content = page_header + self.content
         save_title = self.title
         del self.title
-        content = fill('<dz:','>', self.tpl, handle)
+        content = fill('<dz:','>', self.tpl, handle, template_source)
         self.title = save_title
         self.content = save_content
         if self.callback:
@@ -0,0 +1,190 @@
+"""
+    zoom.pagecache
+
+    full page cache
+
+    Pages rendered for anonymous visitors are the same for every visitor so
+    the cache_pages middleware keeps them here for a while and serves them
+    again without setting up the system, the user or the app.  Pages are
+    kept by host, path, query, theme and content encoding.
+
+    Apps choose how long their pages are kept with the page_cache setting in
+    their config.ini (0 turns caching off for the app) and the site default
+    comes from the [pagecache] section of site.ini.  A page can also set its
+    own lifetime with cache_for or ask not to be cached with no_cache.  Apps
+    that change what their pages show call invalidate.
+
+    The cache belongs to the process so invalidating pages only affects the
+    process that does it; other processes drop their copies when they
+    expire.
+
+    >>> cache = PageCache(size=2)
+    >>> cache.put(('localhost', '/', ''), 'content', 60, '200 OK', [], 'hi')
+    >>> cache.get(('localhost', '/', ''))
+    ('200 OK', [], 'hi')
+    >>> cache.get(('localhost', '/about', '')) is None
+    True
+    >>> cache.invalidate(app='content')
+    1
+    >>> cache.get(('localhost', '/', '')) is None
+    True
+    >>> cache.stats()['hits'], cache.stats()['misses']
+    (1, 2)
+    >>> cookie_names('dz4sid=abc; expires=Mon; httponly  Set-Cookie: dz4sub=x')
+    ['dz4sid', 'dz4sub']
+"""
+
+import threading
+from collections import OrderedDict
+from timeit import default_timer as timer
+
+from zoom.context import bind, current
+
+
+DEFAULT_TTL = 60  # seconds
+DEFAULT_SIZE = 1000  # pages
+GUESTS = 100000  # session ids
+
+
+class PageCache(object):
+    """a cache of rendered pages
+
+    Holds up to size pages, dropping the least recently used first, along
+    with the session ids known to belong to anonymous visitors and the
+    theme each host was last rendered with.
+    """
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, size=DEFAULT_SIZE, guests=GUESTS):
+        self.size = size
+        self.guest_limit = guests
+        self.pages = OrderedDict()
+        self.guests = OrderedDict()
+        self.themes = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bypasses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        """return the status, headers and content of a cached page"""
+        now = timer()
+        with self.lock:
+            entry = self.pages.pop(key, None)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                return None
+            self.pages[key] = entry
+            self.hits += 1
+            return entry[2:]
+
+    def put(self, key, app, ttl, status, headers, content):
+        """cache a page for ttl seconds"""
+        # pylint: disable=too-many-arguments
+        with self.lock:
+            self.pages.pop(key, None)
+            self.pages[key] = (timer() + ttl, app, status, headers, content)
+            while len(self.pages) > self.size:
+                self.pages.popitem(last=False)
+            self.stores += 1
+
+    def invalidate(self, app=None, host=None, path=None):
+        """drop cached pages
+
+        Drops the pages made by an app, for a host or under a path, or
+        every page if nothing is specified, and returns how many were
+        dropped.
+        """
+        with self.lock:
+            keys = [
+                key for key, entry in self.pages.items()
+                if (app is None or entry[1] == app) and
+                (host is None or key[0] == host) and
+                (path is None or key[1].startswith(path))
+            ]
+            for key in keys:
+                del self.pages[key]
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def is_guest(self, sid):
+        """return True if a session is known to be anonymous"""
+        return not sid or sid in self.guests
+
+    def add_guest(self, sid):
+        """remember that a session is anonymous"""
+        with self.lock:
+            self.guests[sid] = True
+            while len(self.guests) > self.guest_limit:
+                self.guests.popitem(last=False)
+
+    def drop_guest(self, sid):
+        """forget that a session is anonymous"""
+        with self.lock:
+            self.guests.pop(sid, None)
+
+    def stats(self):
+        """return the cache counters"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return dict(
+                pages=len(self.pages),
+                size=self.size,
+                guests=len(self.guests),
+                hits=self.hits,
+                misses=self.misses,
+                hit_ratio=lookups and float(self.hits) / lookups or 0.0,
+                stores=self.stores,
+                bypasses=self.bypasses,
+                invalidations=self.invalidations,
+            )
+
+
+def cookie_names(value):
+    """return the names of the cookies set by a Set-Cookie header"""
+    return [
+        part.strip().split('=', 1)[0]
+        for part in value.split('Set-Cookie:')
+        if '=' in part
+    ]
+
+
+def cache_for(seconds):
+    """keep the page being rendered for a number of seconds"""
+    bind(page_ttl=seconds)
+
+
+def no_cache():
+    """don't cache the page being rendered"""
+    cache_for(0)
+
+
+def page_ttl(system):
+    """return how long the page just rendered should be kept"""
+    ttl = current('page_ttl')
+    if ttl is None:
+        config = getattr(system.app, 'config', None) or {}
+        ttl = config.get('page_cache')
+    if ttl is None:
+        ttl = system.config.get('pagecache', 'ttl', DEFAULT_TTL)
+    try:
+        return float(ttl)
+    except ValueError:
+        return 0
+
+
+def invalidate(app=None, host=None, path=None):
+    """drop cached pages (see PageCache.invalidate)"""
+    return cache.invalidate(app, host, path)
+
+
+def stats():
+    """return the page cache counters for this process"""
+    return cache.stats()
+
+
+# pylint: disable=invalid-name
+cache = PageCache()
@@ -0,0 +1,285 @@
+"""
+    zoom.pool
+
+    database connection pool
+
+    Connections are kept open in the process between requests.  Each
+    request leases the connections it needs from the pool and hands them
+    back when the system is released, so repeat requests reuse warm
+    connections instead of connecting to the database every time.
+
+    Connections handed back are rolled back, and given their autocommit
+    setting again, so whoever takes one next gets it in a known state.
+    Background threads (the log writer, the visit tracker and the session
+    sweeper) take their connections from a pool of their own, through
+    Database.use, so they can't keep requests waiting for a connection.
+
+    >>> import sqlite3
+    >>> connect = pooled(sqlite3.connect)
+    >>> connection = connect(database=':memory:')
+    >>> connection.execute('select 1').fetchall()
+    [(1,)]
+    >>> connection.close()
+    >>> pool = get_pool(sqlite3.connect, (), dict(database=':memory:'))
+    >>> pool.stats()['idle']
+    1
+    >>> connection.execute('select 2').fetchall()
+    [(2,)]
+    >>> pool.stats()['created']
+    1
+    >>> connection.close()
+    >>> background = connect.background(database=':memory:')
+    >>> background.execute('select 3').fetchall()
+    [(3,)]
+    >>> background.close()
+    >>> sorted(p['purpose'] for p in stats())
+    ['background', 'requests']
+"""
+
+import os
+import threading
+from timeit import default_timer as timer
+
+from zoom.exceptions import DatabaseException
+
+
+REQUESTS = 'requests'
+BACKGROUND = 'background'
+
+# pylint: disable=invalid-name
+_pools = {}
+_pools_lock = threading.Lock()
+_pid = os.getpid()
+
+
+class Pool(object):
+    """a pool of connections made by a factory
+
+    Up to max_size connections are made.  Once that many are in use
+    requests for another wait up to timeout seconds for one to be
+    released.  Connections that have been idle for more than check
+    seconds are tested before being handed out and replaced if they
+    no longer work.  Connections that are released are rolled back and, if
+    autocommit is given, have autocommit set to it; those that can't be
+    are discarded.
+    """
+    # pylint: disable=too-many-instance-attributes, too-many-arguments
+
+    def __init__(self, factory, args=(), keywords=None,
+                 min_size=0, max_size=10, timeout=30, check=5,
+                 autocommit=None):
+        self.factory = factory
+        self.args = args
+        self.keywords = keywords or {}
+        self.min_size = min_size
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self.check = check
+        self.autocommit = autocommit
+        self.idle = []
+        self.size = 0
+        self.condition = threading.Condition()
+
+        self.created = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0
+        self.peak = 0
+
+        for _ in range(min(min_size, self.max_size)):
+            self.size += 1
+            self.release(self.connect())
+
+    def connect(self):
+        """make a new connection"""
+        try:
+            connection = self.factory(*self.args, **self.keywords)
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        self.created += 1
+        return connection
+
+    def healthy(self, connection):
+        """test a connection"""
+        # pylint: disable=no-self-use
+        ping = getattr(connection, 'ping', None)
+        if ping is None:
+            return True
+        try:
+            ping()
+        except Exception:  # pylint: disable=broad-except
+            return False
+        return True
+
+    def acquire(self):
+        """take a connection from the pool, making one if need be"""
+        start = timer()
+        waited = False
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = self.timeout - (timer() - start)
+                if remaining <= 0:
+                    raise DatabaseException(
+                        'timed out waiting for a database connection'
+                    )
+                waited = True
+                self.condition.wait(remaining)
+            self.checkouts += 1
+            if waited:
+                self.waits += 1
+                self.wait_time += timer() - start
+            if self.idle:
+                connection, released = self.idle.pop()
+            else:
+                connection, released = None, None
+                self.size += 1
+            self.peak = max(self.peak, self.size - len(self.idle))
+
+        if connection is None:
+            return self.connect()
+
+        if timer() - released > self.check and not self.healthy(connection):
+            self.discard(connection)
+            with self.condition:
+                self.size += 1
+            return self.connect()
+
+        return connection
+
+    def reset(self, connection):
+        """undo what the last user of a connection left unfinished
+
+        Returns False if the connection couldn't be reset.
+        """
+        try:
+            connection.rollback()
+            if self.autocommit is not None:
+                connection.autocommit(self.autocommit)
+        except Exception:  # pylint: disable=broad-except
+            return False
+        return True
+
+    def release(self, connection):
+        """put a connection back in the pool"""
+        if not self.reset(connection):
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, timer()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        """close a connection and forget about it"""
+        with self.condition:
+            self.size -= 1
+            self.discarded += 1
+            self.condition.notify()
+        try:
+            connection.close()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+    def lease(self):
+        """return a connection that comes from the pool when it is used"""
+        return PooledConnection(self)
+
+    def stats(self):
+        """return the pool counters"""
+        with self.condition:
+            in_use = self.size - len(self.idle)
+            return dict(
+                size=self.size,
+                idle=len(self.idle),
+                in_use=in_use,
+                peak=self.peak,
+                max_size=self.max_size,
+                utilisation=float(in_use) / self.max_size,
+                created=self.created,
+                discarded=self.discarded,
+                checkouts=self.checkouts,
+                waits=self.waits,
+                wait_time=self.wait_time,
+            )
+
+
+class PooledConnection(object):
+    """a connection leased from a pool
+
+    The connection is taken from the pool when it is first used and closing
+    it puts it back, to be taken again if it is used after that.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+
+    def __getattr__(self, name):
+        if self.connection is None:
+            self.connection = self.pool.acquire()
+        return getattr(self.connection, name)
+
+    def close(self):
+        """return the connection to the pool"""
+        if self.connection is not None:
+            connection, self.connection = self.connection, None
+            self.pool.release(connection)
+
+    def __del__(self):
+        self.close()
+
+
+def get_pool(factory, args, keywords, purpose=REQUESTS, **options):
+    """return the pool for connections made with the given parameters
+
+    Connections for different purposes come from different pools.  Pools
+    belong to the process that made them so a worker forked from a process
+    with pools starts with none.
+    """
+    # pylint: disable=global-statement
+    global _pid
+    key = (purpose, factory, args, tuple(sorted(keywords.items())))
+    with _pools_lock:
+        if _pid != os.getpid():
+            _pools.clear()
+            _pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = Pool(factory, args, keywords, **options)
+    return pool
+
+
+def pooled(factory, **options):
+    """return a connect function that leases connections from a pool
+
+    Options are passed to the Pool when it is created.  The background
+    attribute of the function is a connect function that leases connections
+    from a separate pool, with autocommit off, for background threads.
+    """
+    def connect(*args, **keywords):
+        """lease a connection"""
+        return get_pool(factory, args, keywords, **options).lease()
+
+    background_options = dict(options, autocommit=False)
+
+    def background(*args, **keywords):
+        """lease a connection for a background thread"""
+        return get_pool(
+            factory, args, keywords, BACKGROUND, **background_options
+        ).lease()
+
+    connect.background = background
+    return connect
+
+
+def stats():
+    """return the counters of each of the pools in this process"""
+    with _pools_lock:
+        pools = _pools.items()
+    return [
+        dict(pool.stats(), database=pool.keywords.get('db', ''), purpose=key[0])
+        for key, pool in pools
+    ]
@@ -16,6 +16,7 @@ from timeit import default_timer as timer
 from types import ListType
 
 import zoom.cookies
+from zoom.context import ContextProxy, local
 
 
 SESSION_COOKIE_NAME = zoom.cookies.SESSION_COOKIE_NAME
@@ -202,7 +203,7 @@ class Request(object):
 
 
 # pylint: disable=invalid-name
-request = Request()
+request = ContextProxy(local('request', Request))
 webvars = Webvars()
-data = request.data
-route = request.route
+data = ContextProxy(local('data', lambda: request.data))
+route = ContextProxy(local('route', lambda: request.route))
@@ -4,17 +4,43 @@
     runs an instance of DataZoomer using the builtin Python WSGI server.
 
     >>> server = WSGIApplication()
+
+    The application can treat the modules imported while handling requests
+    in one of three ways:
+
+        persistent - modules stay loaded across requests (production)
+        reload     - modules whose source files change are evicted (development)
+        purge      - every module imported since startup is evicted (legacy)
+
+    Modules can't be evicted safely while other requests are importing
+    them, so in the reload and purge modes requests are handled one at a
+    time whatever the number of threads.
+
+    Requests can be handled by a pool of threads and by several worker
+    processes forked from one parent and sharing its listening socket.
+    Workers that have handled a set number of requests finish the requests
+    they are working on, exit and are replaced by fresh ones.
 """
 
 import os
 import sys
-from wsgiref.simple_server import make_server
+import errno
+import atexit
+import signal
+import socket
+import threading
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, ServerHandler
 from timeit import default_timer as timer
 
 from .request import Request
 from . import middleware
 
 
+PERSISTENT = 'persistent'
+RELOAD = 'reload'
+PURGE = 'purge'
+
+
 def reset_modules():
     """reset the modules to a known starting set
 
@@ -32,16 +58,114 @@ def reset_modules():
         init_modules = sys.modules.keys()
 
 
+def source_of(filename):
+    """return the source file for a module filename"""
+    if filename[-4:] in ('.pyc', '.pyo') and os.path.exists(filename[:-1]):
+        return filename[:-1]
+    return filename
+
+
+def refers_to(module, names):
+    """test to see if a module refers to any of the named modules"""
+    for value in vars(module).values():
+        try:
+            name = getattr(value, '__name__', None)
+            if isinstance(value, type(sys)) and name in names:
+                return True
+            if getattr(value, '__module__', None) in names:
+                return True
+        except Exception:  # pylint: disable=broad-except
+            # some objects answer attribute requests in unusual ways
+            continue
+    return False
+
+
+class ModuleReloader(object):
+    """evicts modules whose source files have changed
+
+    Modules loaded before the reloader was created are left alone.  The
+    source files of modules loaded after that are watched and when one of
+    them changes the module, along with any watched modules that refer to
+    it, is removed from sys.modules so it will be imported fresh by the
+    next request that needs it.
+
+    >>> reloader = ModuleReloader()
+    >>> reloader()
+    []
+    """
+
+    def __init__(self):
+        self.init_modules = set(sys.modules.keys())
+        self.mtimes = {}
+        self.lock = threading.Lock()
+
+    def watched(self):
+        """modules loaded since the reloader was created"""
+        for name, module in sys.modules.items():
+            if name not in self.init_modules and module is not None:
+                filename = getattr(module, '__file__', None)
+                if filename:
+                    yield name, module, source_of(filename)
+
+    def changed(self):
+        """return the names of the modules with changed source files"""
+        result = set()
+        for name, _, filename in self.watched():
+            try:
+                mtime = os.stat(filename).st_mtime
+            except OSError:
+                continue
+            if self.mtimes.setdefault(filename, mtime) != mtime:
+                self.mtimes[filename] = mtime
+                result.add(name)
+        return result
+
+    def __call__(self):
+        with self.lock:
+            evicted = self.changed()
+            if evicted:
+                dependents = True
+                while dependents:
+                    dependents = set(
+                        name for name, module, _ in self.watched()
+                        if name not in evicted and refers_to(module, evicted)
+                    )
+                    evicted |= dependents
+                for name in evicted:
+                    sys.modules.pop(name, None)
+        return sorted(evicted)
+
+
 class WSGIApplication(object):
     """a WSGI Application wrapper for DataZoomer
     """
     # pylint: disable=too-few-public-methods
-    def __init__(self, instance='.', handlers=None):
+    def __init__(self, instance='.', handlers=None, modules=PERSISTENT):
         self.handlers = handlers
         self.instance = os.path.abspath(instance)
+        self.modules = modules
+        self.lock = threading.Lock()
+        if modules == RELOAD:
+            self.reset = ModuleReloader()
+        elif modules == PURGE:
+            self.reset = reset_modules
+        elif modules == PERSISTENT:
+            self.reset = None
+        else:
+            raise Exception('unknown module handling %r' % modules)
 
     def __call__(self, environ, start_response):
-        reset_modules()
+        if self.reset:
+            # evicting modules while another thread is importing them
+            # breaks that thread's request, so when modules are being
+            # reset requests are handled one at a time
+            with self.lock:
+                self.reset()
+                return self.respond(environ, start_response)
+        return self.respond(environ, start_response)
+
+    def respond(self, environ, start_response):
+        """handle a request"""
         start_time = timer()
         request = Request(environ, self.instance, start_time)
         status, headers, content = middleware.handle(
@@ -49,23 +173,190 @@ class WSGIApplication(object):
             self.handlers,
         )
         start_response(status, headers)
-        return [content]
+        if isinstance(content, basestring):
+            return [content]
+        return content
+
+
+class RequestHandler(WSGIRequestHandler):
+    """handles a request telling the app how the server is handling others"""
 
+    def handle(self):
+        """handle a single HTTP request"""
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            return
+
+        if not self.parse_request():
+            return
+
+        handler = ServerHandler(
+            self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+            multithread=self.server.multithread,
+            multiprocess=self.server.multiprocess,
+        )
+        handler.request_handler = self
+        handler.run(self.server.get_app())
 
-def run(port=8004, instance='.'):
+
+class Server(WSGIServer):
+    """a WSGI server that handles requests with a pool of threads
+
+    If max_requests is set the server stops once it has handled that many
+    requests, letting those already under way finish first.
+    """
+
+    multiprocess = False
+
+    def __init__(self, address, threads=1, max_requests=0):
+        WSGIServer.__init__(self, address, RequestHandler)
+        self.threads = max(1, threads)
+        self.multithread = self.threads > 1
+        self.max_requests = max_requests
+        self.handled = 0
+        self.lock = threading.Lock()
+
+    def take_request(self):
+        """count a request, returning False once the limit has been reached"""
+        with self.lock:
+            if self.max_requests and self.handled >= self.max_requests:
+                return False
+            self.handled += 1
+            return True
+
+    def serve_requests(self):
+        """accept and handle requests until the limit has been reached"""
+        while self.take_request():
+            try:
+                request, client_address = self.get_request()
+            except socket.error:
+                return
+            if self.verify_request(request, client_address):
+                try:
+                    self.process_request(request, client_address)
+                except Exception:  # pylint: disable=broad-except
+                    self.handle_error(request, client_address)
+                    self.shutdown_request(request)
+            else:
+                self.shutdown_request(request)
+
+    def serve_forever(self, poll_interval=0.5):
+        """handle requests until the limit has been reached"""
+        workers = [
+            threading.Thread(target=self.serve_requests)
+            for _ in range(self.threads)
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        while [w for w in workers if w.is_alive()]:
+            for worker in workers:
+                worker.join(poll_interval)
+
+
+class PreforkServer(object):
+    """runs a server in several worker processes that share its socket
+
+    The parent process only looks after the workers, starting a new one
+    whenever one exits, until it is interrupted or terminated.
+    """
+
+    def __init__(self, server, workers=2):
+        if not hasattr(os, 'fork'):
+            raise Exception('worker processes are not supported here')
+        self.server = server
+        self.server.multiprocess = True
+        self.workers = max(1, workers)
+        self.children = set()
+        self.running = False
+
+    def spawn(self):
+        """start a worker process"""
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+        # the inherited SIGTERM handler stops the worker serving requests
+        try:
+            self.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            try:
+                # let exit handlers, such as the log writers, finish up
+                atexit._run_exitfuncs()  # pylint: disable=protected-access
+            finally:
+                os._exit(0)  # pylint: disable=protected-access
+
+    def stop(self, *_):
+        """stop starting workers and leave the main loop"""
+        self.running = False
+        raise KeyboardInterrupt
+
+    def serve_forever(self):
+        """start the workers and replace them as they exit"""
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+            while self.children:
+                try:
+                    pid, _ = os.wait()
+                except OSError as error:
+                    if error.errno == errno.EINTR:
+                        continue
+                    break
+                self.children.discard(pid)
+                if self.running:
+                    self.spawn()
+        finally:
+            self.running = False
+            for pid in self.children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+            for pid in self.children:
+                try:
+                    os.waitpid(pid, 0)
+                except OSError:
+                    pass
+            self.server.server_close()
+
+
+def run(port=8004, instance='.', modules=RELOAD,
+        workers=1, threads=1, max_requests=0):
     """run DataZoomer using internal HTTP Server
 
     The instance variable is the path of the directory on the system where the
     sites folder is located. (e.g. /work/web)
+
+    Changed modules are reloaded by default, which is what you want while
+    developing.  Pass modules=PERSISTENT to keep modules loaded.
+
+    Requests are handled by the given number of threads in each of the
+    given number of worker processes.  If max_requests is set each worker
+    process is replaced after it has handled that many requests.
     """
-    the_appliation = WSGIApplication(instance)
-    server = make_server('', int(port), the_appliation)
+    the_appliation = WSGIApplication(instance, modules=modules)
+    server = Server(('', int(port)), int(threads), int(max_requests))
+    server.set_app(the_appliation)
+    if int(workers) > 1 or int(max_requests):
+        server = PreforkServer(server, int(workers))
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         pass
 
 
+_application = None
+
+
 def application(environ, start_response):
     """run DataZoomer using external WSGI Server
 
@@ -73,9 +364,22 @@ def application(environ, start_response):
     directory.  In an typical installation the instance directory would be
     /work/web and the WSGI script would be located in /work/web/www.
 
+    The application is created on the first request and kept for the life
+    of the process, with modules staying loaded between requests.  To have
+    changed modules reloaded instead set the zoom.modules variable in the
+    WSGI environment (e.g. SetEnv zoom.modules reload).
+
     If you need to launch from somewhere else just build a function like this
     of your own and create the WSGIApplication instance using a path of your
     choosing.
     """
-    os.chdir(environ.get('DOCUMENT_ROOT'))
-    return WSGIApplication(instance='..')(environ, start_response)
+    # pylint: disable=global-statement, invalid-name
+    global _application
+    if _application is None or not environ.get('wsgi.multithread'):
+        os.chdir(environ.get('DOCUMENT_ROOT'))
+    if _application is None:
+        _application = WSGIApplication(
+            instance='..',
+            modules=environ.get('zoom.modules', PERSISTENT),
+        )
+    return _application(environ, start_response)
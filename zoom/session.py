@@ -15,12 +15,45 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-"""Stores session variables"""
+"""Stores session variables
 
+    Session values are kept by a session store.  Three stores are
+    available, chosen with the [sessions] store setting:
 
+        sql    - the dz_sessions table (the default)
+        file   - one file per session in a local directory
+        memory - an in-process LRU cache that writes changes behind to the
+                 dz_sessions table (single process servers only)
+
+    The memory store writes changed sessions when a later save finds them
+    more than [sessions] write_interval seconds old, when the session
+    sweeper wakes up, which it does every write_interval seconds, and when
+    the process exits.
+
+    Sessions are only written back to the store when their values change
+    or their expiry needs extending by more than the [sessions] refresh
+    setting (in seconds).
+
+    Expired sessions are deleted by a SessionSweeper thread that sweeps when
+    it starts and then every [sessions] sweep_interval seconds, deleting up
+    to sweep_batch sessions at a time.  Processes that only handle one
+    request, like CGI, can't keep the thread running, so they, and sites
+    with sweep_interval set to 0, delete a batch of expired sessions in the
+    request on a share of requests set by [sessions] sweep_chance.  CGI
+    sites should also run sweep_sessions as a background service job, and
+    can then set sweep_chance to 0.
+"""
+
+
+import os
 import time
+import atexit
 import pickle
 import uuid
+import random
+import logging
+import threading
+from collections import OrderedDict
 
 from zoom.request import request
 
@@ -31,15 +64,485 @@ class SessionExpiredException(Exception):
     pass
 
 SESSION_LIFE = 60 # time in minutes
+SESSION_REFRESH = 60 # time in seconds
+SWEEP_INTERVAL = 300 # time in seconds
+SWEEP_BATCH = 1000
+SWEEP_CHANCE = 0.01
+
+logger = logging.getLogger(__name__)
+
+
+class SQLSessionStore(object):
+    """stores sessions in the dz_sessions table"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def create(self, sid, expiry):
+        """create a session"""
+        cmd = "insert into dz_sessions values (%s, %s, 'A', '')"
+        self.db(cmd, sid, expiry)
+
+    def load(self, sid):
+        """return the expiry and value of an active session"""
+        cmd = (
+            'select expiry, value from dz_sessions '
+            'where sesskey=%s and expiry>%s and status="A"'
+        )
+        return self.db(cmd, sid, time.time()).first()
+
+    def save(self, sid, expiry, value):
+        """save the expiry and value of a session"""
+        cmd = 'update dz_sessions set expiry=%s, value=%s where sesskey=%s'
+        self.db(cmd, expiry, value, sid)
+
+    def touch(self, sid, expiry):
+        """extend the expiry of a session"""
+        cmd = 'update dz_sessions set expiry=%s where sesskey=%s'
+        self.db(cmd, expiry, sid)
+
+    def destroy(self, sid, keep=False):
+        """destroy a session, keeping it marked as deleted if keep is set"""
+        if keep:
+            cmd = 'update dz_sessions set expiry=%s, status="D" where sesskey=%s'
+            self.db(cmd, time.time(), sid)
+        else:
+            self.db('delete from dz_sessions where sesskey=%s', sid)
+
+    def collect_garbage(self, batch=SWEEP_BATCH, rounds=None):
+        """delete expired sessions, batch at a time, returning the count
+
+        Stops after rounds batches if rounds is given.  Destroyed sessions
+        that are kept are given an expiry of the time they were destroyed so
+        they are deleted along with expired ones.
+        """
+        cmd = 'delete from dz_sessions where expiry < %s limit %s'
+        now = time.time()
+        total = 0
+        while True:
+            self.db(cmd, now, batch)
+            count = self.db.rowcount or 0
+            total += count
+            if rounds is not None:
+                rounds -= 1
+            if count < batch or rounds == 0:
+                return total
+
+
+class FileSessionStore(object):
+    """stores sessions in files in a local directory
+
+        >>> import tempfile, shutil
+        >>> path = tempfile.mkdtemp()
+        >>> store = FileSessionStore(path)
+        >>> sid = uuid.uuid4().get_hex()
+        >>> store.create(sid, time.time() + 60)
+        >>> store.save(sid, time.time() + 60, 'value')
+        >>> store.load(sid)[1]
+        'value'
+        >>> store.destroy(sid)
+        >>> store.load(sid)
+        >>> shutil.rmtree(path)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def pathname(self, sid):
+        """return the name of the file for a session"""
+        return os.path.join(self.path, sid)
+
+    def create(self, sid, expiry):
+        """create a session"""
+        self.save(sid, expiry, '')
+
+    def load(self, sid):
+        """return the expiry and value of an active session"""
+        try:
+            with open(self.pathname(sid), 'rb') as data:
+                expiry, value = pickle.load(data)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if expiry > time.time():
+            return expiry, value
+
+    def save(self, sid, expiry, value):
+        """save the expiry and value of a session"""
+        pathname = self.pathname(sid)
+        temporary = '%s.%s' % (pathname, uuid.uuid4().get_hex())
+        with open(temporary, 'wb') as data:
+            pickle.dump((expiry, value), data, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, pathname)
+
+    def touch(self, sid, expiry):
+        """extend the expiry of a session"""
+        record = self.load(sid)
+        if record:
+            self.save(sid, expiry, record[1])
+
+    def destroy(self, sid, keep=False):
+        """destroy a session"""
+        # pylint: disable=unused-argument
+        try:
+            os.remove(self.pathname(sid))
+        except OSError:
+            pass
+
+    def collect_garbage(self, batch=SWEEP_BATCH, rounds=None):
+        """delete expired sessions, returning the count"""
+        # pylint: disable=unused-argument
+        now = time.time()
+        total = 0
+        for name in os.listdir(self.path):
+            pathname = os.path.join(self.path, name)
+            try:
+                with open(pathname, 'rb') as data:
+                    expiry, _ = pickle.load(data)
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                continue
+            if expiry < now:
+                self.destroy(name)
+                total += 1
+        return total
+
+
+class SessionCache(object):
+    """an LRU cache of sessions kept by the process
+
+    Changes are written behind to a backing store, all together, once
+    they are more than interval seconds old.  Changed sessions that are
+    dropped from the cache are written straight away.
+    """
+
+    def __init__(self, size=10000, interval=5):
+        self.size = size
+        self.interval = interval
+        self.sessions = OrderedDict()
+        self.dirty = set()
+        self.flushed = time.time()
+        self.lock = threading.RLock()
+
+    def get(self, sid):
+        """return the cached expiry and value of a session"""
+        with self.lock:
+            record = self.sessions.pop(sid, None)
+            if record is not None:
+                self.sessions[sid] = record
+            return record
+
+    def put(self, sid, expiry, value, backing, dirty=True):
+        """cache the expiry and value of a session"""
+        with self.lock:
+            self.sessions.pop(sid, None)
+            self.sessions[sid] = (expiry, value)
+            if dirty:
+                self.dirty.add(sid)
+            while len(self.sessions) > self.size:
+                old_sid, (old_expiry, old_value) = self.sessions.popitem(False)
+                if old_sid in self.dirty:
+                    self.dirty.discard(old_sid)
+                    backing.save(old_sid, old_expiry, old_value)
+
+    def drop(self, sid):
+        """forget a session"""
+        with self.lock:
+            self.sessions.pop(sid, None)
+            self.dirty.discard(sid)
+
+    def flush(self, backing, force=False):
+        """write changed sessions to the backing store"""
+        with self.lock:
+            if not force and time.time() - self.flushed < self.interval:
+                return
+            self.flushed = time.time()
+            dirty, self.dirty = self.dirty, set()
+            records = [(sid, self.sessions.get(sid)) for sid in dirty]
+        for sid, record in records:
+            if record is not None:
+                backing.save(sid, record[0], record[1])
+
+
+class MemorySessionStore(object):
+    """stores sessions in a SessionCache in front of a backing store
+
+        >>> import tempfile, shutil
+        >>> path = tempfile.mkdtemp()
+        >>> backing = FileSessionStore(path)
+        >>> store = MemorySessionStore(SessionCache(interval=60), backing)
+        >>> sid = uuid.uuid4().get_hex()
+        >>> store.create(sid, time.time() + 60)
+        >>> store.save(sid, time.time() + 60, 'value')
+        >>> store.load(sid)[1], backing.load(sid)[1]
+        ('value', '')
+        >>> store.cache.flush(backing, force=True)
+        >>> backing.load(sid)[1]
+        'value'
+        >>> shutil.rmtree(path)
+    """
+
+    def __init__(self, cache, backing):
+        self.cache = cache
+        self.backing = backing
+
+    def create(self, sid, expiry):
+        """create a session"""
+        self.backing.create(sid, expiry)
+        self.cache.put(sid, expiry, '', self.backing, dirty=False)
+
+    def load(self, sid):
+        """return the expiry and value of an active session"""
+        record = self.cache.get(sid)
+        if record is None:
+            record = self.backing.load(sid)
+            if record is not None:
+                expiry, value = record
+                self.cache.put(sid, expiry, value, self.backing, dirty=False)
+        if record is not None and record[0] > time.time():
+            return record
+
+    def save(self, sid, expiry, value):
+        """save the expiry and value of a session"""
+        self.cache.put(sid, expiry, value, self.backing)
+        self.cache.flush(self.backing)
+
+    def touch(self, sid, expiry):
+        """extend the expiry of a session"""
+        record = self.load(sid)
+        if record:
+            self.save(sid, expiry, record[1])
+
+    def destroy(self, sid, keep=False):
+        """destroy a session"""
+        self.cache.drop(sid)
+        self.backing.destroy(sid, keep)
+
+    def collect_garbage(self, batch=SWEEP_BATCH, rounds=None):
+        """delete expired sessions, returning the count"""
+        return self.backing.collect_garbage(batch, rounds)
+
+    def flush(self, force=False):
+        """write changed sessions to the backing store"""
+        self.cache.flush(self.backing, force)
+
+
+_session_cache = None
+_session_cache_lock = threading.Lock()
+
+
+def flush_at_exit(cache, db):
+    """write the changed sessions in the session cache to the database"""
+    try:
+        cache.flush(SQLSessionStore(db), force=True)
+        db.commit()
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('session flush failed')
+    finally:
+        db.close()
+
+
+def get_store(system, db=None):
+    """return the session store for the system
+
+    The SQL stores use db if given, otherwise system.db.
+    """
+    # pylint: disable=global-statement, invalid-name
+    global _session_cache
+    config = system.config
+    kind = config.get('sessions', 'store', 'sql')
+    db = db or system.db
+    if kind == 'file':
+        path = config.get(
+            'sessions', 'path',
+            os.path.join(system.instance_path, 'sessions')
+        )
+        return FileSessionStore(path)
+    elif kind == 'memory':
+        with _session_cache_lock:
+            if _session_cache is None:
+                _session_cache = SessionCache(
+                    int(config.get('sessions', 'cache_size', 10000)),
+                    float(config.get('sessions', 'write_interval', 5)),
+                )
+                atexit.register(
+                    flush_at_exit,
+                    _session_cache,
+                    system.db.use(config.get('database', 'dbname', 'zoomdev')),
+                )
+        return MemorySessionStore(_session_cache, SQLSessionStore(db))
+    elif kind == 'sql':
+        return SQLSessionStore(db)
+    raise Exception('unknown session store %r' % kind)
+
+
+class SessionSweeper(threading.Thread):
+    """deletes expired sessions in the background
+
+    Sweeps when it starts and then every interval seconds.  If the store
+    caches sessions it also writes the changed ones every time the cache's
+    write interval passes.  Keeps counts of the sweeps it has made and the sessions it has
+    deleted.  If the store uses a database connection of its own pass it
+    as db and it will be committed and closed after each sweep or write (the
+    connection isn't set to autocommit like those of requests are).
+    """
+
+    def __init__(self, store, interval=SWEEP_INTERVAL, batch=SWEEP_BATCH,
+                 db=None):
+        threading.Thread.__init__(self, name='session-sweeper')
+        self.daemon = True
+        self.store = store
+        self.db = db
+        self.interval = interval
+        self.batch = batch
+        self.pid = os.getpid()
+        self.sweeps = 0
+        self.reclaimed = 0
+        self.last_reclaimed = 0
+        self.last_sweep = None
+        self.errors = 0
+
+    def sweep(self):
+        """delete expired sessions"""
+        try:
+            count = self.store.collect_garbage(self.batch)
+            if self.db is not None:
+                self.db.commit()
+        except Exception:  # pylint: disable=broad-except
+            self.errors += 1
+            logger.exception('session sweep failed')
+            count = 0
+        finally:
+            if self.db is not None:
+                self.db.close()
+        self.sweeps += 1
+        self.reclaimed += count
+        self.last_reclaimed = count
+        self.last_sweep = time.time()
+        return count
+
+    def flush(self):
+        """write the sessions changed in the store's cache"""
+        try:
+            self.store.flush(force=True)
+            if self.db is not None:
+                self.db.commit()
+        except Exception:  # pylint: disable=broad-except
+            self.errors += 1
+            logger.exception('session flush failed')
+        finally:
+            if self.db is not None:
+                self.db.close()
+
+    def run(self):
+        cache = getattr(self.store, 'cache', None)
+        step = cache and min(self.interval, cache.interval) or self.interval
+        swept = None
+        while True:
+            if swept is None or time.time() - swept >= self.interval:
+                self.sweep()
+                swept = time.time()
+            if cache is not None:
+                self.flush()
+            time.sleep(step)
+
+    def stats(self):
+        """return the sweeper counters"""
+        return dict(
+            interval=self.interval,
+            batch=self.batch,
+            sweeps=self.sweeps,
+            reclaimed=self.reclaimed,
+            last_reclaimed=self.last_reclaimed,
+            last_sweep=self.last_sweep,
+            errors=self.errors,
+        )
+
+
+_sweepers = {}
+_sweepers_lock = threading.Lock()
+
+
+def start_sweeper(system):
+    """start the session sweeper for the site if it isn't running
+
+    Each site gets its own sweeper in each process.  Processes that only
+    handle one request and sites with the sweeper turned off sweep in the
+    request now and then instead.
+    """
+    config = system.config
+    key = (config.instance_path, config.server_name)
+    sweeper = _sweepers.get(key)
+    if sweeper is not None and sweeper.pid == os.getpid():
+        return sweeper
+    interval = float(config.get('sessions', 'sweep_interval', SWEEP_INTERVAL))
+    if interval <= 0 or request.module == 'cgi' or request.wsgi_runonce:
+        sweep_in_request(system)
+        return None
+    with _sweepers_lock:
+        sweeper = _sweepers.get(key)
+        if sweeper is None or sweeper.pid != os.getpid():
+            db = system.db.use(config.get('database', 'dbname', 'zoomdev'))
+            batch = int(config.get('sessions', 'sweep_batch', SWEEP_BATCH))
+            sweeper = SessionSweeper(get_store(system, db), interval, batch, db)
+            sweeper.start()
+            _sweepers[key] = sweeper
+    return sweeper
+
+
+def sweep_in_request(system):
+    """delete a batch of expired sessions on a share of requests
+
+    For processes that can't keep a sweeper running.
+    """
+    config = system.config
+    chance = float(config.get('sessions', 'sweep_chance', SWEEP_CHANCE))
+    if chance > 0 and random.random() < chance:
+        batch = int(config.get('sessions', 'sweep_batch', SWEEP_BATCH))
+        try:
+            get_store(system).collect_garbage(batch, rounds=1)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception('session sweep failed')
+
+
+def sweeper_stats():
+    """return the counters of this process's session sweepers, by site"""
+    return dict(
+        (server_name, sweeper.stats())
+        for (_, server_name), sweeper in _sweepers.items()
+        if sweeper.pid == os.getpid()
+    )
+
+
+def sweep_sessions():
+    """delete expired sessions of the current site
+
+    Suitable for running as a background service job.
+    """
+    from zoom.system import system
+    batch = int(system.config.get('sessions', 'sweep_batch', SWEEP_BATCH))
+    count = get_store(system).collect_garbage(batch)
+    logger.info('deleted %s expired sessions', count)
+    return count
 
 
 class Session(object):
     """manage user session data"""
 
-    def __init__(self, system):
+    def __init__(self, system, store=None):
         self._system = system
+        self._store = store
+        self._expiry = None
+        self._value = None
         self.ip_address = None
 
+    @property
+    def _sessions(self):
+        """the session store"""
+        if self._store is None:
+            self._store = get_store(self._system)
+        return self._store
+
     def __repr__(self):
         """
             >>> session = Session(None)
@@ -59,30 +562,25 @@ class Session(object):
 
 
     def collect_garbage(self):
-        """delete unused session records"""
+        """delete unused session records
+
+        Normally left to the session sweeper.
+        """
         if self._system.config.get('session', 'destroy', True):
-            cmd = 'delete from dz_sessions where (expiry < %s) or (status="D")'
-            self._system.db(cmd, time.time())
+            self._sessions.collect_garbage()
 
 
     def new_session(self, timeout=SESSION_LIFE):
         """create a new session"""
         def trysid(sid):
             """create and test the availability of a session id"""
-            database = self._system.database
-            cmd = "insert into dz_sessions values (%s, %s, 'A', '')"
-            try:
-                database(cmd, sid, expiry)
-                return 1
-            except:
-                raise
+            self._sessions.create(sid, expiry)
+            return 1
 
         def make_session_id():
             """make a new session id"""
             return uuid.uuid4().get_hex()
 
-        self.collect_garbage()
-
         crazyloop = 10
         expiry = time.time() + timeout * 60
         newsid = make_session_id()
@@ -98,30 +596,48 @@ class Session(object):
         if success:
             self.sid = newsid
             self.ip_address = request.ip_address
+            self._expiry = expiry
+            self._value = None
             return newsid
         else:
             raise Exception('Session error')
 
 
+    def renew_session(self, timeout=SESSION_LIFE):
+        """move the session values to a new session id
+
+        Done when a user logs in so that an id used before the login, which
+        may be known to others, doesn't become an authenticated session.
+        """
+        old_sid = self.sid
+        values = dict(
+            (k, v) for k, v in self.__dict__.items() if not k.startswith('_')
+        )
+        self.new_session(timeout)
+        for key in ['sid', 'ip_address']:
+            values.pop(key, None)
+        self.__dict__.update(values)
+        if old_sid:
+            keep = not self._system.config.get('sessions', 'destroy', True)
+            self._sessions.destroy(old_sid, keep)
+
+
     def load_session(self):
         """load a session"""
 
         def load_existing(sid):
             """load an existing session"""
-            database = self._system.database
-            cmd = (
-                'select * from dz_sessions '
-                'where sesskey=%s and expiry>%s and status="A"'
-            )
-            curs = database(cmd, sid, time.time())
-            if len(curs):
+            record = self._sessions.load(sid)
+            if record:
+                expiry, value = record
                 try:
-                    values = (curs[0].VALUE and \
-                              pickle.loads(curs[0].VALUE) or {})
+                    values = value and pickle.loads(value) or {}
                 except:
                     values = {}
                 for key in values:
                     self.__dict__[key] = values[key]
+                self._expiry = expiry
+                self._value = value
                 return True
 
         self.sid = sid = request.session_token
@@ -133,7 +649,11 @@ class Session(object):
 
 
     def save_session(self, sid=None, timeout=SESSION_LIFE):
-        """save a session"""
+        """save a session
+
+        The session is only written if its values have changed or its
+        expiry needs extending by more than the refresh setting.
+        """
         sid = sid or self.sid
 
         # using __dict__ method because getattr is overridden
@@ -145,9 +665,22 @@ class Session(object):
             if key[0] != '_':
                 values[key] = self.__dict__[key]
         value = pickle.dumps(values)
-        cmd = 'update dz_sessions set expiry=%s, value=%s where sesskey=%s'
-        database = self._system.database
-        database(cmd, expiry, value, sid)
+
+        if not sid:
+            # destroyed
+            pass
+        elif value != self._value or sid != self.sid:
+            self._sessions.save(sid, expiry, value)
+        else:
+            refresh = float(self._system.config.get(
+                'sessions', 'refresh', SESSION_REFRESH
+            ))
+            if expiry - (self._expiry or 0) > refresh:
+                self._sessions.touch(sid, expiry)
+            else:
+                expiry = self._expiry
+        self._value = value
+        self._expiry = expiry
         return timeout_in_seconds
 
 
@@ -155,20 +688,17 @@ class Session(object):
         """destroy a session"""
         sid = sid or self.sid
         system = self._system
+        store = self._sessions
         try:
             self.__dict__.clear()
         finally:
             self._system = system
+            self._store = store
+            self._expiry = None
+            self._value = None
 
-        if self._system.config.get('sessions', 'destroy', True):
-            cmd = 'delete from dz_sessions where sesskey=%s'
-            self._system.db(cmd, sid)
-        else:
-            cmd = """
-            update dz_sessions
-            set expiry=%s, status="D"
-            where sesskey=%s"""
-            self._system.db(cmd, time.time(), sid)
+        keep = not self._system.config.get('sessions', 'destroy', True)
+        store.destroy(sid, keep)
 
 
     def __getattr__(self, name):
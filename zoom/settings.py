@@ -2,13 +2,55 @@
     settings.py
 
     manages system and application settings
+
+    Settings are read once per process and shared by every request.  Saving
+    a setting bumps the settings version in the dz_versions table and
+    processes check the version every VERSION_CHECK seconds, reading the
+    settings again when it has changed.  The settings of each database are
+    kept under the database name.
 """
 
+import threading
+import time
+
 from utils import Record
+from zoom import versions
 
 NEGATIVE = ['NO', 'No', 'nO', 'no', 'N', 'n', False, '0', 0]
 POSTITIVE = ['yes', 'y', True, '1', 1]
 
+SETTINGS = 'settings'
+VERSION_CHECK = 2  # seconds
+
+# pylint: disable=invalid-name
+_snapshots = {}
+_lock = threading.Lock()
+
+
+def snapshot(store):
+    """return the settings in a store as a dict of values by key"""
+    key = (getattr(store.db, 'name', None), store.kind)
+    now = time.time()
+    cached = _snapshots.get(key)
+    if cached is None or now - cached[1] > VERSION_CHECK:
+        version = versions.read(store.db, SETTINGS)
+        if cached is None or version is None or version != cached[0]:
+            values = dict((r['key'], r['value']) for r in store)
+        else:
+            values = cached[2]
+        cached = (version, now, values)
+        with _lock:
+            _snapshots[key] = cached
+    return cached[2]
+
+
+def settings_changed(store):
+    """note that the settings in a store have changed"""
+    versions.bump(store.db, SETTINGS)
+    with _lock:
+        _snapshots.pop((getattr(store.db, 'name', None), store.kind), None)
+
+
 class SystemSettings(Record):
     @classmethod
     def defaults(cls, config):
@@ -73,8 +115,8 @@ class SettingsManager(object):
     def load(self):
         prefix = self.context + '.'
         return dict(
-                (r['key'][len(prefix):],r['value'])
-                for r in self.store if r['key'].startswith(prefix))
+                (k[len(prefix):],v)
+                for k,v in self.values.items() if k.startswith(prefix))
 
     def put(self, key, value):
         k = '.'.join((self.context, key))
@@ -83,7 +125,11 @@ class SettingsManager(object):
             r = SystemSettings(key=k)
         r['value'] = value
         self.store.put(r)
-        self.values[k] = value
+        settings_changed(self.store)
+        self.refresh()
+
+    def refresh(self):
+        self.values = snapshot(self.store)
 
     def set(self, key, value):
         return self.put(key, value)
@@ -143,6 +189,8 @@ class Settings(object):
         >>> settings.set('site_name', 'datazoomer.com')
         >>> settings.get('site_name', 'no_site')
         'datazoomer.com'
+        >>> Settings(settings_store, system.config, 'system').get('site_name')
+        'datazoomer.com'
 
         >>> app_store = EntityStore(system.database, ApplicationSettings)
         >>> myapp = Application('myapp', 'apps/activity/app.py')
@@ -170,10 +218,10 @@ class Settings(object):
         self.db = store.db
 
         self.application_settings_store = EntityStore(self.db, ApplicationSettings)
-        self._application_dict = {p.key: p.value for p in self.application_settings_store}
+        self._application_dict = snapshot(self.application_settings_store)
 
         self.user_settings_store = EntityStore(self.db, UserSystemSettings)
-        self._user_dict = {p.key: p.value for p in self.user_settings_store}
+        self._user_dict = snapshot(self.user_settings_store)
 
         self.store = store
         self.klass = store.klass
@@ -199,7 +247,7 @@ class Settings(object):
     def refresh(self):
         config = self.config
         self.defaults = self.klass.defaults(config)
-        self.values = dict((r['key'],r['value']) for r in self.store)
+        self.values = snapshot(self.store)
 
     def put(self, key, value):
         k = '.'.join((self.context,key))
@@ -208,7 +256,8 @@ class Settings(object):
             r = SystemSettings(key=k)
         r['value'] = value
         self.store.put(r)
-        self.values[k] = value
+        settings_changed(self.store)
+        self.refresh()
 
     def set(self, key, value):
         return self.put(key, value)
@@ -226,6 +275,7 @@ class Settings(object):
     def reset(self, key):
         k = '.'.join((self.context,key))
         self.store.delete(self.store.first(key=k))
+        settings_changed(self.store)
         self.refresh()
 
     def save(self, settings):
@@ -236,6 +286,6 @@ class Settings(object):
     def load(self):
         prefix = self.context + '.'
         return dict(
-                (r['key'][len(prefix):],r['value'])
-                for r in self.store if r['key'].startswith(prefix))
+                (k[len(prefix):],v)
+                for k,v in self.values.items() if k.startswith(prefix))
 
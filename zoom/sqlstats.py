@@ -0,0 +1,269 @@
+"""
+    zoom.sqlstats
+
+    SQL statement statistics
+
+    Statements run through zoom.db or the legacy zoom.database are reduced
+    to fingerprints, the statement with its values taken out, and counted
+    along with the time they take, for the current request and for the
+    process.
+
+    Statements that take longer than the [sqlstats] slow setting are
+    written to the slow query log.  Requests that run the same fingerprint
+    more than [sqlstats] repeats times, which is usually a query inside a
+    loop (an EntityStore lookup per record, say), are flagged and logged
+    too.  The most recent of both are kept for the info app.
+
+    Slow statements are logged as fingerprints so the values they were run
+    with, which can be passwords or personal data, stay out of the log and
+    the info app.  Setting [sqlstats] parameters to 1 logs the statements
+    as they were run along with their parameters instead.
+
+    >>> fingerprint("select * from dz_users where userid=12 and name='joe'")
+    'select * from dz_users where userid=? and name=?'
+    >>> fingerprint('SELECT *\\n FROM attributes WHERE row_id IN (1, 2, %s)')
+    'select * from attributes where row_id in (...)'
+    >>> fingerprint('insert into t (a, b) values (%s, %s), (%s, %s)')
+    'insert into t (a, b) values (...)'
+
+    >>> stats = QueryStats()
+    >>> for elapsed in [0.1, 0.2, 0.3]:
+    ...     stats.add('select 1', elapsed)
+    >>> [(s['fingerprint'], s['count'], s['p95']) for s in stats.report()]
+    [('select 1', 3, 0.3)]
+
+    >>> bind(sql_stats=RequestStats(slow=0.5))
+    >>> observe('select * from dz_users where password=%s', 0.6, ('secret',))
+    >>> slow_statements[-1]['statement'], slow_statements[-1]['parameters']
+    ('select * from dz_users where password=?', '')
+    >>> bind(sql_stats=None)
+"""
+
+import os
+import re
+import math
+import time
+import random
+import threading
+from collections import deque
+from timeit import default_timer as timer
+
+from zoom.context import bind, current
+from zoom import tracing
+
+
+DEFAULT_SLOW = 1.0  # seconds
+DEFAULT_REPEATS = 50
+SAMPLES = 200  # times kept per fingerprint for percentiles
+FINGERPRINTS = 5000  # statements remembered
+STATEMENTS = 2000  # fingerprints counted per process
+RECENT = 100  # slow statements and flagged requests kept
+OTHER = '(other statements)'
+
+strings = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+numbers = re.compile(r'\b\d+(?:\.\d+)?\b')
+markers = re.compile(r'%(?:\(\w+\))?s')
+lists = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+repeats = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+spaces = re.compile(r'\s+')
+
+# pylint: disable=invalid-name
+_fingerprints = {}
+_lock = threading.Lock()
+
+
+def fingerprint(sql):
+    """return a statement with its values taken out"""
+    result = _fingerprints.get(sql)
+    if result is None:
+        result = strings.sub('?', str(sql))
+        result = numbers.sub('?', markers.sub('?', result))
+        result = spaces.sub(' ', result).strip().lower()
+        result = repeats.sub('(...)', lists.sub('(...)', result))
+        if len(_fingerprints) >= FINGERPRINTS:
+            _fingerprints.clear()
+        _fingerprints[sql] = result
+    return result
+
+
+def percentile(values, share):
+    """return the value a share of the values are at or below"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, int(math.ceil(share * len(ordered))) - 1)]
+
+
+class QueryStats(object):
+    """the count, time and time percentiles of statements by fingerprint"""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.statements = {}
+
+    def add(self, name, elapsed):
+        """count a statement"""
+        entry = self.statements.get(name)
+        if entry is None:
+            if self.limit and len(self.statements) >= self.limit:
+                name = OTHER
+            entry = self.statements.setdefault(name, [0, 0.0, 0.0, []])
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        samples = entry[3]
+        if len(samples) < SAMPLES:
+            samples.append(elapsed)
+        else:
+            index = random.randrange(entry[0])
+            if index < SAMPLES:
+                samples[index] = elapsed
+
+    def report(self):
+        """return the statistics of each fingerprint, most time first"""
+        result = [
+            dict(
+                fingerprint=name,
+                count=count,
+                total=total,
+                mean=total / count,
+                max=longest,
+                p95=percentile(samples, 0.95),
+            )
+            for name, (count, total, longest, samples)
+            in self.statements.items()
+        ]
+        return sorted(result, key=lambda a: -a['total'])
+
+
+class RequestStats(QueryStats):
+    """the statements of a request"""
+
+    # pylint: disable=too-many-arguments
+
+    def __init__(self, slow=DEFAULT_SLOW, repeats=DEFAULT_REPEATS, log=None,
+                 parameters=False):
+        QueryStats.__init__(self)
+        self.slow = slow
+        self.repeats = repeats
+        self.log = log
+        self.parameters = parameters
+
+    def repeated(self):
+        """return the fingerprints run more than repeats times"""
+        return [
+            (name, entry[0], entry[1])
+            for name, entry in self.statements.items()
+            if self.repeats and entry[0] > self.repeats
+        ]
+
+
+process = QueryStats(STATEMENTS)
+slow_statements = deque(maxlen=RECENT)
+flagged_requests = deque(maxlen=RECENT)
+
+
+def write_log(pathname, line):
+    """add a line to the slow query log"""
+    if pathname:
+        try:
+            path = os.path.dirname(pathname)
+            if path and not os.path.isdir(path):
+                os.makedirs(path)
+            with _lock:
+                with open(pathname, 'a') as log:
+                    log.write('{} {}\n'.format(timestamp(), line))
+        except (IOError, OSError):
+            # losing a line of the slow query log isn't worth failing for
+            pass
+
+
+def timestamp():
+    """return the time for the slow query log"""
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def observe(sql, elapsed, params=None):
+    """count a statement that took elapsed seconds"""
+    name = fingerprint(sql)
+    with _lock:
+        process.add(name, elapsed)
+    stats = current('sql_stats')
+    if stats is not None:
+        stats.add(name, elapsed)
+        if stats.slow and elapsed >= stats.slow:
+            if stats.parameters:
+                statement, values = ' '.join(str(sql).split()), repr(params)
+            else:
+                statement, values = name, ''
+            slow_statements.append(dict(
+                time=timestamp(),
+                elapsed=elapsed,
+                statement=tracing.statement(statement),
+                parameters=tracing.statement(values),
+            ))
+            write_log(stats.log, 'slow {:.3f}s {}{}'.format(
+                elapsed, statement, values and ' -- ' + values
+            ))
+
+
+def measure(db, sql, params, start):
+    """record a statement run on a database that started at start"""
+    elapsed = timer() - start
+    if db.debug:
+        db.log.append('  SQL ({:5.1f} ms): {!r} - {!r}'.format(
+            elapsed * 1000,
+            sql,
+            params,
+        ))
+    if tracing.active():
+        tracing.record('sql', start, statement=tracing.statement(sql))
+    observe(sql, elapsed, params)
+
+
+def start(config, instance_path):
+    """start counting the statements of the current request"""
+    slow = config.get('sqlstats', 'slow', DEFAULT_SLOW)
+    repeats = config.get('sqlstats', 'repeats', DEFAULT_REPEATS)
+    log = config.get(
+        'sqlstats',
+        'log',
+        os.path.join(instance_path, 'logs', 'slow_queries.log')
+    )
+    parameters = config.get('sqlstats', 'parameters', '0') == '1'
+    try:
+        bind(sql_stats=RequestStats(float(slow), int(repeats), log, parameters))
+    except ValueError:
+        bind(sql_stats=RequestStats(log=log, parameters=parameters))
+
+
+def finish(**attributes):
+    """flag the current request if it repeated statements
+
+    Returns the statistics of the request.
+    """
+    stats = current('sql_stats')
+    if stats is None:
+        return None
+    bind(sql_stats=None)
+    for name, count, total in stats.repeated():
+        flagged_requests.append(dict(
+            attributes,
+            time=timestamp(),
+            fingerprint=name,
+            count=count,
+            total=total,
+        ))
+        write_log(stats.log, 'repeated {}x {:.3f}s {} -- {}'.format(
+            count,
+            total,
+            name,
+            ' '.join('{}={}'.format(*i) for i in sorted(attributes.items())),
+        ))
+    return stats
+
+
+def stats():
+    """return the statement statistics of this process"""
+    with _lock:
+        return process.report()
@@ -27,7 +27,9 @@ class WSGIApplication(object):
                 #self.handlers,
                 )
         start_response(status, headers)
-        return [content]
+        if isinstance(content, basestring):
+            return [content]
+        return content
 
 
 
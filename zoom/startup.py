@@ -14,18 +14,22 @@ import timeit
 import sys
 import urllib
 
-from zoom.system import system, SystemTimer
+from zoom.system import system, System, SystemTimer
 from zoom.log import logger
 from zoom.page import Page
 from zoom.tools import redirect_to, load_template, htmlquote
 from zoom.response import HTMLResponse
 from zoom.session import SessionExpiredException
 from zoom.request import request, data, route
-from zoom.user import user
-from zoom.manager import manager
+from zoom.user import user, User
+from zoom.manager import manager, Manager
 from zoom.visits import visited
 from zoom.cookies import set_session_cookie
 from zoom.exceptions import UnauthorizedException
+from zoom.context import bind, capture_output, captured_output
+import zoom.loader
+import zoom.tracing as tracing
+import zoom.sqlstats as sqlstats
 
 
 NEW_INSTALL_MESSAGE = """
@@ -90,24 +94,23 @@ def generate_response(instance_path, start_time=None):
     """generate response to web request"""
 
     profiler = None
+    response = None
     debugging = True
 
     system_timer = SystemTimer(start_time)
 
-    # capture stdout
-    real_stdout = sys.stdout
-    sys.stdout = StringIO.StringIO()
+    capture_output()
     try:
         try:
             # initialize context
             system.setup(instance_path, request.server, system_timer)
-            system_timer.add('system initializated')
+            system_timer.add('system initializated', 'system setup')
 
             user.setup()
-            system_timer.add('user initializated')
+            system_timer.add('user initializated', 'user setup')
 
             manager.setup()
-            system_timer.add('manager initializated')
+            system_timer.add('manager initializated', 'manager setup')
 
             if user.is_disabled:
                 # we know who the user is, and their account is disabled
@@ -134,12 +137,13 @@ def generate_response(instance_path, start_time=None):
             requested_app_name = manager.requested_app_name()
             default_app_name = manager.default_app_name()
 
-            os.chdir(system.config.sites_path)
+            if not request.wsgi_multithread:
+                os.chdir(system.config.sites_path)
 
             if not request.route:
                 request.route.append(default_app_name)
 
-            for app in manager.apps.values():
+            for app in manager.initializers:
                 app.initialize(request)
 
             if manager.can_run(requested_app_name):
@@ -150,11 +154,11 @@ def generate_response(instance_path, start_time=None):
                 if profiler:
                     profiler.enable()
 
-                system_timer.add('app ready')
+                system_timer.add('app ready', 'dispatch')
 
                 response = system.app.run(request)
 
-                system_timer.add('app returned')
+                system_timer.add('app returned', 'app')
 
                 if profiler:
                     profiler.disable()
@@ -265,12 +269,21 @@ def generate_response(instance_path, start_time=None):
                 t
             ]))
     finally:
-        printed_output = sys.stdout.getvalue()
-        sys.stdout.close()
-        sys.stdout = real_stdout
+        printed_output = captured_output()
         logger.complete()
-
-    system.release()
+        sqlstats.finish(
+            app=system.app and system.app.name,
+            uri=request.uri,
+        )
+        if tracing.active():
+            tracing.finish(
+                system.config,
+                os.path.join(system.instance_path, 'traces'),
+                app=system.app and system.app.name,
+                user=user.__dict__.get('login_id'),
+                status=getattr(response, 'status', None),
+            )
+        system.release()
 
     if hasattr(response, 'printed_output'):
         response.printed_output = printed_output.replace(
@@ -293,15 +306,20 @@ def run_as_cgi(instance_path='..', start_time=timeit.default_timer()):
 
 
 def run_as_app(a_request):
-    """run as a wsgi style app"""
-
-    request.__dict__ = a_request.__dict__
-
-    data.clear()
-    data.update(request.data)
-
-    del route[:]
-    route.extend(request.route)
+    """run as a wsgi style app
+
+    Each request gets its own system, user and manager objects, bound to
+    the thread handling the request.
+    """
+    bind(
+        request=a_request,
+        data=dict(a_request.data),
+        route=list(a_request.route),
+        system=System(),
+        user=User(),
+        manager=Manager(),
+    )
+    zoom.loader.reset()
 
     if not os.path.exists(os.path.join(request.instance, 'dz.conf')):
         response = HTMLResponse(NEW_INSTALL_MESSAGE)
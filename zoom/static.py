@@ -0,0 +1,245 @@
+"""
+    zoom.static
+
+    serves static files
+
+    Files are served with the headers browsers need to cache them (ETag,
+    Last-Modified and Cache-Control) and conditional requests for files
+    that haven't changed are answered with 304 Not Modified.  Single byte
+    ranges are supported and a precompressed sibling (e.g. site.css.gz) is
+    sent instead of the file itself to browsers that accept gzip.  Large
+    files are streamed, using the server's wsgi.file_wrapper if it has one.
+
+    The results of stat calls are kept for STAT_LIFE seconds so busy files
+    aren't checked on every request.  The STAT_CACHE_SIZE files used most
+    recently are kept, and the MISSING_CACHE_SIZE names most recently found
+    not to be files are kept apart from them so requests for made up names
+    can't push out the files that are really served.
+
+    >>> content_type('site.css')
+    'text/css; charset=utf-8'
+    >>> content_type('logo.png')
+    'image/png'
+    >>> content_type('font.woff2')
+    'font/woff2'
+    >>> parse_range('bytes=0-99', 1000)
+    (0, 99)
+    >>> parse_range('bytes=-100', 1000)
+    (900, 999)
+    >>> parse_range('bytes=900-', 1000)
+    (900, 999)
+    >>> parse_range('bytes=1000-', 1000) is None
+    True
+"""
+
+import os
+import time
+import threading
+import mimetypes
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+
+STAT_LIFE = 1  # seconds
+MAX_AGE = 3600  # seconds
+BLOCK_SIZE = 64 * 1024
+SMALL_FILE = 64 * 1024
+STAT_CACHE_SIZE = 1000
+MISSING_CACHE_SIZE = 100
+
+mimetypes.init()
+for _extension, _type in [
+        ('.css', 'text/css'),
+        ('.js', 'application/javascript'),
+        ('.json', 'application/json'),
+        ('.map', 'application/json'),
+        ('.svg', 'image/svg+xml'),
+        ('.ico', 'image/x-icon'),
+        ('.webp', 'image/webp'),
+        ('.woff', 'font/woff'),
+        ('.woff2', 'font/woff2'),
+        ('.ttf', 'font/ttf'),
+        ('.otf', 'font/otf'),
+        ('.eot', 'application/vnd.ms-fontobject'),
+        ('.md', 'text/markdown'),
+        ('.mp4', 'video/mp4'),
+        ('.webm', 'video/webm'),
+]:
+    mimetypes.add_type(_type, _extension)
+
+TEXT_TYPES = ['application/javascript', 'application/json', 'image/svg+xml']
+
+# pylint: disable=invalid-name
+_stats = OrderedDict()
+_missing = OrderedDict()
+_stats_lock = threading.Lock()
+
+
+def content_type(filename):
+    """return the content type for a filename"""
+    kind, _ = mimetypes.guess_type(filename, strict=False)
+    kind = kind or 'application/octet-stream'
+    if kind.startswith('text/') or kind in TEXT_TYPES:
+        kind += '; charset=utf-8'
+    return kind
+
+
+def file_stat(filename):
+    """return the size and mtime of a file or None if it's not a file
+
+    Results are kept for STAT_LIFE seconds.
+    """
+    now = time.time()
+    with _stats_lock:
+        cached = _stats.pop(filename, None) or _missing.pop(filename, None)
+        if cached is not None and now - cached[0] <= STAT_LIFE:
+            remember(filename, cached)
+            return cached[1]
+
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        info = None
+    else:
+        if os.path.isfile(filename):
+            info = (stat.st_size, int(stat.st_mtime))
+        else:
+            info = None
+    with _stats_lock:
+        remember(filename, (now, info))
+    return info
+
+
+def remember(filename, cached):
+    """keep a stat result, forgetting the least recently used ones"""
+    if cached[1] is None:
+        cache, limit = _missing, MISSING_CACHE_SIZE
+    else:
+        cache, limit = _stats, STAT_CACHE_SIZE
+    cache[filename] = cached
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def parse_range(header, size):
+    """return the first and last bytes of a single byte range
+
+    Returns None if the range can't be satisfied and False if the header
+    isn't a single byte range we understand.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return False
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                return None
+            return max(0, size - length), size - 1
+        first = int(first)
+        last = last and min(int(last), size - 1) or size - 1
+    except ValueError:
+        return False
+    if first >= size or first > last:
+        return None
+    return first, last
+
+
+def not_modified(env, etag, mtime):
+    """return True if the browser's copy is current"""
+    if_none_match = env.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in tags or '*' in tags
+    if_modified_since = env.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        parsed = parsedate_tz(if_modified_since.split(';')[0])
+        if parsed:
+            return mtime <= mktime_tz(parsed)
+    return False
+
+
+def read_range(filename, first, last):
+    """generate the content of a range of a file"""
+    with open(filename, 'rb') as data:
+        data.seek(first)
+        remaining = last - first + 1
+        while remaining > 0:
+            block = data.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            yield block
+
+
+def serve(request, directory, name, max_age=MAX_AGE):
+    """serve a file from a directory
+
+    Returns a status, headers and content, where the content is either a
+    string or an iterable for larger files.
+    """
+    # pylint: disable=too-many-locals, too-many-return-statements
+    env = request.env
+    directory = os.path.abspath(directory)
+    filename = os.path.normpath(os.path.join(directory, name))
+    if not filename.startswith(directory + os.sep):
+        return '404 Not Found', [('Content-type', 'text/plain')], 'not found'
+
+    info = file_stat(filename)
+    if info is None:
+        return '404 Not Found', [('Content-type', 'text/plain')], 'not found'
+    size, mtime = info
+
+    headers = [
+        ('Content-type', content_type(filename)),
+        ('Last-Modified', formatdate(mtime, usegmt=True)),
+        ('Cache-Control', 'public, max-age=%d' % max_age),
+        ('Accept-Ranges', 'bytes'),
+    ]
+    etag = '"%x-%x"' % (mtime, size)
+
+    byte_range = False
+    if env.get('HTTP_RANGE'):
+        if_range = env.get('HTTP_IF_RANGE')
+        if not if_range or if_range == etag:
+            byte_range = parse_range(env.get('HTTP_RANGE'), size)
+            if byte_range is None:
+                headers.append(('Content-Range', 'bytes */%d' % size))
+                return '416 Requested Range Not Satisfiable', headers, ''
+
+    gzipped = filename + '.gz'
+    if not byte_range and 'gzip' in env.get('HTTP_ACCEPT_ENCODING', ''):
+        gzip_info = file_stat(gzipped)
+        if gzip_info is not None and gzip_info[1] >= mtime:
+            filename = gzipped
+            size = gzip_info[0]
+            etag = '"%x-%x-gz"' % (mtime, size)
+            headers.append(('Content-Encoding', 'gzip'))
+    if file_stat(gzipped) is not None:
+        headers.append(('Vary', 'Accept-Encoding'))
+
+    headers.append(('ETag', etag))
+
+    if not_modified(env, etag, mtime):
+        return '304 Not Modified', headers, ''
+
+    if byte_range:
+        first, last = byte_range
+        headers.append(('Content-Range', 'bytes %d-%d/%d' % (first, last, size)))
+        headers.append(('Content-Length', str(last - first + 1)))
+        if request.method == 'HEAD':
+            return '206 Partial Content', headers, ''
+        return '206 Partial Content', headers, read_range(filename, first, last)
+
+    headers.append(('Content-Length', str(size)))
+    if request.method == 'HEAD':
+        return '200 OK', headers, ''
+
+    if size <= SMALL_FILE:
+        with open(filename, 'rb') as data:
+            return '200 OK', headers, data.read()
+
+    file_wrapper = env.get('wsgi.file_wrapper')
+    if file_wrapper:
+        return '200 OK', headers, file_wrapper(open(filename, 'rb'), BLOCK_SIZE)
+    return '200 OK', headers, read_range(filename, 0, size - 1)
@@ -9,7 +9,7 @@ import sys
 import timeit
 
 import zoom.config as cfg
-from zoom.database import database as old_database
+from zoom.database import adapter as legacy_adapter
 from zoom.db import database as new_db
 from zoom.request import request
 from zoom.users import UserStore
@@ -19,6 +19,9 @@ from zoom.utils import OrderedSet
 from zoom.instance import Instance
 from zoom.exceptions import SystemException
 from zoom.site import Site
+import zoom.tracing as tracing
+import zoom.sqlstats as sqlstats
+from zoom.context import ContextProxy, local
 
 POSITIVE = ['1', 'yes', True]
 NEGATIVE = ['0', 'False', 'false', 'off', 'no', False]
@@ -59,10 +62,22 @@ class SystemTimer(object):
         self.start_time = start_time or timeit.default_timer()
         self.previous_time = self.start_time
         self.record = []
+        self.trace = None
+        self.stage = None
         self.add('modules loaded')
 
-    def add(self, comment):
-        """add a measure to the system timer log"""
+    def start_trace(self, trace):
+        """record the steps that follow as stages of a trace"""
+        self.trace = trace
+        if trace is not None:
+            self.stage = trace.open(start=self.previous_time)
+
+    def add(self, comment, stage=None):
+        """add a measure to the system timer log
+
+        When the request is being traced the step is also recorded as a
+        stage of the trace, named stage if given.
+        """
         current_time = timeit.default_timer()
         self.record.append('  {} {}: {:6.1f} ms  {:6.1f} ms'.format(
             comment,
@@ -71,6 +86,10 @@ class SystemTimer(object):
             (current_time - self.start_time) * 1000,
         ))
         self.previous_time = current_time
+        if self.trace is not None:
+            self.stage.name = stage or comment
+            self.trace.close(self.stage, current_time)
+            self.stage = self.trace.open(start=current_time)
 
     def report(self):
         """print a report of the timed events"""
@@ -142,6 +161,7 @@ class System(object):
         self.template_path = None
         self.templates = None
         self.helpers = None
+        self.helper_results = None
         self.db_debug = False
         self.themes_path = None
         self.logging = False
@@ -195,7 +215,19 @@ class System(object):
             sys.path.insert(0, '.')
 
         # system config file
-        self.config = config = cfg.Config(instance_path, server)
+        self.config = config = cfg.get_config(instance_path, server)
+
+        # trace a share of requests
+        timer.start_trace(tracing.start(
+            config,
+            timer.start_time,
+            server=server,
+            method=request.method,
+            uri=request.uri,
+        ))
+
+        # count the statements of the request
+        sqlstats.start(config, self.instance_path)
 
         # connect to the database and stores
         db_engine = config.get('database', 'engine', 'mysql')
@@ -204,14 +236,16 @@ class System(object):
         db_user = config.get('database', 'dbuser', 'testuser')
         db_pass = config.get('database', 'dbpass', 'password')
 
-        # legacy database module
-        self.database = old_database(
-            db_engine,
-            db_host,
-            db_name,
-            db_user,
-            db_pass,
+        # connection pool
+        if config.get('database', 'pool', '1') not in NEGATIVE:
+            db_pool = dict(
+                min_size=int(config.get('database', 'pool_min', 0)),
+                max_size=int(config.get('database', 'pool_max', 10)),
+                timeout=float(config.get('database', 'pool_timeout', 30)),
+                check=float(config.get('database', 'pool_check', 5)),
             )
+        else:
+            db_pool = None
 
         # database module
         db_params = dict(
@@ -219,12 +253,16 @@ class System(object):
             host=db_host,
             db=db_name,
             user=db_user,
+            pool=db_pool,
             )
         if db_pass:
             db_params['passwd'] = db_pass
         # pylint: disable=invalid-name, star-args
         self.db = new_db(**db_params)
 
+        # legacy database module, sharing the same connection
+        self.database = legacy_adapter(self.db)
+
         self.db_debug = config.get('database', 'debug', '0') not in NEGATIVE
         self.db.debug = self.db_debug
         self.database.debug = self.db_debug
@@ -326,6 +364,7 @@ class System(object):
         self.tail = OrderedSet()
 
         self.helpers = {}
+        self.helper_results = {}
 
         self.show_errors = config.get('error', 'users', '0') == '1'
 
@@ -343,6 +382,7 @@ class System(object):
 
         self.session = zoom.session.Session(self)
         self.session.load_session()
+        zoom.session.start_sweeper(self)
 
         self.is_setup = True
 
@@ -380,13 +420,6 @@ class System(object):
         self.config = cfg.Config(path, 'localhost')
 
         # connect to the database
-        self.database = old_database(
-            'mysql',
-            'database',
-            'test',
-            'testuser',
-            'password'
-        )
         self.db = new_db(
             'mysql',
             'database',
@@ -394,6 +427,7 @@ class System(object):
             'testuser',
             passwd='password'
         )
+        self.database = legacy_adapter(self.db)
 
         # create session
         self.session = zoom.session.Session(self)
@@ -430,7 +464,7 @@ class System(object):
         return 'System\n------\n' + values
 
 # pylint: disable=invalid-name
-system = System()
+system = ContextProxy(local('system', System))
 
 if __name__ == '__main__':
     system.setup('../..')
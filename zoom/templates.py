@@ -0,0 +1,95 @@
+"""
+    zoom.templates
+
+    theme template cache
+
+    Templates are read once per process and kept until the file changes.
+    Each templates directory is indexed once, so finding a template doesn't
+    list the directory, and the index is rebuilt when files are added to or
+    removed from it.  Changes are noticed within CHECK_INTERVAL seconds.
+
+    >>> import tempfile, shutil
+    >>> path = tempfile.mkdtemp()
+    >>> open(os.path.join(path, 'Default.html'), 'w').write('<dz:content>')
+    >>> find('default.html', [path]) == os.path.join(path, 'Default.html')
+    True
+    >>> read(find('default.html', [path]))
+    '<dz:content>'
+    >>> find('missing.html', [path]) is None
+    True
+    >>> read(os.path.join(path, 'missing.html')) is None
+    True
+    >>> shutil.rmtree(path)
+"""
+
+import os
+import time
+
+from zoom.static import file_stat
+
+
+CHECK_INTERVAL = 1  # seconds
+
+# pylint: disable=invalid-name
+_files = {}
+_indexes = {}
+
+
+def directory_index(path):
+    """return the names of the files in a directory
+
+    Returns a set of the names and a dict of the names by their lower case
+    equivalent.
+    """
+    now = time.time()
+    cached = _indexes.get(path)
+    if cached is None or now - cached[0] > CHECK_INTERVAL:
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if cached is None or cached[1] != mtime:
+            names = mtime is not None and set(os.listdir(path)) or set()
+            lower = {}
+            for name in sorted(names):
+                lower.setdefault(name.lower(), name)
+            cached = (now, mtime, names, lower)
+        else:
+            cached = (now,) + cached[1:]
+        _indexes[path] = cached
+    return cached[2], cached[3]
+
+
+def find(name, paths):
+    """return the pathname of the first file with a name in a list of paths
+
+    Names that match exactly are preferred to those that only match when
+    case is ignored.
+    """
+    for path in paths:
+        names, _ = directory_index(path)
+        if name in names:
+            return os.path.join(path, name)
+    name_lower = name.lower()
+    for path in paths:
+        _, names = directory_index(path)
+        if name_lower in names:
+            return os.path.join(path, names[name_lower])
+
+
+def read(pathname):
+    """return the content of a file or None if it doesn't exist"""
+    info = file_stat(pathname)
+    if info is None:
+        _files.pop(pathname, None)
+        return None
+    cached = _files.get(pathname)
+    if cached is None or cached[0] != info:
+        with open(pathname, 'rb') as data:
+            cached = _files[pathname] = (info, data.read())
+    return cached[1]
+
+
+def stats():
+    """return the number of files and directories cached"""
+    return dict(files=len(_files), directories=len(_indexes))
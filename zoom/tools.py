@@ -18,27 +18,33 @@
 """General purpose tools"""
 
 import os
+import stat
 import datetime
+import hashlib
+import threading
+from collections import OrderedDict
 from markdown import Markdown
 from system import system
 from request import request, route
 from response import HTMLResponse, RedirectResponse
 from utils import id_for
 from html import ul, div
+import templates
+from loader import load_hook
 
-# Handy date values
-today     = datetime.date.today()
+MARKDOWN_CACHE_SIZE = 1000
+
+_markdown_cache = OrderedDict()
+_markdown_lock = threading.Lock()
+_markdown_local = threading.local()
+_content_cache = {}
+
+# Handy durations (dates are worked out when they're needed since modules
+# stay loaded from one request to the next)
 one_day   = datetime.timedelta(1)
 one_week  = one_day * 7
 one_hour  = datetime.timedelta(hours=1)
 one_minute= datetime.timedelta(minutes=1)
-yesterday = today - one_day
-tomorrow  = today + one_day
-now       = datetime.datetime.now()
-first_day_of_the_month = datetime.date(today.year,today.month,1)
-last_day_of_last_month = first_day_of_the_month - one_day
-first_day_of_last_month = datetime.date(last_day_of_last_month.year,last_day_of_last_month.month,1)
-last_month = (first_day_of_last_month,last_day_of_last_month)
 #me        = zoomer.user_id
 # one_year, one_hour, one_month, ago, ahead
 
@@ -155,6 +161,15 @@ def home(view=None):
         return redirect_to('/'+route[0]+'/' + view)
     return redirect_to('/'+route[0])
 
+def cacheable(helper):
+    """Mark a helper whose result doesn't change during a request.
+
+    Pages call a cacheable helper once for each set of arguments it is
+    given and reuse the result for the rest of the request.
+    """
+    helper.cacheable = True
+    return helper
+
 def load(filename):
     """
         Load a file from the application directory into memory.
@@ -176,29 +191,15 @@ def load_template(name, default=None):
     will assume that's what is desired unless otherwise specified.
     """
 
-    def find_template(name):
-        for path in system.templates_paths:
-            if os.path.exists(path) and (name in os.listdir(path)):
-                return os.path.join(path, name)
-        name_lower = name.lower()
-        for path in system.templates_paths:
-            if os.path.exists(path):
-                for filename in os.listdir(path):
-                    if filename.lower() == name_lower:
-                        return os.path.join(path, filename)
-
     def load_template_file(name, default):
 
-        pathname = find_template(name)
+        pathname = templates.find(name, system.templates_paths)
         if pathname:
-            if os.path.exists(pathname):
-
-                f = open(pathname,'r')
-                t = f.read()
-                f.close()
+            t = templates.read(pathname)
+            if t is not None:
 
                 if system.theme_comments == 'path':
-                    source = filename
+                    source = pathname
                 elif system.theme_comments == 'name':
                     source = name[:-5]
                 else:
@@ -217,54 +218,95 @@ def load_template(name, default=None):
     if '/' in name or '\\' in name:
         raise Exception('Unable to use specified template path.  Templates are located in theme folders.')
 
-    return system.templates.setdefault(name, load_template_file(name, default))
+    if name not in system.templates:
+        system.templates[name] = load_template_file(name, default)
+    return system.templates[name]
 
 
 def load_content(name):
-    """Load content and apply markdown transformation."""
-    import codecs
-    if os.path.isfile(name):
-        text = codecs.open('%s'%name, mode="r", encoding="utf8").read()
-        return markdown(text)
-    elif os.path.isfile(name+'.html'):
-        text = codecs.open('%s.html'%name, mode="r", encoding="utf8").read()
-        return text
-    elif os.path.isfile(name+'.md'):
-        text = codecs.open('%s.md'%name, mode="r", encoding="utf8").read()
-        return markdown(text)
-    elif os.path.isfile(name+'.txt'):
-        text = codecs.open('%s.txt'%name, mode="r", encoding="utf8").read()
-        return markdown(text)
+    """Load content and apply markdown transformation.
 
-def get_menu(name='main'):
-    filename = os.path.join(system.config.site_path, 'menus.py')
+    Relative names are found in the directory of the running app.  What
+    was loaded is kept until the file changes.
+    """
+    import codecs
+    path = getattr(system.app, 'dir', '')
+    if path and not os.path.isabs(name):
+        name = os.path.join(path, name)
+    for pathname, convert in [
+            (name, True),
+            (name + '.html', False),
+            (name + '.md', True),
+            (name + '.txt', True),
+    ]:
+        try:
+            info = os.stat(pathname)
+        except (OSError, TypeError, ValueError):
+            continue
+        if not stat.S_ISREG(info.st_mode):
+            continue
+        version = (info.st_size, info.st_mtime)
+        cached = _content_cache.get(pathname)
+        if cached is None or cached[0] != version:
+            text = codecs.open(pathname, mode="r", encoding="utf8").read()
+            if convert:
+                text = markdown(text)
+            cached = _content_cache[pathname] = (version, text)
+        return cached[1]
+
+def site_module(name):
+    """Return a module from the site directory (e.g. menus or settings).
+
+    Modules are loaded once per process and only loaded again when their
+    source files change.
+    """
+    filename = os.path.join(system.config.site_path, name + '.py')
     if os.path.exists(filename):
-        import imp
-        src = imp.load_source('menus',filename)
-        if hasattr(src,name):
-            menu = getattr(src,name)
-            if menu:
-                return menu
-    else:
+        return load_hook(name, filename)
+
+def menus_module():
+    """Return the site's menus module or the default one."""
+    src = site_module('menus')
+    if src is None:
         filename = os.path.join(system.lib_path, '../../sites/localhost/menus.py')
         if os.path.exists(filename):
-            import imp
-            src = imp.load_source('menus',filename)
-            if hasattr(src,name):
-                menu = getattr(src,name)
-                if menu:
-                    return menu
+            src = load_hook('menus', filename)
+    return src
+
+def get_menu(name='main'):
+    src = menus_module()
+    if src is not None and hasattr(src,name):
+        menu = getattr(src,name)
+        if menu:
+            return menu
     return []
 
+def get_visible_menu(name, groups):
+    """Return the items of a menu that members of groups can see.
+
+    Items are returned as (name, title, url, groups) tuples.  The visible
+    items are worked out once for each menu and set of groups and kept
+    with the menus module.
+    """
+    src = menus_module()
+    cache = src is not None and src.__dict__.setdefault('_visible', {}) or {}
+    key = (name, tuple(sorted(set(groups))))
+    if key not in cache:
+        def assign_defaults(name,title,url,group=[]):
+            return (name,title,url,group)
+        items = [assign_defaults(*item) for item in get_menu(name)]
+        cache[key] = [
+            item for item in items
+            if item[3]==[] or [g for g in item[3] if g in groups]
+        ]
+    return cache[key]
+
 def get_setting(name):
-    filename = os.path.join(system.config.site_path,'settings.py')
-    if os.path.exists(filename):
-        import imp
-        src = imp.load_source('settings',filename)
-        if hasattr(src,name):
-            item = getattr(src,name)
-            if item != None:
-                return item
+    src = site_module('settings')
+    if src is not None and hasattr(src,name):
+        item = getattr(src,name)
+        if item != None:
+            return item
 
 def how_long(t1,t2):
     """
@@ -393,26 +435,54 @@ def unisafe(val):
 def websafe(val):
     return htmlquote(unisafe(val))
 
+def _make_page_name(text):
+    result = []
+    for c in text.lower():
+        if c in 'abcdefghijklmnopqrstuvwxyz01234567890.-/':
+            result.append(c)
+        elif c == ' ':
+            result.append('-')
+    text = ''.join(result)
+    if text.endswith('.html'):
+        text = text[:-5]
+    return text
+
+def _url_builder(label,base,end):
+    return _make_page_name(label) + '.html'
+
+def markdown_converter():
+    """Return the markdown converter for the current thread.
+
+    Converters are configured once and reset between documents.
+    """
+    md = getattr(_markdown_local, 'converter', None)
+    if md is None:
+        extras = ['tables','def_list','wikilinks','toc']
+        configs = {'wikilinks':[('build_url',_url_builder)]}
+        md = _markdown_local.converter = Markdown(extensions=extras,extension_configs=configs)
+    return md
+
 def markdown(content):
-    def make_page_name(text):
-        result = []
-        for c in text.lower():
-            if c in 'abcdefghijklmnopqrstuvwxyz01234567890.-/':
-                result.append(c)
-            elif c == ' ':
-                result.append('-')
-        text = ''.join(result)
-        if text.endswith('.html'):
-            text = text[:-5]
-        return text
-
-    def url_builder(label,base,end):
-        return make_page_name(label) + '.html'
-
-    extras = ['tables','def_list','wikilinks','toc']
-    configs = {'wikilinks':[('build_url',url_builder)]}
-    md = Markdown(extensions=extras,extension_configs=configs)
-    return md.convert(unisafe(content))
+    """Convert markdown to HTML.
+
+    The HTML for the most recently converted MARKDOWN_CACHE_SIZE documents
+    is kept and returned again when the same text is converted.
+    """
+    text = unisafe(content)
+    key = hashlib.sha1(text.encode('utf8')).digest()
+    with _markdown_lock:
+        result = _markdown_cache.pop(key, None)
+        if result is not None:
+            _markdown_cache[key] = result
+            return result
+    md = markdown_converter()
+    md.reset()
+    result = md.convert(text)
+    with _markdown_lock:
+        _markdown_cache[key] = result
+        while len(_markdown_cache) > MARKDOWN_CACHE_SIZE:
+            _markdown_cache.popitem(last=False)
+    return result
 
 
 if __name__=='__main__':
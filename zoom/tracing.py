@@ -0,0 +1,295 @@
+"""
+    zoom.tracing
+
+    request tracing
+
+    A share of requests, set by the [tracing] rate in site.ini, is traced.
+    The stages of a traced request (system setup, user setup, manager
+    setup, dispatch, the app and the response) are timed by the system
+    timer and the work done within them (rendering, SQL statements and
+    template fills) is recorded as spans nested inside the stage or span
+    that was open at the time.  Spans carry attributes describing what
+    they did.
+
+    When the request is done its trace is written to the [tracing] path
+    as JSON lines (one span per line, the default) or in the Chrome trace
+    format (one file per trace, for chrome://tracing or Perfetto).
+
+    Requests that aren't traced pay for one context lookup per span.
+
+    >>> trace = Trace(path='/')
+    >>> with trace.span('render', theme='default'):
+    ...     done = trace.record('sql', trace.start_time, statement='select 1')
+    >>> [(s.name, s.parent) for s in trace.spans]
+    [('render', None), ('sql', 1)]
+    >>> trace.spans[1].attributes
+    {'statement': 'select 1'}
+    >>> events = chrome_events(trace)
+    >>> [(e['name'], e['ph']) for e in events]
+    [('render', 'X'), ('sql', 'X')]
+    >>> span('unused') is NULL_SPAN
+    True
+"""
+
+import os
+import json
+import random
+import threading
+from timeit import default_timer as timer
+
+from zoom.context import bind, current
+
+
+DEFAULT_RATE = 0.0
+DEFAULT_FORMAT = 'jsonl'
+MAX_SPANS = 10000
+MAX_STATEMENT = 200
+
+# pylint: disable=invalid-name
+_write_lock = threading.Lock()
+
+
+class Span(object):
+    """a timed piece of work"""
+    # pylint: disable=too-many-arguments, too-few-public-methods
+
+    __slots__ = ['trace', 'id', 'parent', 'name', 'start', 'end', 'attributes']
+
+    def __init__(self, trace, span_id, parent, name, start, attributes):
+        self.trace = trace
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.start = start
+        self.end = None
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        """add attributes to the span"""
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.trace.stack.append(self)
+        self.start = timer()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.end = timer()
+        if exc_info[0] is not None:
+            self.attributes['error'] = exc_info[0].__name__
+        stack = self.trace.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        return False
+
+    @property
+    def duration(self):
+        """seconds the span took"""
+        return (self.end or timer()) - self.start
+
+    def as_dict(self):
+        """return the span as a dict"""
+        return dict(
+            trace=self.trace.id,
+            id=self.id,
+            parent=self.parent,
+            name=self.name,
+            start=round((self.start - self.trace.start_time) * 1000, 3),
+            duration=round(self.duration * 1000, 3),
+            attributes=self.attributes,
+        )
+
+
+class NullSpan(object):
+    """the span used when a request isn't being traced"""
+
+    def set(self, **attributes):
+        """ignore the attributes"""
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Trace(object):
+    """the spans of a request"""
+
+    def __init__(self, start_time=None, **attributes):
+        self.id = '%016x' % random.getrandbits(64)
+        self.start_time = start_time or timer()
+        self.attributes = attributes
+        self.spans = []
+        self.stack = []
+
+    def _new(self, name, start, attributes):
+        if len(self.spans) >= MAX_SPANS:
+            return NULL_SPAN
+        parent = self.stack and self.stack[-1].id or None
+        new_span = Span(self, len(self.spans) + 1, parent, name, start, attributes)
+        self.spans.append(new_span)
+        return new_span
+
+    def span(self, name, **attributes):
+        """return a span to time a block with"""
+        return self._new(name, None, attributes)
+
+    def record(self, name, start, end=None, **attributes):
+        """record a span of work that has been done"""
+        done = self._new(name, start, attributes)
+        if done is not NULL_SPAN:
+            done.end = end or timer()
+        return done
+
+    def open(self, name='', start=None):
+        """open a span that stays open until it is closed"""
+        opened = self._new(name, start or timer(), {})
+        if opened is not NULL_SPAN:
+            self.stack.append(opened)
+        return opened
+
+    def close(self, opened, end=None):
+        """close a span opened with open"""
+        if opened is not NULL_SPAN:
+            opened.end = end or timer()
+            if opened in self.stack:
+                del self.stack[self.stack.index(opened):]
+
+    def finish(self, **attributes):
+        """close the spans still open and note the request attributes"""
+        self.attributes.update(attributes)
+        end = timer()
+        for opened in reversed(self.stack):
+            opened.name = opened.name or 'finished'
+            opened.end = end
+        del self.stack[:]
+
+
+def start(config, start_time=None, **attributes):
+    """start tracing the current request if it's sampled
+
+    Returns the trace or None.
+    """
+    try:
+        rate = float(config.get('tracing', 'rate', DEFAULT_RATE))
+    except ValueError:
+        rate = 0
+    trace = None
+    if rate > 0 and random.random() < rate:
+        trace = Trace(start_time, **attributes)
+    bind(trace=trace)
+    return trace
+
+
+def active():
+    """return the trace of the current request or None"""
+    return current('trace')
+
+
+def span(name, **attributes):
+    """return a span to time a block with
+
+        with tracing.span('search', terms=terms):
+            ...
+    """
+    trace = current('trace')
+    if trace is None:
+        return NULL_SPAN
+    return trace.span(name, **attributes)
+
+
+def record(name, start_time, **attributes):
+    """record a span of work that started at start_time and just ended"""
+    trace = current('trace')
+    if trace is not None:
+        trace.record(name, start_time, **attributes)
+
+
+def statement(sql):
+    """return a SQL statement shortened for a span attribute"""
+    sql = ' '.join(str(sql).split())
+    return len(sql) > MAX_STATEMENT and sql[:MAX_STATEMENT] + '...' or sql
+
+
+def traced(name):
+    """decorate a function so it's timed as a span"""
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            trace = current('trace')
+            if trace is None:
+                return function(*args, **kwargs)
+            with trace.span(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__doc__ = function.__doc__
+        return wrapper
+    return decorator
+
+
+def json_lines(trace):
+    """return the spans of a trace as JSON lines"""
+    lines = []
+    for each in trace.spans:
+        values = each.as_dict()
+        if each.parent is None:
+            values['request'] = trace.attributes
+        lines.append(json.dumps(values, default=str))
+    return '\n'.join(lines) + '\n'
+
+
+def chrome_events(trace):
+    """return the spans of a trace as Chrome trace events"""
+    pid = os.getpid()
+    tid = threading.current_thread().ident or 0
+    return [
+        dict(
+            name=each.name,
+            cat=each.parent is None and 'stage' or 'span',
+            ph='X',
+            ts=int(each.start * 1000000),
+            dur=int(each.duration * 1000000),
+            pid=pid,
+            tid=tid,
+            args=each.attributes,
+        )
+        for each in trace.spans
+    ]
+
+
+def chrome_trace(trace):
+    """return a trace in the Chrome trace format"""
+    return json.dumps(
+        dict(traceEvents=chrome_events(trace), otherData=trace.attributes),
+        default=str,
+    )
+
+
+def finish(config, path, **attributes):
+    """finish the trace of the current request and write it out"""
+    trace = current('trace')
+    if trace is None:
+        return
+    bind(trace=None)
+    trace.finish(**attributes)
+
+    path = config.get('tracing', 'path', path)
+    kind = config.get('tracing', 'format', DEFAULT_FORMAT)
+    try:
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        if kind == 'chrome':
+            filename = os.path.join(path, 'trace-%s.json' % trace.id)
+            with open(filename, 'w') as output:
+                output.write(chrome_trace(trace))
+        else:
+            with _write_lock:
+                with open(os.path.join(path, 'traces.jsonl'), 'a') as output:
+                    output.write(json_lines(trace))
+    except (IOError, OSError):
+        # a trace that can't be written isn't worth failing the request
+        pass
@@ -22,6 +22,8 @@ from system import system
 from auth import validate_password, hash_password
 
 from .exceptions import UnauthorizedException
+from . import memberships
+from .context import ContextProxy, local
 
 TWO_WEEKS = 14 * 24 * 60 * 60 # in seconds
 
@@ -78,7 +80,7 @@ def add_user(username, group_name):
     userid = get_userid(username)
     groupid = get_groupid(group_name)
     if userid and groupid:
-        system.database('insert into dz_members (userid, groupid) values (%s,%s)', userid, groupid)
+        memberships.add_member(system.database, userid, groupid)
 
 def create_user(**values):
     """
@@ -94,7 +96,7 @@ def create_user(**values):
     values['STATUS'] = 'A'
     users = system.database.table('dz_users','USERID')
     id = users.insert(values)
-    system.database('delete from dz_members where userid=%s',id) # make sure new users have no memberships
+    memberships.remove_memberships(system.database, id) # make sure new users have no memberships
     add_user(values['LOGINID'], 'users')
     return id
 
@@ -118,7 +120,7 @@ def update_user(user_id, **values):
     return id
 
 def delete_user(user_id):
-    system.database('delete from dz_members where userid=%s', user_id)
+    memberships.remove_memberships(system.database, user_id)
     system.database('delete from dz_users where userid=%s', user_id)
 
 def using_old_passwords():
@@ -164,6 +166,7 @@ class User(object):
 
     def login(self, login_id, password, remember_me=False):
         if authenticate(login_id, password):
+            system.session.renew_session()
             system.session.login_id = login_id
             if remember_me:
                 system.session.lifetime = TWO_WEEKS
@@ -232,7 +235,7 @@ class User(object):
 
         if len(dataset):
             rec = dataset[0]
-            self.login_id   = get_username(rec.USERID)  # supplied login_id can be case insensitive
+            self.login_id   = rec.LOGINID  # supplied login_id can be case insensitive
             self.username   = self.login_id
 
             self.first_name = rec.firstname
@@ -270,29 +273,7 @@ class User(object):
         self.get_settings()
 
     def get_groups(self,user_id=None):
-        def get_memberships(group,memberships,depth=0):
-            result = [group]
-            if depth < 100:
-                for g,s in memberships:
-                    if group == s and g not in result:
-                        result += get_memberships(g,memberships,depth+1)
-            return result
-
-        my_groups   = [rec[0] for rec in system.database('SELECT groupid FROM dz_members WHERE userid=%s',user_id or self.user_id)]
-        sub_groups  = [(rec.GROUPID,rec.SUBGROUPID) for rec in system.database('SELECT subgroupid,groupid FROM dz_subgroups ORDER BY subgroupid')]
-        memberships = []
-        for group in my_groups:
-            memberships += get_memberships(group,sub_groups)
-        groups = my_groups + memberships
-
-        named_groups = []
-        for rec in system.database('SELECT groupid, name FROM dz_groups'):
-            groupid = rec[0]
-            name    = rec[1].strip()
-            if groupid in groups:
-                named_groups += [name]
-
-        return named_groups
+        return memberships.user_groups(system.database, user_id or self.user_id)
 
     def get_settings(self):
         """load and set the user/context settings"""
@@ -317,4 +298,4 @@ class User(object):
             raise UnauthorizedException('Unauthorized')
 
 
-user = User()
+user = ContextProxy(local('user', User))
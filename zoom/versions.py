@@ -0,0 +1,38 @@
+"""
+    zoom.versions
+
+    versions of shared data
+
+    Processes keep copies of data that rarely changes, like the group graph
+    and the settings.  The dz_versions table holds a version number for
+    each of them; whatever changes the data bumps its version and processes
+    reload their copy when they see the version has changed.
+
+    Databases without a dz_versions table still work, the version just
+    can't be known.
+"""
+
+
+def read(db, name):
+    """return the version of something or None if it can't be read"""
+    try:
+        rows = db('select version from dz_versions where name=%s', name)
+    except Exception:  # pylint: disable=broad-except
+        # the dz_versions table hasn't been added to this database
+        return None
+    for row in rows:
+        return row[0]
+    return 0
+
+
+def bump(db, name):
+    """note that something has changed"""
+    try:
+        db(
+            'insert into dz_versions (name, version) values (%s, 1) '
+            'on duplicate key update version=version+1',
+            name
+        )
+    except Exception:  # pylint: disable=broad-except
+        # the dz_versions table hasn't been added to this database
+        pass
@@ -1,18 +1,196 @@
 """
     Visits
+
+    Visits are collected in memory, one record per session with the times
+    it started and last ended, and written to the dz_visits table every
+    [system] visits_interval seconds (60) by a VisitTracker thread.
+    Recording a visit makes no database queries.
+
+    Subjects come from a browser cookie so only those that fit the subject
+    column are kept.
+
+    >>> valid_subject('0123456789abcdef0123456789abcdef')
+    '0123456789abcdef0123456789abcdef'
+    >>> valid_subject('x' * 33) is None
+    True
+    >>> valid_subject("'; drop table dz_visits") is None
+    True
 """
 
-import store
+import os
+import re
+import atexit
+import logging
 import datetime
+import threading
 
+import store
+
+# the entity used before visits had a table of their own
 class Visit(store.Entity): pass
 
+
+UPSERT_VISITS = (
+    'insert into dz_visits (session, subject, started, ended) values '
+    '{} '
+    'on duplicate key update '
+    'started=least(started, values(started)), '
+    'ended=greatest(ended, values(ended))'
+)
+ROW = '(%s,%s,%s,%s)'
+SUBJECT = re.compile(r'^\w{1,32}$')
+
+
+def valid_subject(subject):
+    """return the subject if it can be stored, otherwise None"""
+    if isinstance(subject, basestring) and SUBJECT.match(subject):
+        return subject
+    return None
+
+
+class VisitTracker(threading.Thread):
+    """collects visits and writes them periodically
+
+    The db is a database connection used only by the tracker.  Each batch
+    is committed, since the connection isn't set to autocommit like those
+    of requests are, and the connection is closed after each write.
+    """
+
+    def __init__(self, db, interval=60, batch=500):
+        threading.Thread.__init__(self, name='visit-tracker')
+        self.daemon = True
+        self.db = db
+        self.interval = interval
+        self.batch = batch
+        self.visits = {}
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.stopping = threading.Event()
+        self.written = 0
+        self.errors = 0
+
+    def visited(self, subject, sid, now=None):
+        """record a visit"""
+        now = now or datetime.datetime.now()
+        subject = valid_subject(subject)
+        with self.lock:
+            visit = self.visits.get(sid)
+            if visit:
+                visit[3] = now
+            else:
+                self.visits[sid] = [sid, subject, now, now]
+
+    def flush(self):
+        """write the visits collected since the last write
+
+        Batches that can't be written are put back to be written next time.
+        """
+        with self.lock:
+            visits, self.visits = self.visits.values(), {}
+        try:
+            for start in range(0, len(visits), self.batch):
+                rows = visits[start:start + self.batch]
+                try:
+                    self.write(rows)
+                except Exception:  # pylint: disable=broad-except
+                    self.errors += 1
+                    logging.getLogger(__name__).exception('unable to write visits')
+                    self.restore(rows)
+                else:
+                    self.written += len(rows)
+        finally:
+            self.db.close()
+
+    def write(self, rows):
+        """write a batch of visits"""
+        values = []
+        for row in rows:
+            values.extend(row)
+        try:
+            self.db(UPSERT_VISITS.format(','.join([ROW] * len(rows))), *values)
+            self.db.commit()
+        except Exception:
+            try:
+                self.db.rollback()
+            except Exception:  # pylint: disable=broad-except
+                pass
+            raise
+
+    def restore(self, rows):
+        """put back visits that couldn't be written"""
+        with self.lock:
+            for row in rows:
+                visit = self.visits.get(row[0])
+                if visit:
+                    visit[2] = row[2]
+                else:
+                    self.visits[row[0]] = row
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.stopping.wait(self.interval)
+            self.flush()
+
+    def stop(self):
+        """stop the tracker, writing the visits it has collected"""
+        self.stopping.set()
+        if self.is_alive():
+            self.join(self.interval)
+        self.flush()
+
+    def stats(self):
+        """return the tracker counters"""
+        return dict(
+            pending=len(self.visits),
+            written=self.written,
+            errors=self.errors,
+        )
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(system):
+    """return the visit tracker for the site, starting it if need be
+
+    Each site gets its own tracker in each process.
+    """
+    config = system.config
+    key = (config.instance_path, config.server_name)
+    tracker = _trackers.get(key)
+    if tracker is not None and tracker.pid == os.getpid():
+        return tracker
+    with _trackers_lock:
+        tracker = _trackers.get(key)
+        if tracker is None or tracker.pid != os.getpid():
+            tracker = VisitTracker(
+                system.db.use(config.get('database', 'dbname', 'zoomdev')),
+                float(config.get('system', 'visits_interval', 60)),
+            )
+            tracker.start()
+            _trackers[key] = tracker
+    return tracker
+
+
+def tracker_stats():
+    """return the counters of this process's visit trackers, by site"""
+    return dict(
+        (server_name, tracker.stats())
+        for (_, server_name), tracker in _trackers.items()
+        if tracker.pid == os.getpid()
+    )
+
+
+@atexit.register
+def stop_trackers():
+    """write the visits collected by this process's trackers"""
+    for tracker in _trackers.values():
+        if tracker.pid == os.getpid():
+            tracker.stop()
+
+
 def visited(subject, sid):
-    visits = store.store(Visit)
-    now = datetime.datetime.now()
-    visit = visits.first(session=sid)
-    if visit:
-        visit.ended = now
-        visits.put(visit)
-    else:
-        visits.put(Visit(session=sid, subject=subject, started=now, ended=now))
+    """record a visit to the current site"""
+    from zoom.system import system
+    get_tracker(system).visited(subject, sid)